@@ -5,14 +5,35 @@ Flask web application for mood-based music discovery
 """
 
 import os
+import re
+import atexit
 import json
-import random
+import time
+import sqlite3
+import contextvars
 import requests
-from typing import Dict, List, Optional
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
+from storage import create_preference_store
+from cache import TTLCache
+from interpretation_cache import InterpretationCache, normalize_description
+import mood_rules
+from metrics import ProviderStats, StageMetrics, render_prometheus, server_timing, timed
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED
+from llm_providers import GeminiProvider, HuggingFaceProvider, HUGGINGFACE_MODEL_URL
+from ranking import Ranker
+from preference_model import PreferenceModel
+from user_shards import UserShard, ShardManager, DEFAULT_USER, valid_user_id, user_directory
+from sessions import SearchSession
+from singleflight import SingleFlight
+from quota import QuotaScheduler, QuotaExceededError, SEARCH_COST, VIDEOS_LIST_COST
+from enrichment import VideoEnricher, VideoFilters, VIDEOS_LIST_PARTS, chunks
+from video_store import VideoStore, video_card
 
 # Load environment variables
 load_dotenv()
@@ -20,6 +41,21 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Overridable so the app can run against benchmarks/standin_server.py instead of Google
+YOUTUBE_API_BASE = os.getenv('YOUTUBE_API_BASE', 'https://www.googleapis.com/youtube/v3').rstrip('/')
+YOUTUBE_SEARCH_URL = f"{YOUTUBE_API_BASE}/search"
+YOUTUBE_VIDEOS_URL = f"{YOUTUBE_API_BASE}/videos"
+LLM_TIMEOUT = 30
+BATCH_MAX_DESCRIPTIONS = 500
+
+def create_http_session(pool_size: int = 32) -> requests.Session:
+    """Keep-alive connection pool shared by all YouTube and Hugging Face calls"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 class MoodMusicApp:
     def __init__(self):
         self.api_key = os.getenv('YOUTUBE_API_KEY')
@@ -27,79 +63,167 @@ class MoodMusicApp:
         self.huggingface_key = os.getenv('HUGGINGFACE_API_KEY')
         self.gemini_key = os.getenv('GEMINI_API_KEY')
         self.llm_provider = os.getenv('LLM_PROVIDER', 'huggingface').lower()  # huggingface, gemini, or none
+        # fallback: try providers one after another; race: hedge the next provider after LLM_HEDGE_DELAY seconds
+        self.llm_mode = os.getenv('LLM_MODE', 'fallback').lower()
+        self.llm_hedge_delay = float(os.getenv('LLM_HEDGE_DELAY', '1.5'))
+        self.llm_race_deadline = float(os.getenv('LLM_RACE_DEADLINE', str(LLM_TIMEOUT)))
+        self._llm_pool = ThreadPoolExecutor(max_workers=int(os.getenv('LLM_POOL_SIZE', '16')), thread_name_prefix='llm')
+        self.provider_stats = ProviderStats()
+        # Per-stage latency histograms for /metrics, optionally echoed in a Server-Timing header
+        self.metrics = StageMetrics()
+        self.server_timing = os.getenv('SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+        # interpret_many packs descriptions into prompts of about this many tokens
+        self.llm_batch_token_budget = int(os.getenv('LLM_BATCH_TOKEN_BUDGET', '1500'))
+        self.llm_batch_max_items = int(os.getenv('LLM_BATCH_MAX_ITEMS', '30'))
+        # Per-provider circuit breakers; each also supplies a p95-based request timeout
+        failure_threshold = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+        reset_timeout = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+        self.breakers = {
+            'gemini': CircuitBreaker('gemini', failure_threshold, reset_timeout, max_timeout=LLM_TIMEOUT),
+            'huggingface': CircuitBreaker('huggingface', failure_threshold, reset_timeout, max_timeout=LLM_TIMEOUT),
+            'youtube': CircuitBreaker('youtube', failure_threshold, reset_timeout, min_timeout=0.5, max_timeout=10.0)
+        }
+        # Runs calls that have no timeout of their own (Gemini) so they can be abandoned
+        self._timeout_pool = ThreadPoolExecutor(max_workers=int(os.getenv('LLM_POOL_SIZE', '16')), thread_name_prefix='llm-timeout')
         self.preferences_file = 'user_preferences.json'
-        self.preferences = self.load_preferences()
+        # Decayed per-mood counts per query/channel/title token, updated on each feedback
+        self.preference_model = PreferenceModel(half_life_days=float(os.getenv('FEEDBACK_HALF_LIFE_DAYS', '30')))
+        # Re-scores YouTube candidates from the mood's channel / title-token counts (needs numpy)
+        self.ranker = Ranker(self.preference_model)
+        # Optional cross-mood dislike filter: a video a user disliked under any mood is hidden for all their moods
+        self.dislike_filter_capacity = int(os.getenv('GLOBAL_DISLIKE_CAPACITY', '10000'))
+        self.global_dislike_filter = os.getenv('GLOBAL_DISLIKE_FILTER', 'false').lower() in ('1', 'true', 'yes')
+        # Per-user preference shards (files under USER_DATA_DIR), loaded on first use; the least
+        # recently used are saved and dropped beyond USER_SHARDS_HOT
+        self.user_data_dir = os.getenv('USER_DATA_DIR', 'user_data')
+        self.users = ShardManager(self._open_user, max_hot=int(os.getenv('USER_SHARDS_HOT', '128')))
+        # How often a checked-out shard looks for feedback saved by other worker processes
+        self.preferences_refresh_interval = float(os.getenv('PREFERENCES_REFRESH_INTERVAL', '1'))
+        self.users.get(DEFAULT_USER)
+        self.http = create_http_session(int(os.getenv('HTTP_POOL_SIZE', '32')))
+        # Provider clients are configured once and shared by all request threads
+        self.gemini = GeminiProvider(self.gemini_key, api_base=os.getenv('GEMINI_API_BASE'))
+        self.huggingface = HuggingFaceProvider(self.huggingface_key, session=self.http,
+                                               url=os.getenv('HUGGINGFACE_MODEL_URL', HUGGINGFACE_MODEL_URL))
+        # Raw search.list pages keyed on (composed query, maxResults, category, page token); shared across moods.
+        # Expired pages are kept so they can still be served when the quota runs low
+        self.youtube_cache = TTLCache(
+            maxsize=int(os.getenv('YOUTUBE_CACHE_SIZE', '512')),
+            ttl=float(os.getenv('YOUTUBE_CACHE_TTL', '900')),
+            keep_stale=True
+        )
+        # Daily YouTube unit budget shared by interactive searches and background prefetching,
+        # and by every worker process through the quota file
+        self.quota = QuotaScheduler(
+            daily_units=int(os.getenv('YOUTUBE_DAILY_QUOTA', '10000')),
+            background_reserve=float(os.getenv('YOUTUBE_BACKGROUND_RESERVE', '0.25')),
+            degrade_below=float(os.getenv('YOUTUBE_DEGRADE_BELOW', '0.05')),
+            path=os.getenv('YOUTUBE_QUOTA_FILE', 'youtube_quota.db') or None
+        )
+        # Video cards and details keyed by video ID, shared with the CLI (offline fallback per query)
+        self.video_store = VideoStore(os.getenv('VIDEO_STORE_FILE', 'videos.db'))
+        # Duration and statistics per video ID from batched videos.list calls, and the default result filters
+        self.enrichment = os.getenv('VIDEO_ENRICHMENT', 'true').lower() in ('1', 'true', 'yes')
+        self.enricher = VideoEnricher(
+            maxsize=int(os.getenv('VIDEO_DETAILS_CACHE_SIZE', '5000')),
+            ttl=float(os.getenv('VIDEO_DETAILS_TTL', '86400')),
+            store=self.video_store
+        )
+        self.video_filters = VideoFilters(
+            min_duration=int(os.getenv('VIDEO_MIN_DURATION', '0')),
+            max_duration=int(os.getenv('VIDEO_MAX_DURATION', '0')),
+            min_views=int(os.getenv('VIDEO_MIN_VIEWS', '0'))
+        )
+        # Per-session leftover candidates and prefetched next pages for /api/more
+        self.sessions = TTLCache(
+            maxsize=int(os.getenv('SEARCH_SESSIONS', '1000')),
+            ttl=float(os.getenv('SEARCH_SESSION_TTL', '1800'))
+        )
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='prefetch')
+        # Identical concurrent interpretations / YouTube searches share one in-flight call
+        self.singleflight = {'interpretations': SingleFlight(), 'youtube': SingleFlight()}
+        # LLM interpretations keyed on the normalized description, with near-duplicate lookup
+        self.interpretation_cache = InterpretationCache(
+            path=os.getenv('INTERPRETATION_CACHE_FILE', 'interpretation_cache.json'),
+            similarity=os.getenv('INTERPRETATION_SIMILARITY', 'true').lower() in ('1', 'true', 'yes'),
+            threshold=float(os.getenv('INTERPRETATION_SIMILARITY_THRESHOLD', '0.75')),
+            save_interval=float(os.getenv('INTERPRETATION_CACHE_SAVE_INTERVAL', '5'))
+        )
         
-    def load_preferences(self) -> Dict:
-        """Load user preferences from file"""
-        if os.path.exists(self.preferences_file):
-            try:
-                with open(self.preferences_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {
-            'mood_history': [],
-            'feedback_history': [],
-            'refined_keywords': {}
-        }
+    def _open_user(self, user_id: str) -> UserShard:
+        """Load a user's shard; the default user keeps the original single-user files"""
+        if user_id == DEFAULT_USER:
+            store = create_preference_store(self.preferences_file)  # json, sqlite or journal (PREFERENCES_BACKEND)
+            index_path = os.getenv('PREFERENCE_INDEX_FILE', 'preference_index.json')
+        else:
+            directory = user_directory(self.user_data_dir, user_id)
+            os.makedirs(directory, exist_ok=True)
+            store = create_preference_store(os.path.join(directory, 'preferences.json'), use_env_paths=False)
+            index_path = os.path.join(directory, 'preference_index.json')
+        return UserShard(user_id, store, index_path, self.preference_model,
+                         self.dislike_filter_capacity if self.global_dislike_filter else None,
+                         self.preferences_refresh_interval, self.metrics)
     
-    def save_preferences(self):
-        """Save user preferences to file"""
-        with open(self.preferences_file, 'w') as f:
-            json.dump(self.preferences, f, indent=2)
+    @property
+    def default_user(self) -> UserShard:
+        """Shard for requests without a user ID (pinned, never evicted)"""
+        return self.users.get(DEFAULT_USER)
     
-    def refine_keywords(self, mood_description: str, feedback: str, query: str, video_id: str = None, video_title: str = None):
-        """Refine keywords based on user feedback"""
-        mood_normalized = mood_description.lower().strip()
-        
-        if mood_normalized not in self.preferences['refined_keywords']:
-            self.preferences['refined_keywords'][mood_normalized] = {
-                'liked_keywords': [],
-                'disliked_keywords': [],
-                'successful_queries': [],
-                'liked_videos': [],
-                'disliked_videos': []
-            }
-        
-        # Store detailed feedback for learning
-        feedback_entry = {
-            'mood': mood_description,
-            'mood_normalized': mood_normalized,
-            'feedback': feedback,
-            'query': query,
-            'video_id': video_id,
-            'video_title': video_title,
-            'timestamp': datetime.now().isoformat()
-        }
-        self.preferences['feedback_history'].append(feedback_entry)
-        
-        # Learn from feedback
-        if feedback == 'like':
-            if query not in self.preferences['refined_keywords'][mood_normalized]['successful_queries']:
-                self.preferences['refined_keywords'][mood_normalized]['successful_queries'].append(query)
-            if video_id and video_id not in self.preferences['refined_keywords'][mood_normalized]['liked_videos']:
-                self.preferences['refined_keywords'][mood_normalized]['liked_videos'].append({
-                    'video_id': video_id,
-                    'title': video_title,
-                    'timestamp': datetime.now().isoformat()
-                })
-        elif feedback == 'dislike':
-            if video_id and video_id not in self.preferences['refined_keywords'][mood_normalized]['disliked_videos']:
-                self.preferences['refined_keywords'][mood_normalized]['disliked_videos'].append({
-                    'video_id': video_id,
-                    'title': video_title,
-                    'timestamp': datetime.now().isoformat()
-                })
+    def save_preferences(self, user: Optional[UserShard] = None):
+        """Save one user's preferences, or every loaded user's (each save is timed as 'save_preferences')"""
+        if user is not None:
+            user.save()
+        else:
+            self.users.flush()
+    
+    def record_mood(self, mood_entry: Dict, user: Optional[UserShard] = None):
+        """Append an entry to the user's mood history"""
+        (user or self.default_user).record_mood(mood_entry)
     
+    @timed('refine_keywords')
+    def refine_keywords(self, mood_description: str, feedback: str, query: str, video_id: str = None, video_title: str = None,
+                        video_channel: str = None, user: Optional[UserShard] = None):
+        """Refine the user's keywords based on feedback and save them"""
+        # Fill in what the client left out from the video store
+        if video_id and not (video_title and video_channel):
+            try:
+                card = self.video_store.get(video_id)
+            except sqlite3.Error as e:
+                print(f"Error reading stored videos: {e}")
+                card = None
+            if card:
+                video_title = video_title or card['title']
+                video_channel = video_channel or card['channel']
+        (user or self.default_user).refine_keywords(mood_description, feedback, query, video_id, video_title,
+                                                    video_channel)
+    
+    @timed('interpret_mood_with_llm')
     def interpret_mood_with_llm(self, mood_description: str) -> Dict[str, str]:
         """Use free LLM to interpret the mood description and generate search query"""
+        # Reuse an earlier LLM interpretation of the same (or a near-identical) description
+        cached = self.interpretation_cache.get(mood_description)
+        if cached:
+            return cached
+        
+        key = normalize_description(mood_description) or mood_description
+        return dict(self.singleflight['interpretations'].do(key, self._interpret_uncached, mood_description))
+    
+    def _interpret_uncached(self, mood_description: str) -> Dict[str, str]:
+        """Provider chain (or race) behind interpret_mood_with_llm"""
+        if self.llm_mode == 'race':
+            provider, result = self._race_llm_providers(mood_description)
+            if provider != 'rules':
+                self.interpretation_cache.put(mood_description, result)
+            return result
+        
         # Default: Try Gemini first (best quality), then fallback to Hugging Face
         
         # Try Google Gemini first (if API key is available)
         if self.gemini_key:
             try:
-                return self._interpret_with_gemini(mood_description)
+                result = self._call_llm_provider('gemini', self._interpret_with_gemini, mood_description)
+                self.interpretation_cache.put(mood_description, result)
+                return result
             except Exception as e:
                 print(f"Gemini failed, falling back to Hugging Face: {e}")
                 # Continue to Hugging Face fallback below
@@ -107,7 +231,9 @@ class MoodMusicApp:
         # Fallback to Hugging Face (with API key if available)
         if self.huggingface_key:
             try:
-                return self._interpret_with_huggingface(mood_description)
+                result = self._call_llm_provider('huggingface', self._interpret_with_huggingface, mood_description)
+                self.interpretation_cache.put(mood_description, result)
+                return result
             except Exception as e:
                 print(f"Hugging Face API failed, using public method: {e}")
                 # Continue to public method below
@@ -119,16 +245,231 @@ class MoodMusicApp:
             print(f"All LLM methods failed: {e}")
         
         # Final fallback: simple keyword extraction
+        return self._fallback_interpretation(mood_description)
+    
+    def _llm_providers(self) -> List[Tuple[str, Callable]]:
+        """Configured LLM providers in order of preference"""
+        providers = []
+        if self.gemini_key:
+            providers.append(('gemini', self._interpret_with_gemini))
+        if self.huggingface_key:
+            providers.append(('huggingface', self._interpret_with_huggingface))
+        return providers
+    
+    def _is_valid_interpretation(self, result) -> bool:
+        return isinstance(result, dict) and isinstance(result.get('search_query'), str) and bool(result['search_query'].strip())
+    
+    def _call_llm_provider(self, name: str, interpret: Callable, mood_description: str) -> Dict[str, str]:
+        """Call one provider through its circuit breaker, recording its latency;
+        raises if the circuit is open or it gives no usable interpretation"""
+        breaker = self.breakers[name]
+        breaker.check()
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = interpret(mood_description)
+            if not self._is_valid_interpretation(result):
+                raise ValueError(f"{name} returned no usable interpretation")
+            ok = True
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            self.provider_stats.record_call(name, elapsed, ok)
+            self.metrics.record_span(f"llm_{name}", elapsed)
+            if ok:
+                breaker.record_success(elapsed)
+            else:
+                breaker.record_failure()
+    
+    def _race_llm_providers(self, mood_description: str) -> Tuple[str, Dict[str, str]]:
+        """Hedged race: start the preferred provider, add the next one after the hedge delay
+        (or as soon as a running one fails) and take the first valid answer.
+        The rule-based interpretation is the floor if no provider answers in time."""
+        floor = self._interpret_with_huggingface_public(mood_description)
+        providers = self._llm_providers()
+        deadline = time.monotonic() + self.llm_race_deadline
+        pending = {}
+        launched = 0
+        hedge_at = 0.0
+        
+        while launched < len(providers) or pending:
+            if launched < len(providers) and (not pending or time.monotonic() >= hedge_at):
+                name, interpret = providers[launched]
+                # The copied context carries the request's Server-Timing spans into the worker
+                pending[self._llm_pool.submit(contextvars.copy_context().run, self._call_llm_provider,
+                                              name, interpret, mood_description)] = name
+                launched += 1
+                hedge_at = time.monotonic() + self.llm_hedge_delay
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            timeout = min(remaining, max(hedge_at - time.monotonic(), 0)) if launched < len(providers) else remaining
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                if future.exception() is None:
+                    # Losers cannot be interrupted mid-request; their results are simply dropped
+                    for other in pending:
+                        other.cancel()
+                    self.provider_stats.record_win(name)
+                    return name, future.result()
+                print(f"{name} failed during LLM race: {future.exception()}")
+        
+        for other in pending:
+            other.cancel()
+        self.provider_stats.record_win('rules')
+        return 'rules', floor
+    
+    def _fallback_interpretation(self, mood_description: str) -> Dict[str, str]:
+        """Simple keyword extraction used when every interpreter fails"""
         return {
             'mood_label': mood_description.lower(),
             'search_query': f"{mood_description} music",
             'interpretation': mood_description
         }
     
-    def _interpret_with_huggingface(self, mood_description: str) -> Dict[str, str]:
-        """Use Hugging Face Inference API (free tier)"""
+    def interpret_many(self, descriptions: List[str]) -> List[Dict[str, str]]:
+        """Interpret many mood descriptions with as few LLM round trips as possible
+        
+        Cached descriptions are answered from the interpretation cache; the rest are
+        packed into batch prompts of about llm_batch_token_budget tokens. Items an
+        LLM leaves out or garbles go to the next provider, then to the rule-based
+        interpreter. Results follow the input order and carry their 'source'
+        (cache, gemini, huggingface or rules).
+        """
+        results = {}
+        misses = []
+        for description in dict.fromkeys(descriptions):
+            cached = self.interpretation_cache.get(description)
+            if cached:
+                results[description] = dict(cached, source='cache')
+            else:
+                misses.append(description)
+        
+        chunks = self._batch_chunks(misses)
+        for chunk, answers in zip(chunks, self._llm_pool.map(self._interpret_batch, chunks)):
+            results.update(zip(chunk, answers))
+        return [dict(results[description]) for description in descriptions]
+    
+    def _batch_chunks(self, descriptions: List[str]) -> List[List[str]]:
+        """Split descriptions into prompt-sized chunks (roughly 4 characters per token)"""
+        budget = self.llm_batch_token_budget - len(self._batch_prompt([])) // 4
+        chunks, chunk, used = [], [], 0
+        for description in descriptions:
+            cost = (len(description) + 8) // 4 + 1  # numbering and quotes included
+            if chunk and (used + cost > budget or len(chunk) >= self.llm_batch_max_items):
+                chunks.append(chunk)
+                chunk, used = [], 0
+            chunk.append(description)
+            used += cost
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+    
+    def _interpret_batch(self, chunk: List[str]) -> List[Dict[str, str]]:
+        """Interpret one chunk: one call per provider for whatever is still unanswered"""
+        answers: List[Optional[Dict[str, str]]] = [None] * len(chunk)
+        for name, generate in self._batch_providers():
+            pending = [i for i, answer in enumerate(answers) if answer is None]
+            if not pending:
+                break
+            try:
+                parsed = self._call_batch_provider(name, generate, [chunk[i] for i in pending])
+            except Exception as e:
+                print(f"{name} batch failed, falling back: {e}")
+                continue
+            answered = [(i, result) for i, result in zip(pending, parsed) if result is not None]
+            self.interpretation_cache.put_many([(chunk[i], result) for i, result in answered])
+            for i, result in answered:
+                answers[i] = dict(result, source=name)
+        
+        return [answer or dict(self._interpret_with_huggingface_public(description), source='rules')
+                for answer, description in zip(answers, chunk)]
+    
+    def _batch_providers(self) -> List[Tuple[str, Callable]]:
+        """Providers that can complete a raw batch prompt, in order of preference"""
+        providers = []
+        if self.gemini_key:
+            providers.append(('gemini', lambda prompt, count, timeout: self._gemini_generate(prompt, timeout)))
+        if self.huggingface_key:
+            providers.append(('huggingface', self._huggingface_generate))
+        return providers
+    
+    def _call_batch_provider(self, name: str, generate: Callable, descriptions: List[str]) -> List[Optional[Dict[str, str]]]:
+        """One batch round trip through the provider's circuit breaker
+        
+        Batch latency is recorded as '<name>_batch' and does not feed the breaker's
+        adaptive timeout, which is tuned for single descriptions; batches may take
+        up to its max_timeout.
+        """
+        breaker = self.breakers[name]
+        breaker.check()
+        start = time.perf_counter()
+        ok = False
         try:
-            prompt = f"""You are a music recommendation assistant. A user described their mood as: "{mood_description}"
+            text = generate(self._batch_prompt(descriptions), len(descriptions), breaker.max_timeout)
+            parsed = self._parse_batch_text(text, len(descriptions))
+            if not any(parsed):
+                raise ValueError(f"{name} returned no usable interpretations")
+            ok = True
+            return parsed
+        finally:
+            self.provider_stats.record_call(f"{name}_batch", time.perf_counter() - start, ok)
+            if ok:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+    
+    def _batch_prompt(self, descriptions: List[str]) -> str:
+        """Prompt asking for one JSON interpretation per numbered description"""
+        numbered = "\n".join(f'{i}. "{description}"' for i, description in enumerate(descriptions, 1))
+        return f"""You are a music recommendation assistant. Users described their moods as follows:
+
+{numbered}
+
+IMPORTANT: Pay careful attention to negations (not, nor, neither, etc.). If a user says "not happy", they are NOT happy.
+
+For EACH description generate:
+1. A concise mood label (1-2 words, e.g., "happy", "melancholic", "energetic", "neutral", "ambiguous")
+2. An optimized YouTube music search query (3-5 words that will find relevant music)
+3. A brief interpretation that accurately reflects what the user said
+
+Respond with a JSON array only, one object per description, using its number as "id":
+[{{"id": 1, "mood_label": "concise mood label", "search_query": "optimized search query for YouTube", "interpretation": "brief interpretation"}}]"""
+    
+    def _parse_batch_text(self, result_text: str, count: int) -> List[Optional[Dict[str, str]]]:
+        """Map a batch reply back to its descriptions; unusable items come back as None"""
+        match = re.search(r'\[.*\]', result_text, re.DOTALL)
+        try:
+            items = json.loads(match.group()) if match else None
+        except ValueError:
+            items = None
+        if not isinstance(items, list):
+            # Salvage the well-formed objects of a truncated or malformed array
+            items = []
+            for obj in re.findall(r'\{[^{}]*\}', result_text):
+                try:
+                    items.append(json.loads(obj))
+                except ValueError:
+                    items.append(None)
+        
+        parsed: List[Optional[Dict[str, str]]] = [None] * count
+        for position, item in enumerate(items):
+            if not self._is_valid_interpretation(item):
+                continue
+            index = item.get('id')
+            index = index - 1 if isinstance(index, int) and 1 <= index <= count else position
+            if index < count and parsed[index] is None:
+                parsed[index] = {key: str(item.get(key, '')) for key in ('mood_label', 'search_query', 'interpretation')}
+        return parsed
+    
+    def _huggingface_request(self, mood_description: str) -> Dict:
+        """Headers and payload for the Hugging Face Inference API"""
+        return self.huggingface.request(self._huggingface_prompt(mood_description))
+    
+    def _huggingface_prompt(self, mood_description: str) -> str:
+        return f"""You are a music recommendation assistant. A user described their mood as: "{mood_description}"
 
 Based on this description, generate:
 1. A concise mood label (1-2 words)
@@ -137,137 +478,40 @@ Based on this description, generate:
 
 Respond in JSON format:
 {{"mood_label": "...", "search_query": "...", "interpretation": "..."}}"""
-
-            headers = {
-                "Authorization": f"Bearer {self.huggingface_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Using a free model like mistralai/Mistral-7B-Instruct-v0.2 or meta-llama/Llama-2-7b-chat-hf
-            # For free tier, we'll use a simpler approach with a text generation model
-            payload = {
-                "inputs": prompt,
-                "parameters": {
-                    "max_new_tokens": 150,
-                    "temperature": 0.7,
-                    "return_full_text": False
-                }
-            }
-            
+    
+    def _parse_huggingface_response(self, data) -> Optional[Dict[str, str]]:
+        """Extract the JSON interpretation from generated text"""
+        result_text = data[0].get('generated_text', '').strip()
+        # Try to extract JSON from response
+        json_match = re.search(r'\{[^}]+\}', result_text)
+        if json_match:
+            return json.loads(json_match.group())
+        return None
+    
+    def _interpret_with_huggingface(self, mood_description: str) -> Dict[str, str]:
+        """Use Hugging Face Inference API (free tier)"""
+        try:
             # Try using a free model endpoint
-            response = requests.post(
-                "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.2",
-                headers=headers,
-                json=payload,
-                timeout=30
+            response = self.huggingface.post(
+                self._huggingface_prompt(mood_description),
+                timeout=self.breakers['huggingface'].timeout()
             )
             
             if response.status_code == 200:
-                result_text = response.json()[0].get('generated_text', '').strip()
-                # Try to extract JSON from response
-                import re
-                json_match = re.search(r'\{[^}]+\}', result_text)
-                if json_match:
-                    result = json.loads(json_match.group())
-                    return result
+                return self._parse_huggingface_response(response.json())
         except Exception as e:
             print(f"Hugging Face API error: {e}")
             # Raise exception so caller can handle fallback
             raise
     
+    def _huggingface_generate(self, prompt: str, count: int, timeout: float) -> str:
+        """Raw Hugging Face generated text for a batch prompt"""
+        return self.huggingface.generate(prompt, timeout, max_new_tokens=min(60 * count, 2048))
+    
     def _interpret_with_huggingface_public(self, mood_description: str) -> Dict[str, str]:
-        """Use Hugging Face public models (no API key needed, but slower)"""
+        """Rule-based interpretation (no API key needed); see mood_rules.py"""
         try:
-            # Improved rule-based interpretation that handles negations
-            mood_lower = mood_description.lower()
-            
-            # Check for negations first (not, nor, neither, etc.)
-            negation_words = ['not', 'nor', 'neither', "don't", "doesn't", "isn't", "aren't", "won't", "can't"]
-            has_negation = any(neg in mood_lower for neg in negation_words)
-            
-            # Extract key emotions/words
-            mood_keywords = {
-                'happy': ['happy', 'joyful', 'cheerful', 'upbeat', 'excited', 'celebrating', 'glad', 'pleased'],
-                'sad': ['sad', 'down', 'depressed', 'melancholic', 'lonely', 'heartbroken', 'breakup', 'upset', 'unhappy'],
-                'energetic': ['energetic', 'pumped', 'workout', 'exercise', 'active', 'motivated', 'pumped up'],
-                'relaxed': ['relaxed', 'chill', 'calm', 'peaceful', 'meditation', 'zen', 'serene', 'tranquil'],
-                'focused': ['focused', 'study', 'work', 'concentration', 'productive', 'lo-fi', 'studying', 'working'],
-                'romantic': ['romantic', 'love', 'intimate', 'dating', 'relationship', 'loving'],
-                'angry': ['angry', 'frustrated', 'aggressive', 'intense', 'heavy', 'mad', 'irritated'],
-                'nostalgic': ['nostalgic', 'retro', 'vintage', 'old', 'classic', 'memories', 'remembering'],
-                'neutral': ['neutral', 'indifferent', 'neither', 'ambivalent', 'mixed', 'confused']
-            }
-            
-            detected_mood = 'neutral'
-            mood_scores = {}
-            
-            # Score each mood based on keyword matches
-            for mood, keywords in mood_keywords.items():
-                score = 0
-                for keyword in keywords:
-                    if keyword in mood_lower:
-                        # If there's a negation before the keyword, subtract points
-                        keyword_index = mood_lower.find(keyword)
-                        if keyword_index > 0:
-                            # Check for negation words before the keyword (within 10 chars)
-                            context = mood_lower[max(0, keyword_index-15):keyword_index]
-                            if any(neg in context for neg in negation_words):
-                                score -= 2  # Strong negative signal
-                            else:
-                                score += 1
-                        else:
-                            score += 1
-                mood_scores[mood] = score
-            
-            # Find the mood with highest positive score
-            max_score = max(mood_scores.values())
-            if max_score > 0:
-                detected_mood = max(mood_scores, key=mood_scores.get)
-            else:
-                # If all scores are negative or zero, it's truly neutral/ambiguous
-                detected_mood = 'neutral'
-            
-            # Generate search query based on detected mood
-            if detected_mood == 'happy':
-                search_query = "upbeat happy energetic music"
-            elif detected_mood == 'sad':
-                search_query = "sad emotional melancholic music"
-            elif detected_mood == 'energetic':
-                search_query = "high energy motivational music"
-            elif detected_mood == 'relaxed':
-                search_query = "chill ambient peaceful music"
-            elif detected_mood == 'focused':
-                search_query = "study focus instrumental music"
-            elif detected_mood == 'romantic':
-                search_query = "romantic love songs music"
-            elif detected_mood == 'angry':
-                search_query = "intense powerful aggressive music"
-            elif detected_mood == 'nostalgic':
-                search_query = "classic retro vintage music"
-            elif detected_mood == 'neutral':
-                # For neutral/ambiguous moods, use ambient or instrumental
-                search_query = "ambient instrumental background music"
-            else:
-                # Extract key words from description, avoiding negations
-                words = mood_lower.split()
-                # Remove common words and negations
-                stop_words = ['i', 'am', 'feeling', 'need', 'want', 'the', 'a', 'an', 'and', 'or', 'but', 'not', 'nor', 'neither']
-                key_words = [w for w in words if w not in stop_words and len(w) > 2][:3]
-                search_query = " ".join(key_words) + " music" if key_words else "ambient instrumental music"
-            
-            # Create interpretation message
-            if has_negation and detected_mood == 'neutral':
-                interpretation = "Ambiguous or neutral mood detected - suggesting ambient music"
-            elif has_negation:
-                interpretation = f"Detected {detected_mood} mood (noting negations in your description)"
-            else:
-                interpretation = f"Detected {detected_mood} mood from your description"
-            
-            return {
-                'mood_label': detected_mood,
-                'search_query': search_query,
-                'interpretation': interpretation
-            }
+            return mood_rules.interpret(mood_description)
         except Exception as e:
             print(f"Public interpretation error: {e}")
             return {
@@ -276,15 +520,9 @@ Respond in JSON format:
                 'interpretation': mood_description
             }
     
-    def _interpret_with_gemini(self, mood_description: str) -> Dict[str, str]:
-        """Use Google Gemini API (free tier)"""
-        try:
-            import google.generativeai as genai
-            genai.configure(api_key=self.gemini_key)
-            
-            model = genai.GenerativeModel('gemini-pro')
-            
-            prompt = f"""You are a music recommendation assistant. A user described their mood as: "{mood_description}"
+    def _gemini_prompt(self, mood_description: str) -> str:
+        """Prompt asking Gemini for a JSON mood interpretation"""
+        return f"""You are a music recommendation assistant. A user described their mood as: "{mood_description}"
 
 IMPORTANT: Pay careful attention to negations (not, nor, neither, etc.). If the user says "not happy", they are NOT happy. If they say "not happy, not sad, nor neutral", they are describing an ambiguous or complex emotional state.
 
@@ -298,41 +536,50 @@ Respond in JSON format only:
 
 Example for "not happy, not sad, nor neutral":
 {{"mood_label": "ambiguous", "search_query": "ambient instrumental background music", "interpretation": "Ambiguous emotional state - suggesting neutral ambient music"}}"""
-
-            response = model.generate_content(prompt)
-            result_text = response.text.strip()
-            
-            # Remove markdown code blocks if present
-            if result_text.startswith("```json"):
-                result_text = result_text[7:]
-            if result_text.startswith("```"):
-                result_text = result_text[3:]
-            if result_text.endswith("```"):
-                result_text = result_text[:-3]
-            result_text = result_text.strip()
-            
-            result = json.loads(result_text)
-            return result
+    
+    def _parse_gemini_text(self, result_text: str):
+        """Parse Gemini's JSON reply, stripping markdown code fences"""
+        result_text = result_text.strip()
+        
+        # Remove markdown code blocks if present
+        if result_text.startswith("```json"):
+            result_text = result_text[7:]
+        if result_text.startswith("```"):
+            result_text = result_text[3:]
+        if result_text.endswith("```"):
+            result_text = result_text[:-3]
+        result_text = result_text.strip()
+        
+        return json.loads(result_text)
+    
+    def _gemini_generate(self, prompt: str, timeout: float) -> str:
+        """Raw Gemini completion text for a prompt"""
+        # The client library has no per-call timeout, so wait on it in a worker thread
+        future = self._timeout_pool.submit(self.gemini.generate, prompt)
+        return future.result(timeout=timeout)
+    
+    def _interpret_with_gemini(self, mood_description: str) -> Dict[str, str]:
+        """Use Google Gemini API (free tier)"""
+        try:
+            text = self._gemini_generate(self._gemini_prompt(mood_description), self.breakers['gemini'].timeout())
+            return self._parse_gemini_text(text)
             
         except Exception as e:
             print(f"Gemini API error: {e}")
             # Raise exception so caller can handle fallback
             raise
     
-    def get_search_query(self, mood_description: str, use_llm: bool = True) -> Dict[str, str]:
+    def _learned_query(self, mood_description: str, user: Optional[UserShard] = None) -> Optional[Dict[str, str]]:
+        """A query that earned the user a like for this exact mood (Thompson sampled), or None"""
+        return (user or self.default_user).learned_query(mood_description)
+    
+    @timed('get_search_query')
+    def get_search_query(self, mood_description: str, use_llm: bool = True,
+                         user: Optional[UserShard] = None) -> Dict[str, str]:
         """Get search query for YouTube based on mood description"""
-        # Normalize mood description for storage
-        mood_normalized = mood_description.lower().strip()
-        
-        # Check if we have successful queries for similar moods
-        if mood_normalized in self.preferences['refined_keywords']:
-            successful_queries = self.preferences['refined_keywords'][mood_normalized].get('successful_queries', [])
-            if successful_queries:
-                return {
-                    'mood_label': mood_normalized,
-                    'search_query': random.choice(successful_queries),
-                    'interpretation': mood_description
-                }
+        learned = self._learned_query(mood_description, user)
+        if learned:
+            return learned
         
         # Use LLM to interpret mood and generate query
         if use_llm:
@@ -340,16 +587,13 @@ Example for "not happy, not sad, nor neutral":
         else:
             # Simple fallback
             return {
-                'mood_label': mood_normalized,
+                'mood_label': mood_description.lower().strip(),
                 'search_query': f"{mood_description} music",
                 'interpretation': mood_description
             }
     
-    def search_youtube(self, query: str, max_results: int = 5, mood_normalized: str = None, genre: str = None, industry: str = None) -> List[Dict]:
-        """Search YouTube for music videos"""
-        if not self.api_key:
-            return []
-        
+    def _compose_query(self, query: str, genre: str = None, industry: str = None) -> str:
+        """Add genre and industry preferences to a search query"""
         # Add genre to query if specified
         if genre and genre != 'any':
             query = f"{query} {genre} music"
@@ -361,55 +605,408 @@ Example for "not happy, not sad, nor neutral":
             elif industry == 'hollywood':
                 query = f"{query} hollywood"
         
-        url = "https://www.googleapis.com/youtube/v3/search"
+        return query
+    
+    def _fetch_youtube_page(self, query: str, max_results: int, category_id: str = '10',
+                            page_token: Optional[str] = None, lane: str = 'interactive') -> Dict:
+        """One search.list page for a composed query, {'items': [...], 'next_page_token': ...},
+        served from the cache when possible. lane is the quota lane ('interactive' or 'background')"""
+        cache_key = (query, max_results, category_id, page_token)
+        page = self.youtube_cache.get(cache_key)
+        if page is None and self.quota.degraded:
+            page = self.youtube_cache.get_stale(cache_key)
+        if page is not None:
+            return page
+        try:
+            return self.singleflight['youtube'].do((cache_key, lane), self._request_youtube_page, cache_key, lane)
+        except QuotaExceededError:
+            page = self.youtube_cache.get_stale(cache_key)
+            if page is None:
+                raise
+            return page
+    
+    def _take_youtube_quota(self, lane: str, cost: int = SEARCH_COST):
+        """Spend the call's units and pass the circuit breaker, or raise without spending"""
+        self.quota.acquire(cost, lane)
+        try:
+            self.breakers['youtube'].check()
+        except CircuitOpenError:
+            self.quota.refund(cost)
+            raise
+    
+    def _check_youtube_quota_response(self, status_code: int, text: str):
+        """YouTube's quotaExceeded answer empties the bucket until its daily reset (not a breaker failure)"""
+        if status_code == 403 and 'quotaExceeded' in text:
+            self.quota.exhaust()
+            self.breakers['youtube'].record_success()
+            raise QuotaExceededError("YouTube reports the daily quota is exceeded")
+    
+    @timed('youtube_search_call')
+    def _request_youtube_page(self, cache_key: Tuple, lane: str = 'interactive') -> Dict:
+        """search.list call behind _fetch_youtube_page; caches the page"""
+        query, max_results, category_id, page_token = cache_key
+        breaker = self.breakers['youtube']
+        self._take_youtube_quota(lane)
+        start = time.perf_counter()
+        try:
+            response = self.http.get(
+                YOUTUBE_SEARCH_URL,
+                params=self._youtube_search_params(query, max_results, category_id, page_token),
+                timeout=breaker.timeout()
+            )
+            self._check_youtube_quota_response(response.status_code, response.text)
+            response.raise_for_status()
+            page = self._youtube_page(response.json())
+        except QuotaExceededError:
+            raise  # already resolved the breaker
+        except Exception:
+            # Anything else, a malformed response included, counts against YouTube; a half-open
+            # probe that ended without a verdict would keep the circuit shut for good
+            breaker.record_failure()
+            raise
+        breaker.record_success(time.perf_counter() - start)
+        self.youtube_cache.set(cache_key, page)
+        self._remember_page(query, page_token, page)
+        return page
+    
+    def _youtube_page(self, data: Dict) -> Dict:
+        """Video cards of a search.list response and the next page token"""
+        items = [video_card(item) for item in data.get('items', []) if item.get('id', {}).get('videoId')]
+        return {'items': items, 'next_page_token': data.get('nextPageToken')}
+    
+    def _remember_page(self, query: str, page_token: Optional[str], page: Dict):
+        """Write a page's cards through to the video store; first pages are also kept per query"""
+        try:
+            if page_token is None:
+                self.video_store.put_results(query, page['items'])
+            else:
+                self.video_store.put_many(page['items'])
+        except sqlite3.Error as e:
+            print(f"Error saving videos: {e}")
+    
+    def _stored_page(self, query: str) -> Dict:
+        """The query's last first page from the video store, for when YouTube cannot be reached"""
+        try:
+            items = self.video_store.results(query)
+        except sqlite3.Error as e:
+            print(f"Error reading stored videos: {e}")
+            items = []
+        return {'items': items, 'next_page_token': None}
+    
+    def _youtube_search_params(self, query: str, max_results: int, category_id: str = '10',
+                               page_token: Optional[str] = None) -> Dict:
+        """Query parameters for search.list"""
         params = {
             'part': 'snippet',
             'q': query,
             'type': 'video',
-            'maxResults': max_results * 2,  # Get more to filter out disliked videos
+            'maxResults': max_results,
             'key': self.api_key,
-            'videoCategoryId': '10'  # Music category
+            'videoCategoryId': category_id  # Music category
         }
-        
+        if page_token:
+            params['pageToken'] = page_token
+        return params
+    
+    def _videos_params(self, video_ids: List[str]) -> Dict:
+        """Query parameters for videos.list"""
+        return {'part': VIDEOS_LIST_PARTS, 'id': ','.join(video_ids), 'maxResults': len(video_ids), 'key': self.api_key}
+    
+    @timed('youtube_videos_call')
+    def _request_video_details(self, video_ids: List[str], lane: str = 'interactive'):
+        """One videos.list call for up to 50 IDs; caches the details"""
+        breaker = self.breakers['youtube']
+        self._take_youtube_quota(lane, VIDEOS_LIST_COST)
+        start = time.perf_counter()
         try:
-            response = requests.get(url, params=params)
+            response = self.http.get(YOUTUBE_VIDEOS_URL, params=self._videos_params(video_ids), timeout=breaker.timeout())
+            self._check_youtube_quota_response(response.status_code, response.text)
             response.raise_for_status()
-            data = response.json()
-            
-            videos = []
-            disliked_video_ids = set()
+            items = response.json().get('items', [])
+        except QuotaExceededError:
+            raise  # already resolved the breaker
+        except Exception:
+            # As in _request_youtube_page: a half-open probe always gets a verdict
+            breaker.record_failure()
+            raise
+        breaker.record_success(time.perf_counter() - start)
+        self.enricher.store_response(video_ids, items)
+    
+    @timed('enrich_videos')
+    def enrich_videos(self, videos: List[Dict], lane: str = 'interactive') -> List[Dict]:
+        """Add duration / view counts, fetching uncached IDs in batched videos.list calls.
+        On errors the videos are returned without (some) details."""
+        if not self.enrichment or not self.api_key:
+            return videos
+        try:
+            for batch in chunks(self.enricher.missing(v['video_id'] for v in videos)):
+                self._request_video_details(batch, lane)
+        except (requests.exceptions.RequestException, ValueError, CircuitOpenError, QuotaExceededError,
+                sqlite3.Error) as e:
+            print(f"Error fetching video details: {e}")
+        return self.enricher.apply(videos)
+    
+    def _filter_videos(self, items: List[Dict], max_results: int, mood_normalized: str = None,
+                       filters: Optional[VideoFilters] = None, lane: str = 'interactive',
+                       user: Optional[UserShard] = None) -> List[Dict]:
+        """Drop disliked videos, build and enrich the video dicts and keep the best ranked max_results"""
+        user = user or self.default_user
+        videos = self.enrich_videos(self._candidate_videos(items, mood_normalized, user), lane)
+        return self._select_videos(videos, max_results, mood_normalized, filters, user)
+    
+    def _candidate_videos(self, cards: List[Dict], mood_normalized: str = None,
+                          user: Optional[UserShard] = None) -> List[Dict]:
+        """Copies of a page's video cards, without videos the user disliked for this mood (or globally)"""
+        user = user or self.default_user
+        videos = []
+        # Disliked videos for this mood are never shown again
+        disliked_video_ids = user.preference_index.ids(mood_normalized, 'disliked') if mood_normalized else set()
+        liked_video_ids = user.preference_index.ids(mood_normalized, 'liked') if mood_normalized else set()
+        
+        for card in cards:
+            video_id = card['video_id']
             
-            # Get list of disliked videos for this mood to avoid showing them
-            if mood_normalized and mood_normalized in self.preferences['refined_keywords']:
-                disliked_videos = self.preferences['refined_keywords'][mood_normalized].get('disliked_videos', [])
-                disliked_video_ids = {v.get('video_id') for v in disliked_videos if v.get('video_id')}
+            # Disliked under some other mood, unless it was liked for this one
+            if user.globally_disliked(video_id) and video_id not in liked_video_ids:
+                continue
             
-            for item in data.get('items', []):
-                video_id = item['id']['videoId']
-                
-                # Skip disliked videos
-                if video_id in disliked_video_ids:
-                    continue
-                
-                videos.append({
-                    'title': item['snippet']['title'],
-                    'video_id': video_id,
-                    'url': f"https://www.youtube.com/watch?v={video_id}",
-                    'thumbnail': item['snippet']['thumbnails']['default']['url'],
-                    'channel': item['snippet']['channelTitle']
-                })
-                
-                # Stop when we have enough videos
-                if len(videos) >= max_results:
-                    break
+            # Skip disliked videos
+            if video_id in disliked_video_ids:
+                continue
             
-            return videos
-        except requests.exceptions.RequestException as e:
-            print(f"Error searching YouTube: {e}")
+            # Cached pages are shared, so enrichment works on a copy
+            videos.append(dict(card))
+        return videos
+    
+    def _select_videos(self, videos: List[Dict], max_results: int, mood_normalized: str = None,
+                       filters: Optional[VideoFilters] = None, user: Optional[UserShard] = None) -> List[Dict]:
+        """Apply the duration / view filters and keep the best ranked max_results"""
+        user = user or self.default_user
+        videos = (filters or self.video_filters).apply(videos)
+        return self.ranker.rank(
+            videos, max_results, (user.user_id, mood_normalized) if mood_normalized else None,
+            user.entry(mood_normalized),
+            lambda video_id: user.preference_index.anywhere('disliked', video_id)
+        )
+    
+    @timed('search_youtube')
+    def search_youtube(self, query: str, max_results: int = 5, mood_normalized: str = None, genre: str = None, industry: str = None,
+                       session_id: str = None, filters: Optional[VideoFilters] = None,
+                       user: Optional[UserShard] = None) -> List[Dict]:
+        """Search YouTube for music videos for a user; with a session_id the rest is kept for more_videos()"""
+        if not self.api_key:
+            return []
+        
+        query = self._compose_query(query, genre, industry)
+        page = self._search_page(query, max_results)
+        if not page['items']:
             return []
+        
+        # Disliked videos are filtered after the cache lookup so cached results are shared across moods
+        user = user or self.default_user
+        if not session_id:
+            return self._filter_videos(page['items'], max_results, mood_normalized, filters, user=user)
+        ranked = self._filter_videos(page['items'], len(page['items']), mood_normalized, filters, user=user)
+        self.start_session(session_id, query, max_results * 2, mood_normalized, ranked[:max_results],
+                           ranked[max_results:], page['next_page_token'], filters, user)
+        return ranked[:max_results]
+    
+    def _search_page(self, query: str, max_results: int) -> Dict:
+        """First results page for a composed query, or the stored one if YouTube cannot be reached"""
+        try:
+            # Get more than needed so disliked videos can be filtered out
+            return self._fetch_youtube_page(query, max_results * 2)
+        except (requests.exceptions.RequestException, ValueError, CircuitOpenError, QuotaExceededError) as e:
+            print(f"Error searching YouTube: {e}")
+            return self._stored_page(query)
+    
+    def stream_youtube(self, query: str, max_results: int = 5, mood_normalized: str = None, genre: str = None,
+                       industry: str = None, session_id: str = None, filters: Optional[VideoFilters] = None,
+                       user: Optional[UserShard] = None) -> Iterator[Dict]:
+        """search_youtube as events: {'type': 'video'} per result as soon as the page is filtered and
+        ranked, then {'type': 'details'} for each result videos.list added duration / views to.
+        Ranking does not use the details, so only duration / view filters make the results wait for them."""
+        if not self.api_key:
+            return
+        query = self._compose_query(query, genre, industry)
+        page = self._search_page(query, max_results)
+        if not page['items']:
+            return
+        user = user or self.default_user
+        filters = filters or self.video_filters
+        keep = len(page['items']) if session_id else max_results
+        candidates = self._candidate_videos(page['items'], mood_normalized, user)
+        
+        if filters.active:
+            ranked = self._select_videos(self.enrich_videos(candidates), keep, mood_normalized, filters, user)
+            for video in ranked[:max_results]:
+                yield {'type': 'video', 'video': video}
+        else:
+            ranked = self._select_videos(candidates, keep, mood_normalized, filters, user)
+            sent = [dict(video) for video in ranked[:max_results]]
+            for video in sent:
+                yield {'type': 'video', 'video': video}
+            # Details land on the same dicts in place; leftovers for /api/more are enriched in the same call
+            self.enrich_videos(ranked)
+            for before, video in zip(sent, ranked):
+                if video != before:
+                    yield {'type': 'details', 'video': video}
+        
+        if session_id:
+            self.start_session(session_id, query, max_results * 2, mood_normalized, ranked[:max_results],
+                               ranked[max_results:], page['next_page_token'], filters, user)
+    
+    def search_events(self, mood_description: str, genre: str = 'any', industry: str = 'any',
+                      user_id: str = DEFAULT_USER, filters: Optional[VideoFilters] = None,
+                      session_id: str = None) -> Iterator[Dict]:
+        """/api/search as a stream of events: the interpretation, the videos (see stream_youtube),
+        then {'type': 'done'} or {'type': 'error'} if no video was found"""
+        count = 0
+        with self.users.checkout(user_id) as user:
+            self.record_mood({
+                'mood': mood_description,
+                'genre': genre,
+                'industry': industry,
+                'timestamp': datetime.now().isoformat()
+            }, user)
+            mood_info = self.get_search_query(mood_description, use_llm=True, user=user)
+            yield {'type': 'interpretation', **interpretation_fields(mood_description, mood_info)}
+            
+            for event in self.stream_youtube(mood_info['search_query'], mood_normalized=mood_description.lower().strip(),
+                                             genre=genre, industry=industry, session_id=session_id, filters=filters,
+                                             user=user):
+                count += event['type'] == 'video'
+                yield event
+        
+        if not count:
+            error, status = self.no_videos_error()
+            yield {'type': 'error', **error, 'status': status}
+            return
+        yield {'type': 'done', 'videos': count}
+    
+    def no_videos_error(self) -> Tuple[Dict, int]:
+        """Error body and status for a search that found nothing"""
+        if self.quota.degraded:
+            return {'error': "We've used up today's YouTube searches. Please try again later."}, 503
+        return {'error': 'No videos found. Please check your API key or try a different mood description.'}, 500
+    
+    def start_session(self, session_id: str, query: str, page_size: int, mood_normalized: Optional[str],
+                      shown: List[Dict], leftovers: List[Dict], next_page_token: Optional[str],
+                      filters: Optional[VideoFilters] = None, user: Optional[UserShard] = None):
+        """Remember a search's unshown candidates and start prefetching its next page"""
+        session = SearchSession(query, page_size, mood_normalized, [v['video_id'] for v in shown],
+                                leftovers, next_page_token, filters, user.user_id if user else DEFAULT_USER)
+        self.sessions.set(session_id, session)
+        self._prefetch(session)
+    
+    def _prefetch(self, session: SearchSession):
+        if session.next_page_token and not session.prefetching and self.api_key:
+            session.prefetch = self._prefetch_pool.submit(self._prefetch_page, session)
+    
+    def _prefetch_page(self, session: SearchSession):
+        """Fetch, filter and rank the session's next page into its buffer"""
+        try:
+            page = self._fetch_youtube_page(session.query, session.page_size, page_token=session.next_page_token,
+                                            lane='background')
+        except (requests.exceptions.RequestException, ValueError, CircuitOpenError, QuotaExceededError) as e:
+            print(f"Error prefetching YouTube results: {e}")
+            return
+        with self.users.checkout(session.user_id) as user:
+            ranked = self._filter_videos(page['items'], len(page['items']), session.mood_normalized, session.filters,
+                                         lane='background', user=user)
+        session.extend(ranked, page['next_page_token'])
+    
+    @timed('more_videos')
+    def more_videos(self, session_id: str, max_results: int = 5) -> Optional[List[Dict]]:
+        """Next batch for a session from its buffer; None if the session is unknown or expired"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        mood_normalized = session.mood_normalized
+        with self.users.checkout(session.user_id) as user:
+            liked_video_ids = user.preference_index.ids(mood_normalized, 'liked') if mood_normalized else set()
+            
+            def skip(video_id: str) -> bool:
+                # Feedback may have arrived since the candidates were buffered
+                if mood_normalized and user.preference_index.contains(mood_normalized, 'disliked', video_id):
+                    return True
+                return user.globally_disliked(video_id) and video_id not in liked_video_ids
+            
+            videos = session.take(max_results, skip)
+            if len(videos) < max_results and session.prefetching:
+                # Asked again before the prefetch finished: wait for it instead of searching again
+                try:
+                    session.prefetch.result(timeout=self.breakers['youtube'].timeout())
+                except Exception as e:
+                    print(f"Prefetch did not finish: {e}")
+                videos += session.take(max_results - len(videos), skip)
+        
+        # Keep the next page warm for the following request
+        if len(session.buffer) < max_results * 2:
+            self._prefetch(session)
+        return videos
 
 # Initialize the app
 music_app = MoodMusicApp()
+# New interpretations are written in the background; write out the last few on exit
+atexit.register(music_app.interpretation_cache.close)
+# Save every loaded user (queued mood events, the preference index sidecar) and close the stores
+atexit.register(music_app.users.close)
+
+def request_user_id(data: Dict) -> Optional[str]:
+    """The opaque user_id of a request body (default user if absent), or None if it is malformed"""
+    user_id = data.get('user_id') or DEFAULT_USER
+    return user_id if valid_user_id(user_id) else None
+
+def search_request(data: Dict) -> Tuple[Optional[Dict], Optional[Tuple[Dict, int]]]:
+    """search_events() arguments from a /api/search body, or None and the (error, status) to answer with"""
+    mood_description = data.get('mood_description', '').strip()
+    if not mood_description:
+        return None, ({'error': 'Please describe your mood'}, 400)
+    user_id = request_user_id(data)
+    if user_id is None:
+        return None, ({'error': 'Invalid user_id'}, 400)
+    # Optional min_duration / max_duration (seconds) and min_views on top of the configured defaults
+    try:
+        filters = music_app.video_filters.merged(data)
+    except (TypeError, ValueError):
+        return None, ({'error': 'min_duration, max_duration and min_views must be non-negative whole numbers'}, 400)
+    return {
+        'mood_description': mood_description,
+        'genre': data.get('genre', 'any'),  # Genre preference
+        'industry': data.get('industry', 'any'),  # Industry preference (Bollywood/Hollywood)
+        'user_id': user_id,
+        'filters': filters,
+        'session_id': data.get('session_id')
+    }, None
+
+def interpretation_fields(mood_description: str, mood_info: Dict) -> Dict:
+    """What a search understood the mood as and the query it used (the non-video part of a response)"""
+    return {
+        'mood_description': mood_description,
+        'mood_label': mood_info.get('mood_label', mood_description),
+        'interpretation': mood_info.get('interpretation', mood_description),
+        'query': mood_info['search_query']
+    }
+
+@app.before_request
+def start_request_timing():
+    g.metrics_token = music_app.metrics.begin_request()
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def finish_request_timing(response):
+    """Time the request as a stage named after its endpoint and add the Server-Timing header"""
+    token = g.pop('metrics_token', None)
+    if token is None:
+        return response
+    # Streamed responses are timed when the stream ends (here only the headers are ready)
+    if request.endpoint not in (None, 'static', 'metrics') and not response.is_streamed:
+        music_app.metrics.observe(request.endpoint, time.perf_counter() - g.request_start, response.status_code < 500)
+    spans = music_app.metrics.end_request(token)
+    if music_app.server_timing and spans:
+        response.headers['Server-Timing'] = server_timing(spans)
+    return response
 
 @app.route('/')
 def index():
@@ -419,41 +1016,124 @@ def index():
 @app.route('/api/search', methods=['POST'])
 def search_music():
     """API endpoint to search for music based on mood description"""
-    data = request.json
-    mood_description = data.get('mood_description', '').strip()
-    genre = data.get('genre', 'any')  # Get genre preference
-    industry = data.get('industry', 'any')  # Get industry preference (Bollywood/Hollywood)
+    arguments, error = search_request(request.json or {})
+    if error:
+        return jsonify(error[0]), error[1]
+    mood_description = arguments['mood_description']
     
-    if not mood_description:
-        return jsonify({'error': 'Please describe your mood'}), 400
-    
-    # Record mood in history
-    music_app.preferences['mood_history'].append({
-        'mood': mood_description,
-        'genre': genre,
-        'industry': industry,
-        'timestamp': datetime.now().isoformat()
-    })
+    with music_app.users.checkout(arguments['user_id']) as user:
+        # Record mood in the user's history
+        music_app.record_mood({
+            'mood': mood_description,
+            'genre': arguments['genre'],
+            'industry': arguments['industry'],
+            'timestamp': datetime.now().isoformat()
+        }, user)
+        
+        # Get search query using LLM
+        mood_info = music_app.get_search_query(mood_description, use_llm=True, user=user)
+        mood_normalized = mood_description.lower().strip()
+        
+        # Search YouTube (filter out the user's disliked videos, with genre and industry preference)
+        videos = music_app.search_youtube(mood_info['search_query'], mood_normalized=mood_normalized,
+                                          genre=arguments['genre'], industry=arguments['industry'],
+                                          session_id=arguments['session_id'], filters=arguments['filters'], user=user)
+    
+    if not videos:
+        error, status = music_app.no_videos_error()
+        return jsonify(error), status
     
-    # Get search query using LLM
-    mood_info = music_app.get_search_query(mood_description, use_llm=True)
-    search_query = mood_info['search_query']
-    mood_normalized = mood_description.lower().strip()
+    return jsonify(dict(interpretation_fields(mood_description, mood_info), videos=videos))
+
+@app.route('/api/search/stream', methods=['POST'])
+def search_music_stream():
+    """/api/search as newline-delimited JSON events: the interpretation as soon as the query is
+    known, then each video, then 'done' (or 'error'); see MoodMusicApp.search_events"""
+    arguments, error = search_request(request.json or {})
+    if error:
+        return jsonify(error[0]), error[1]
     
-    # Search YouTube (filter out disliked videos, with genre and industry preference)
-    videos = music_app.search_youtube(search_query, mood_normalized=mood_normalized, genre=genre, industry=industry)
+    def generate():
+        start = time.perf_counter()
+        ok = False
+        try:
+            for event in music_app.search_events(**arguments):
+                yield json.dumps(event) + '\n'
+                ok = event['type'] != 'error' or event['status'] < 500
+        finally:
+            music_app.metrics.observe('search_music_stream', time.perf_counter() - start, ok)
     
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/interpret/batch', methods=['POST'])
+def interpret_batch():
+    """API endpoint to interpret many mood descriptions at once (cache pre-warming, log replay)"""
+    data = request.json or {}
+    descriptions = data.get('descriptions')
+    if not isinstance(descriptions, list) or not all(isinstance(d, str) for d in descriptions):
+        return jsonify({'error': 'descriptions must be a list of strings'}), 400
+    descriptions = [d.strip() for d in descriptions if d.strip()]
+    if not descriptions:
+        return jsonify({'error': 'Please provide at least one mood description'}), 400
+    if len(descriptions) > BATCH_MAX_DESCRIPTIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_DESCRIPTIONS} descriptions per request'}), 400
+    
+    results = music_app.interpret_many(descriptions)
+    return jsonify({
+        'results': [dict(result, mood_description=d) for d, result in zip(descriptions, results)]
+    })
+
+@app.route('/api/more', methods=['POST'])
+def more_music():
+    """API endpoint serving the next videos for the session's last search, from the prefetch buffer"""
+    data = request.json or {}
+    videos = music_app.more_videos(data.get('session_id', ''))
+    
+    if videos is None:
+        return jsonify({'error': 'Your search has expired. Please search again.'}), 404
     if not videos:
-        return jsonify({'error': 'No videos found. Please check your API key or try a different mood description.'}), 500
+        return jsonify({'error': 'No more videos for this mood. Try describing it differently!'}), 404
     
+    return jsonify({'videos': videos})
+
+@app.route('/api/status', methods=['GET'])
+def status():
+    """API endpoint exposing cache, provider and circuit breaker status"""
     return jsonify({
-        'mood_description': mood_description,
-        'mood_label': mood_info.get('mood_label', mood_description),
-        'interpretation': mood_info.get('interpretation', mood_description),
-        'query': search_query,
-        'videos': videos
+        'youtube_cache': music_app.youtube_cache.stats(),
+        'youtube_quota': music_app.quota.snapshot(),
+        'search_sessions': len(music_app.sessions),
+        'video_details_cache': music_app.enricher.stats(),
+        'video_store': music_app.video_store.stats(),
+        'singleflight': {name: group.stats() for name, group in music_app.singleflight.items()},
+        'interpretation_cache': music_app.interpretation_cache.stats(),
+        'user_shards': music_app.users.stats(),
+        # The default (anonymous) user's index and dislike filter
+        'preference_index': music_app.default_user.preference_index.stats(),
+        'global_dislike_filter': (music_app.default_user.dislike_filter.stats()
+                                  if music_app.default_user.dislike_filter is not None else None),
+        'llm_providers': music_app.provider_stats.snapshot(),
+        'stages': music_app.metrics.snapshot(),
+        'circuit_breakers': {name: breaker.snapshot() for name, breaker in music_app.breakers.items()}
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: stage and LLM provider latency histograms, counters and a few gauges"""
+    gauges = {
+        'youtube_quota_remaining_units': ('YouTube Data API units left today', round(music_app.quota.remaining(), 1)),
+        'youtube_cache_hit_ratio': ('search.list page cache hit ratio', music_app.youtube_cache.stats()['hit_ratio']),
+        'interpretation_cache_hit_ratio': ('LLM interpretation cache hit ratio',
+                                           music_app.interpretation_cache.stats()['hit_ratio']),
+        'search_sessions': ('Live "more music" sessions', len(music_app.sessions)),
+        'user_shards_hot': ('User preference shards loaded in memory', music_app.users.stats()['hot']),
+        'circuit_breakers_open': ('Circuit breakers not closed',
+                                  sum(b.snapshot()['state'] != CLOSED for b in music_app.breakers.values()))
+    }
+    return Response(render_prometheus(music_app.metrics, music_app.provider_stats, gauges),
+                    mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/feedback', methods=['POST'])
 def submit_feedback():
     """API endpoint to submit feedback"""
@@ -463,10 +1143,15 @@ def submit_feedback():
     query = data.get('query', '')
     video_id = data.get('video_id', '')
     video_title = data.get('video_title', '')
+    video_channel = data.get('video_channel', '')
+    
+    user_id = request_user_id(data)
+    if user_id is None:
+        return jsonify({'error': 'Invalid user_id'}), 400
     
     if mood_description and feedback and query:
-        music_app.refine_keywords(mood_description, feedback, query, video_id, video_title)
-        music_app.save_preferences()
+        with music_app.users.checkout(user_id) as user:
+            music_app.refine_keywords(mood_description, feedback, query, video_id, video_title, video_channel, user)
         return jsonify({'success': True, 'message': 'Feedback recorded!'})
     
     return jsonify({'error': 'Invalid feedback data'}), 400
@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+"""
+Mood Music App - Async Version
+ASGI entry point that serves /api/search, /api/search/stream and /api/feedback on asyncio
+
+Run with:
+    uvicorn async_app:application --port 5000
+
+All other routes (the web page, /api/status, ...) are served by the Flask app
+through an ASGI adapter. Network calls go through one pooled keep-alive
+httpx.AsyncClient, so a single worker can hold many searches in flight.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+import httpx
+
+from circuit_breaker import CircuitOpenError
+from quota import QuotaExceededError, VIDEOS_LIST_COST
+from enrichment import VideoFilters, chunks
+from interpretation_cache import normalize_description
+from singleflight import AsyncSingleFlight
+from metrics import server_timing, timed
+from user_shards import UserShard, DEFAULT_USER
+from app import (app as flask_app, music_app, MoodMusicApp, request_user_id, search_request, interpretation_fields,
+                 YOUTUBE_SEARCH_URL, YOUTUBE_VIDEOS_URL, LLM_TIMEOUT)
+
+
+class AsyncMoodMusicApp:
+    """Async front end for a MoodMusicApp
+
+    Preferences, caches and parsing helpers are shared with the wrapped
+    MoodMusicApp; only the network I/O is done differently.
+    """
+
+    def __init__(self, base: MoodMusicApp, max_connections: int = 200):
+        self.base = base
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        self.metrics = base.metrics
+        self.inflight_interpretations = AsyncSingleFlight()
+        self.inflight_youtube = AsyncSingleFlight()
+        # Reported next to the sync app's groups on /api/status
+        base.singleflight['interpretations_async'] = self.inflight_interpretations
+        base.singleflight['youtube_async'] = self.inflight_youtube
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared keep-alive connection pool, created on first use inside the event loop"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=LLM_TIMEOUT,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=50)
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _interpret_with_gemini(self, mood_description: str) -> Dict[str, str]:
+        """Use Google Gemini API (free tier) without blocking the event loop"""
+        text = await asyncio.wait_for(
+            self.base.gemini.generate_async(self.base._gemini_prompt(mood_description)),
+            timeout=self.base.breakers['gemini'].timeout()
+        )
+        return self.base._parse_gemini_text(text)
+
+    async def _interpret_with_huggingface(self, mood_description: str) -> Optional[Dict[str, str]]:
+        """Use Hugging Face Inference API (free tier) on the shared async client"""
+        response = await self.client.post(
+            self.base.huggingface.url,
+            timeout=self.base.breakers['huggingface'].timeout(),
+            **self.base._huggingface_request(mood_description)
+        )
+        if response.status_code == 200:
+            return self.base._parse_huggingface_response(response.json())
+        return None
+
+    @timed('interpret_mood_with_llm')
+    async def interpret_mood_with_llm(self, mood_description: str) -> Dict[str, str]:
+        """Same fallback chain (or hedged race) as MoodMusicApp.interpret_mood_with_llm"""
+        cached = self.base.interpretation_cache.get(mood_description)
+        if cached:
+            return cached
+
+        key = normalize_description(mood_description) or mood_description
+        return dict(await self.inflight_interpretations.do(key, self._interpret_uncached, mood_description))
+
+    async def _interpret_uncached(self, mood_description: str) -> Dict[str, str]:
+        if self.base.llm_mode == 'race':
+            provider, result = await self._race_llm_providers(mood_description)
+            if provider != 'rules':
+                await asyncio.to_thread(self.base.interpretation_cache.put, mood_description, result)
+            return result
+
+        for name, interpret in self._llm_providers():
+            try:
+                result = await self._call_llm_provider(name, interpret, mood_description)
+                await asyncio.to_thread(self.base.interpretation_cache.put, mood_description, result)
+                return result
+            except Exception as e:
+                print(f"{name} failed, falling back: {e}")
+
+        return self.base._interpret_with_huggingface_public(mood_description)
+
+    def _llm_providers(self) -> List[Tuple[str, Callable]]:
+        """Configured LLM providers in order of preference"""
+        providers = []
+        if self.base.gemini_key:
+            providers.append(('gemini', self._interpret_with_gemini))
+        if self.base.huggingface_key:
+            providers.append(('huggingface', self._interpret_with_huggingface))
+        return providers
+
+    async def _call_llm_provider(self, name: str, interpret, mood_description: str) -> Dict[str, str]:
+        """Call one provider through its circuit breaker, recording its latency"""
+        breaker = self.base.breakers[name]
+        breaker.check()
+        start = time.perf_counter()
+        ok = cancelled = False
+        try:
+            result = await interpret(mood_description)
+            if not self.base._is_valid_interpretation(result):
+                raise ValueError(f"{name} returned no usable interpretation")
+            ok = True
+            return result
+        except asyncio.CancelledError:
+            cancelled = True  # lost the race: says nothing about the provider
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.base.provider_stats.record_call(name, elapsed, ok)
+            self.metrics.record_span(f"llm_{name}", elapsed)
+            if ok:
+                breaker.record_success(elapsed)
+            elif cancelled:
+                breaker.release()
+            else:
+                breaker.record_failure()
+
+    async def _race_llm_providers(self, mood_description: str) -> Tuple[str, Dict[str, str]]:
+        """Hedged race as in MoodMusicApp._race_llm_providers, but losers are actually cancelled"""
+        floor = self.base._interpret_with_huggingface_public(mood_description)
+        providers = self._llm_providers()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.base.llm_race_deadline
+        hedge_at = 0.0
+        pending = {}
+        launched = 0
+
+        try:
+            while launched < len(providers) or pending:
+                if launched < len(providers) and (not pending or loop.time() >= hedge_at):
+                    name, interpret = providers[launched]
+                    task = asyncio.ensure_future(self._call_llm_provider(name, interpret, mood_description))
+                    pending[task] = name
+                    launched += 1
+                    hedge_at = loop.time() + self.base.llm_hedge_delay
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                timeout = min(remaining, max(hedge_at - loop.time(), 0)) if launched < len(providers) else remaining
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        self.base.provider_stats.record_win(name)
+                        return name, task.result()
+                    print(f"{name} failed during LLM race: {task.exception()}")
+        finally:
+            for task in pending:
+                task.cancel()
+
+        self.base.provider_stats.record_win('rules')
+        return 'rules', floor
+
+    @asynccontextmanager
+    async def checkout_user(self, user_id: str):
+        """MoodMusicApp.users.checkout for the event loop: loading and evicting shards touch the disk"""
+        user = await asyncio.to_thread(self.base.users.acquire, user_id)
+        try:
+            yield user
+        finally:
+            await asyncio.to_thread(self.base.users.release, user_id)
+
+    @timed('get_search_query')
+    async def get_search_query(self, mood_description: str, user: Optional[UserShard] = None) -> Dict[str, str]:
+        """Get search query for YouTube based on mood description"""
+        learned = self.base._learned_query(mood_description, user)
+        if learned:
+            return learned
+        return await self.interpret_mood_with_llm(mood_description)
+
+    async def _fetch_youtube_page(self, query: str, max_results: int, category_id: str = '10') -> Dict:
+        """First search.list page, sharing the sync app's result cache"""
+        cache_key = (query, max_results, category_id, None)
+        page = self.base.youtube_cache.get(cache_key)
+        if page is None and self.base.quota.degraded:
+            page = self.base.youtube_cache.get_stale(cache_key)
+        if page is not None:
+            return page
+        try:
+            return await self.inflight_youtube.do(cache_key, self._request_youtube_page, cache_key)
+        except QuotaExceededError:
+            page = self.base.youtube_cache.get_stale(cache_key)
+            if page is None:
+                raise
+            return page
+
+    @timed('youtube_search_call')
+    async def _request_youtube_page(self, cache_key: Tuple) -> Dict:
+        query, max_results, category_id, _ = cache_key
+        breaker = self.base.breakers['youtube']
+        self.base._take_youtube_quota('interactive')
+        start = time.perf_counter()
+        try:
+            response = await self.client.get(
+                YOUTUBE_SEARCH_URL,
+                params=self.base._youtube_search_params(query, max_results, category_id),
+                timeout=breaker.timeout()
+            )
+            self.base._check_youtube_quota_response(response.status_code, response.text)
+            response.raise_for_status()
+            page = self.base._youtube_page(response.json())
+        except QuotaExceededError:
+            raise  # already resolved the breaker
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception:
+            # As in MoodMusicApp._request_youtube_page: a half-open probe always gets a verdict
+            breaker.record_failure()
+            raise
+        breaker.record_success(time.perf_counter() - start)
+        self.base.youtube_cache.set(cache_key, page)
+        await asyncio.to_thread(self.base._remember_page, query, None, page)
+        return page
+
+    @timed('youtube_videos_call')
+    async def _request_video_details(self, video_ids: List[str]):
+        breaker = self.base.breakers['youtube']
+        self.base._take_youtube_quota('interactive', VIDEOS_LIST_COST)
+        start = time.perf_counter()
+        try:
+            response = await self.client.get(
+                YOUTUBE_VIDEOS_URL,
+                params=self.base._videos_params(video_ids),
+                timeout=breaker.timeout()
+            )
+            self.base._check_youtube_quota_response(response.status_code, response.text)
+            response.raise_for_status()
+            items = response.json().get('items', [])
+        except QuotaExceededError:
+            raise  # already resolved the breaker
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception:
+            # As in MoodMusicApp._request_youtube_page: a half-open probe always gets a verdict
+            breaker.record_failure()
+            raise
+        breaker.record_success(time.perf_counter() - start)
+        await asyncio.to_thread(self.base.enricher.store_response, video_ids, items)
+
+    @timed('enrich_videos')
+    async def enrich_videos(self, videos: List[Dict]) -> List[Dict]:
+        """Add duration / view counts; the videos.list batches run concurrently"""
+        if not self.base.enrichment or not self.base.api_key:
+            return videos
+        try:
+            missing = await asyncio.to_thread(self.base.enricher.missing, [v['video_id'] for v in videos])
+        except sqlite3.Error as e:
+            print(f"Error reading video details: {e}")
+            return self.base.enricher.apply(videos)
+        results = await asyncio.gather(*(self._request_video_details(batch) for batch in chunks(missing)),
+                                       return_exceptions=True)
+        for error in results:
+            if isinstance(error, (httpx.HTTPError, ValueError, CircuitOpenError, QuotaExceededError, sqlite3.Error)):
+                print(f"Error fetching video details: {error}")
+            elif isinstance(error, BaseException):
+                raise error
+        return self.base.enricher.apply(videos)
+
+    async def _filter_videos(self, items: List[Dict], max_results: int, mood_normalized: str = None,
+                             filters: Optional[VideoFilters] = None, user: Optional[UserShard] = None) -> List[Dict]:
+        videos = await self.enrich_videos(self.base._candidate_videos(items, mood_normalized, user))
+        return self.base._select_videos(videos, max_results, mood_normalized, filters, user)
+
+    @timed('search_youtube')
+    async def search_youtube(self, query: str, max_results: int = 5, mood_normalized: str = None,
+                             genre: str = None, industry: str = None, session_id: str = None,
+                             filters: Optional[VideoFilters] = None, user: Optional[UserShard] = None) -> List[Dict]:
+        """Search YouTube for music videos for a user; with a session_id the rest is kept for /api/more"""
+        if not self.base.api_key:
+            return []
+
+        query = self.base._compose_query(query, genre, industry)
+        page = await self._search_page(query, max_results)
+        if not page['items']:
+            return []
+        if not session_id:
+            return await self._filter_videos(page['items'], max_results, mood_normalized, filters, user)
+        # Follow-up pages are prefetched on the sync app's worker threads
+        ranked = await self._filter_videos(page['items'], len(page['items']), mood_normalized, filters, user)
+        self.base.start_session(session_id, query, max_results * 2, mood_normalized, ranked[:max_results],
+                                ranked[max_results:], page['next_page_token'], filters, user)
+        return ranked[:max_results]
+
+    async def _search_page(self, query: str, max_results: int) -> Dict:
+        """First results page for a composed query, or the stored one if YouTube cannot be reached"""
+        try:
+            return await self._fetch_youtube_page(query, max_results * 2)
+        except (httpx.HTTPError, ValueError, CircuitOpenError, QuotaExceededError) as e:
+            print(f"Error searching YouTube: {e}")
+            return await asyncio.to_thread(self.base._stored_page, query)
+
+    async def stream_youtube(self, query: str, max_results: int = 5, mood_normalized: str = None,
+                             genre: str = None, industry: str = None, session_id: str = None,
+                             filters: Optional[VideoFilters] = None,
+                             user: Optional[UserShard] = None) -> AsyncIterator[Dict]:
+        """MoodMusicApp.stream_youtube on the event loop"""
+        if not self.base.api_key:
+            return
+        query = self.base._compose_query(query, genre, industry)
+        page = await self._search_page(query, max_results)
+        if not page['items']:
+            return
+        filters = filters or self.base.video_filters
+        keep = len(page['items']) if session_id else max_results
+        candidates = self.base._candidate_videos(page['items'], mood_normalized, user)
+
+        if filters.active:
+            ranked = self.base._select_videos(await self.enrich_videos(candidates), keep, mood_normalized, filters, user)
+            for video in ranked[:max_results]:
+                yield {'type': 'video', 'video': video}
+        else:
+            ranked = self.base._select_videos(candidates, keep, mood_normalized, filters, user)
+            sent = [dict(video) for video in ranked[:max_results]]
+            for video in sent:
+                yield {'type': 'video', 'video': video}
+            await self.enrich_videos(ranked)
+            for before, video in zip(sent, ranked):
+                if video != before:
+                    yield {'type': 'details', 'video': video}
+
+        if session_id:
+            self.base.start_session(session_id, query, max_results * 2, mood_normalized, ranked[:max_results],
+                                    ranked[max_results:], page['next_page_token'], filters, user)
+
+    async def search_events(self, mood_description: str, genre: str = 'any', industry: str = 'any',
+                            user_id: str = DEFAULT_USER, filters: Optional[VideoFilters] = None,
+                            session_id: str = None) -> AsyncIterator[Dict]:
+        """MoodMusicApp.search_events on the event loop"""
+        count = 0
+        async with self.checkout_user(user_id) as user:
+            await asyncio.to_thread(self.base.record_mood, {
+                'mood': mood_description,
+                'genre': genre,
+                'industry': industry,
+                'timestamp': datetime.now().isoformat()
+            }, user)
+            mood_info = await self.get_search_query(mood_description, user)
+            yield {'type': 'interpretation', **interpretation_fields(mood_description, mood_info)}
+
+            async for event in self.stream_youtube(mood_info['search_query'],
+                                                   mood_normalized=mood_description.lower().strip(), genre=genre,
+                                                   industry=industry, session_id=session_id, filters=filters,
+                                                   user=user):
+                count += event['type'] == 'video'
+                yield event
+
+        if not count:
+            error, status = self.base.no_videos_error()
+            yield {'type': 'error', **error, 'status': status}
+            return
+        yield {'type': 'done', 'videos': count}
+
+    async def search_music(self, data: Dict) -> Tuple[Dict, int]:
+        """Handler for POST /api/search"""
+        arguments, error = search_request(data)
+        if error:
+            return error
+        mood_description = arguments['mood_description']
+
+        async with self.checkout_user(arguments['user_id']) as user:
+            await asyncio.to_thread(self.base.record_mood, {
+                'mood': mood_description,
+                'genre': arguments['genre'],
+                'industry': arguments['industry'],
+                'timestamp': datetime.now().isoformat()
+            }, user)
+
+            mood_info = await self.get_search_query(mood_description, user)
+            mood_normalized = mood_description.lower().strip()
+
+            videos = await self.search_youtube(mood_info['search_query'], mood_normalized=mood_normalized,
+                                               genre=arguments['genre'], industry=arguments['industry'],
+                                               session_id=arguments['session_id'], filters=arguments['filters'],
+                                               user=user)
+        if not videos:
+            return self.base.no_videos_error()
+
+        return dict(interpretation_fields(mood_description, mood_info), videos=videos), 200
+
+    async def search_music_stream(self, data: Dict) -> Tuple[Union[Dict, AsyncIterator[Dict]], int]:
+        """Handler for POST /api/search/stream: the events, or an error body if the request is invalid"""
+        arguments, error = search_request(data)
+        if error:
+            return error
+        return self.search_events(**arguments), 200
+
+    async def submit_feedback(self, data: Dict) -> Tuple[Dict, int]:
+        """Handler for POST /api/feedback"""
+        mood_description = data.get('mood_description', '')
+        feedback = data.get('feedback', '')
+        query = data.get('query', '')
+        video_id = data.get('video_id', '')
+        video_title = data.get('video_title', '')
+        video_channel = data.get('video_channel', '')
+
+        user_id = request_user_id(data)
+        if user_id is None:
+            return {'error': 'Invalid user_id'}, 400
+
+        if mood_description and feedback and query:
+            async with self.checkout_user(user_id) as user:
+                # Waiting for the store's lock and the save run in a worker thread so they never stall other requests
+                await asyncio.to_thread(self.base.refine_keywords, mood_description, feedback, query, video_id,
+                                        video_title, video_channel, user)
+            return {'success': True, 'message': 'Feedback recorded!'}, 200
+
+        return {'error': 'Invalid feedback data'}, 400
+
+
+async_music_app = AsyncMoodMusicApp(music_app, max_connections=int(os.getenv('HTTP_POOL_SIZE', '200')))
+
+ROUTES = {
+    ('POST', '/api/search'): async_music_app.search_music,
+    ('POST', '/api/feedback'): async_music_app.submit_feedback,
+    ('POST', '/api/search/stream'): async_music_app.search_music_stream,
+}
+
+_wsgi_fallback = None
+
+
+def _flask_asgi():
+    """Flask app wrapped for ASGI, for every route not handled natively"""
+    global _wsgi_fallback
+    if _wsgi_fallback is None:
+        from asgiref.wsgi import WsgiToAsgi
+        _wsgi_fallback = WsgiToAsgi(flask_app)
+    return _wsgi_fallback
+
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _send_json(send, payload: Dict, status: int = 200, timing: Optional[str] = None):
+    body = json.dumps(payload).encode('utf-8')
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+        (b'access-control-allow-origin', b'*'),
+    ]
+    if timing:
+        headers.append((b'server-timing', timing.encode('latin-1')))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': headers
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_stream(send, events: AsyncIterator[Dict]) -> int:
+    """Send events as newline-delimited JSON, one chunk each; returns the status of an error event (or 200)"""
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'application/x-ndjson'),
+            (b'cache-control', b'no-cache'),
+            (b'access-control-allow-origin', b'*'),
+        ]
+    })
+    status = 200
+    try:
+        async for event in events:
+            if event['type'] == 'error':
+                status = event['status']
+            await send({'type': 'http.response.body', 'body': (json.dumps(event) + '\n').encode('utf-8'),
+                        'more_body': True})
+    finally:
+        await events.aclose()
+    await send({'type': 'http.response.body', 'body': b''})
+    return status
+
+
+async def application(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_music_app.aclose()
+                await asyncio.to_thread(music_app.save_preferences)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    handler = ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    if handler is None:
+        return await _flask_asgi()(scope, receive, send)
+
+    try:
+        data = json.loads(await _read_body(receive) or b'{}')
+    except ValueError:
+        return await _send_json(send, {'error': 'Invalid JSON body'}, 400)
+    if not isinstance(data, dict):
+        return await _send_json(send, {'error': 'Invalid JSON body'}, 400)
+
+    # Timed like the Flask routes: one stage per handler plus the spans for Server-Timing
+    token = music_app.metrics.begin_request()
+    start = time.perf_counter()
+    status = 500
+    try:
+        payload, status = await handler(data)
+        if not isinstance(payload, dict):
+            # A stream of events; it is timed to its end, and the Server-Timing header is already gone
+            status = 500
+            status = await _send_stream(send, payload)
+            return
+    finally:
+        music_app.metrics.observe(handler.__name__, time.perf_counter() - start, status < 500)
+        spans = music_app.metrics.end_request(token)
+    await _send_json(send, payload, status, server_timing(spans) if music_app.server_timing and spans else None)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: per-call provider setup cost before and after llm_providers.py
+
+Usage:
+    python benchmarks/bench_llm_providers.py
+
+No requests are sent. "first call" is the cost the first mood request pays in
+a fresh process (import + configure + model); "per call" is what every later
+request paid when _interpret_with_gemini rebuilt the model each time, versus
+reading the provider's cached model.
+"""
+
+import os
+import sys
+import timeit
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_providers import GeminiProvider, HuggingFaceProvider  # noqa: E402
+
+API_KEY = 'benchmark-key'
+PROMPT = 'feeling calm but a little nostalgic'
+
+FIRST_CALL = """
+import time
+start = time.perf_counter()
+import google.generativeai as genai
+genai.configure(api_key='benchmark-key')
+genai.GenerativeModel('gemini-pro')
+print(time.perf_counter() - start)
+"""
+
+
+def legacy_gemini_setup():
+    """What _interpret_with_gemini did before every generate_content call"""
+    import google.generativeai as genai
+    genai.configure(api_key=API_KEY)
+    return genai.GenerativeModel('gemini-pro')
+
+
+def legacy_huggingface_request():
+    """Headers and payload rebuilt per call, as _huggingface_request did"""
+    headers = {
+        "Authorization": f"Bearer {API_KEY}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "inputs": PROMPT,
+        "parameters": {"max_new_tokens": 150, "temperature": 0.7, "return_full_text": False}
+    }
+    return {'headers': headers, 'json': payload}
+
+
+def best_of(fn, number=2000, repeat=5):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def run():
+    results = {}
+    try:
+        import google.generativeai  # noqa: F401
+    except ImportError:
+        print("google-generativeai is not installed; skipping the Gemini measurements")
+    else:
+        first = subprocess.run([sys.executable, '-c', FIRST_CALL], capture_output=True, text=True, check=True)
+        results['gemini_first_call_ms'] = float(first.stdout.strip()) * 1e3
+        provider = GeminiProvider(API_KEY)
+        provider.model
+        results['gemini_legacy_us'] = best_of(legacy_gemini_setup, number=200)
+        results['gemini_cached_us'] = best_of(lambda: provider.model)
+
+    huggingface = HuggingFaceProvider(API_KEY)
+    results['huggingface_legacy_us'] = best_of(legacy_huggingface_request)
+    results['huggingface_cached_us'] = best_of(lambda: huggingface.request(PROMPT))
+    return results
+
+
+if __name__ == '__main__':
+    results = run()
+    if 'gemini_first_call_ms' in results:
+        print(f"gemini, first call in a new process: {results['gemini_first_call_ms']:10.1f} ms")
+        print(f"gemini, per call, rebuilt:           {results['gemini_legacy_us']:10.2f} us")
+        print(f"gemini, per call, cached provider:   {results['gemini_cached_us']:10.2f} us"
+              f"  ({results['gemini_legacy_us'] / results['gemini_cached_us']:.0f}x)")
+    print(f"huggingface request, rebuilt:        {results['huggingface_legacy_us']:10.2f} us")
+    print(f"huggingface request, cached headers: {results['huggingface_cached_us']:10.2f} us")
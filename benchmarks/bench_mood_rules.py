@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: compiled rule interpreter (mood_rules.py) vs the original
+keyword loop it replaced.
+
+Usage:
+    python benchmarks/bench_mood_rules.py                 # synthetic corpus
+    python benchmarks/bench_mood_rules.py moods.txt       # your own load, one description per line
+    python benchmarks/bench_mood_rules.py --changes       # also list every label that changed
+
+"cold" interprets every distinct description once with the memo cleared, so
+it measures the matcher itself; that is the headline number. "replay" runs the
+corpus as given (repeats included) with the memo, which is what a live server
+sees. The distinct descriptions whose label differs from the old interpreter
+are reported too (on the synthetic corpus nearly all of them because keywords
+now match whole words only: "unhappy" is not "happy", and "working" is not
+also "work"); tests/test_mood_rules.py pins the labels.
+"""
+
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mood_rules  # noqa: E402
+
+NEGATION_WORDS = ['not', 'nor', 'neither', "don't", "doesn't", "isn't", "aren't", "won't", "can't"]
+
+
+def legacy_interpret(mood_description):
+    """The original substring-scanning interpreter from app.py, kept for comparison"""
+    mood_lower = mood_description.lower()
+    has_negation = any(neg in mood_lower for neg in NEGATION_WORDS)
+    mood_keywords = {mood: list(keywords) for mood, keywords in mood_rules.MOOD_KEYWORDS.items()}
+    mood_scores = {}
+    for mood, keywords in mood_keywords.items():
+        score = 0
+        for keyword in keywords:
+            if keyword in mood_lower:
+                keyword_index = mood_lower.find(keyword)
+                if keyword_index > 0:
+                    context = mood_lower[max(0, keyword_index - 15):keyword_index]
+                    if any(neg in context for neg in NEGATION_WORDS):
+                        score -= 2
+                    else:
+                        score += 1
+                else:
+                    score += 1
+        mood_scores[mood] = score
+    max_score = max(mood_scores.values())
+    detected_mood = max(mood_scores, key=mood_scores.get) if max_score > 0 else 'neutral'
+    return {
+        'mood_label': detected_mood,
+        'search_query': mood_rules.MOOD_QUERIES[detected_mood],
+        'interpretation': 'negation' if has_negation else detected_mood
+    }
+
+
+VOCABULARY = [k for keywords in mood_rules.MOOD_KEYWORDS.values() for k in keywords] + [
+    'feeling', 'really', 'today', 'after', 'tired', 'kind', 'of', 'want', 'music', 'for',
+    'my', 'and', 'not', 'but', 'so', 'a', 'little', 'bit', 'evening', 'rainy']
+
+
+def synthetic_corpus(size=5000, distinct=300, seed=42):
+    """Zipf-ish replay of a few hundred distinct descriptions"""
+    rnd = random.Random(seed)
+    distinct_moods = [' '.join(rnd.choice(VOCABULARY) for _ in range(rnd.randint(2, 10))) for _ in range(distinct)]
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    return rnd.choices(distinct_moods, weights=weights, k=size)
+
+
+def distinct_descriptions(count=5000, seed=43):
+    """count different descriptions from the synthetic vocabulary, for measuring never-seen input"""
+    rnd = random.Random(seed)
+    descriptions = {}
+    while len(descriptions) < count:
+        descriptions[' '.join(rnd.choice(VOCABULARY) for _ in range(rnd.randint(2, 10)))] = None
+    return list(descriptions)
+
+
+def best_of(fn, corpus, repeat=5):
+    return min(timeit.repeat(lambda: [fn(d) for d in corpus], number=1, repeat=repeat)) / len(corpus) * 1e6
+
+
+def run(corpus):
+    unique = list(dict.fromkeys(corpus))
+    changes = [{'description': d, 'legacy': legacy_interpret(d)['mood_label'],
+                'compiled': mood_rules.interpret(d)['mood_label']} for d in unique]
+    changes = [c for c in changes if c['legacy'] != c['compiled']]
+
+    def cold(description):
+        mood_rules._interpret_cached.cache_clear()
+        return mood_rules.interpret(description)
+
+    results = {
+        'labels_changed': len(changes),
+        'label_changes': changes,
+        'corpus_size': len(corpus),
+        'distinct': len(unique),
+        'legacy_us': best_of(legacy_interpret, corpus),
+        'compiled_cold_us': best_of(cold, unique),
+        'compiled_replay_us': best_of(mood_rules.interpret, corpus),
+    }
+    results['cold_speedup'] = results['legacy_us'] / results['compiled_cold_us']
+    results['replay_speedup'] = results['legacy_us'] / results['compiled_replay_us']
+    return results
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if a != '--changes']
+    if args:
+        with open(args[0], 'r', encoding='utf-8') as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        corpus = synthetic_corpus()
+
+    results = run(corpus)
+    print(f"corpus: {results['corpus_size']} descriptions ({results['distinct']} distinct, "
+          f"{results['labels_changed']} labelled differently from the legacy interpreter)")
+    print(f"legacy interpreter:      {results['legacy_us']:8.2f} us/call")
+    print(f"compiled, cold:          {results['compiled_cold_us']:8.2f} us/call  ({results['cold_speedup']:.1f}x)")
+    print(f"compiled, replayed load: {results['compiled_replay_us']:8.2f} us/call  "
+          f"({results['replay_speedup']:.1f}x, memoized)")
+    if '--changes' in sys.argv:
+        for change in results['label_changes']:
+            print(f"  {change['legacy']:>9s} -> {change['compiled']:<9s} {change['description']}")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: local ranking stage (ranking.py) on one YouTube candidate batch
+
+Usage:
+    python benchmarks/bench_ranking.py [candidates] [feedback_per_mood]
+
+Measures Ranker.rank() for a 50-candidate batch against a mood with a few
+hundred liked/disliked videos, with the mood profile already cached (the
+steady state of a live server). Exits 1 if the median exceeds 1 ms.
+"""
+
+import os
+import sys
+import random
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ranking  # noqa: E402
+from preference_model import PreferenceModel  # noqa: E402
+
+WORDS = ['lofi', 'chill', 'beats', 'study', 'sad', 'piano', 'rain', 'night', 'jazz', 'acoustic', 'cover',
+         'live', 'remix', 'bollywood', 'romantic', 'workout', 'mix', 'ambient', 'guitar', 'hits', 'playlist',
+         'relaxing', 'sleep', 'focus', 'calm', 'summer', 'road', 'trip', 'love', 'heartbreak']
+CHANNELS = [f'Channel {i}' for i in range(40)]
+
+
+def synthetic_batch(candidates=50, feedback=300, seed=7):
+    rnd = random.Random(seed)
+    now = datetime.now()
+
+    def video(i):
+        return {
+            'video_id': f'vid{i:06d}',
+            'title': ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 8))),
+            'channel': rnd.choice(CHANNELS),
+            'timestamp': (now - timedelta(days=rnd.uniform(0, 120))).isoformat()
+        }
+
+    entry = {
+        'liked_videos': [video(i) for i in range(feedback)],
+        'disliked_videos': [video(feedback + i) for i in range(feedback // 3)]
+    }
+    batch = [video(10 ** 5 + i) for i in range(candidates)]
+    disliked_elsewhere = {v['video_id'] for v in rnd.sample(batch, max(1, candidates // 10))}
+    return entry, batch, (lambda video_id: 1 if video_id in disliked_elsewhere else 0)
+
+
+def run(candidates=50, feedback=300, iterations=2000):
+    entry, batch, dislike_counts = synthetic_batch(candidates, feedback)
+    model = PreferenceModel()
+    model.ensure_model(entry)  # seeded from the liked/disliked videos once, as for entries that predate the model
+    ranker = ranking.Ranker(model)
+    start = time.perf_counter()
+    ranker.profile('bench', entry)
+    profile_ms = (time.perf_counter() - start) * 1e3
+    ranker.rank(batch, 5, 'bench', entry, dislike_counts)
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        ranker.rank(batch, 5, 'bench', entry, dislike_counts)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        'candidates': candidates,
+        'feedback': len(entry['liked_videos']) + len(entry['disliked_videos']),
+        'profile_build_ms': profile_ms,
+        'p50_us': samples[len(samples) // 2],
+        'p99_us': samples[int(len(samples) * 0.99)]
+    }
+
+
+if __name__ == '__main__':
+    if ranking.np is None:
+        print("numpy is not installed; ranking is disabled")
+        sys.exit(0)
+    args = [int(a) for a in sys.argv[1:3]]
+    results = run(*args)
+    print(f"{results['candidates']} candidates, {results['feedback']} feedback entries for the mood")
+    print(f"profile build (once per mood/feedback change): {results['profile_build_ms']:8.2f} ms")
+    print(f"rank(), p50:                                   {results['p50_us']:8.1f} us")
+    print(f"rank(), p99:                                   {results['p99_us']:8.1f} us")
+    sys.exit(0 if results['p50_us'] < 1000 else 1)
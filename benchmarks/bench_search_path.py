@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: per-search work in app.py that does not wait on the network
+
+Usage:
+    python benchmarks/bench_search_path.py [moods] [dislikes,...]
+
+Runs a MoodMusicApp (in a temporary directory, no API keys) against a user
+whose refined_keywords has `moods` moods with liked queries, and measures:
+    interpret_public   - _interpret_with_huggingface_public over 5000 distinct
+                         descriptions with the memo cleared (the no-LLM
+                         fallback on descriptions it has not seen)
+    learned_query      - get_search_query for a mood with liked queries
+    unlearned_query    - get_search_query for an unknown mood (use_llm=False)
+    filter_<n>         - _filter_videos on a 50-video search page for a mood
+                         with n disliked videos (and as many disliked under
+                         other moods), i.e. everything search_youtube does
+                         with a page once it has arrived
+"""
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import mood_rules  # noqa: E402
+from bench_mood_rules import distinct_descriptions  # noqa: E402
+
+WORDS = ['lofi', 'chill', 'beats', 'study', 'sad', 'piano', 'rain', 'night', 'jazz', 'acoustic', 'cover',
+         'live', 'remix', 'romantic', 'workout', 'mix', 'ambient', 'guitar', 'hits', 'playlist']
+
+
+def best_of(fn, number=200, repeat=5):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def synthetic_video(rnd, video_id, now):
+    return {
+        'video_id': video_id,
+        'title': ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 7))),
+        'channel': f'Channel {rnd.randint(0, 199)}',
+        'timestamp': (now - timedelta(days=rnd.uniform(0, 120))).isoformat()
+    }
+
+
+def synthetic_user(shard, moods, dislikes, seed=11):
+    """Fill a UserShard with `moods` learned moods plus a 'rainy night' mood with `dislikes` dislikes"""
+    rnd = random.Random(seed)
+    now = datetime.now()
+    model = shard.preference_model
+    refined = shard.preferences['refined_keywords']
+    for m in range(moods):
+        entry = shard.refined_entry(f'mood {m}')
+        for q in range(3):
+            query = f'mood {m} query {q}'
+            entry['successful_queries'].append(query)
+            model.update(entry, 'like' if rnd.random() < 0.8 else 'dislike', query)
+        entry['liked_videos'] = [synthetic_video(rnd, f'like-{m}-{i}', now) for i in range(5)]
+    entry = shard.refined_entry('rainy night')
+    entry['successful_queries'].append('rainy night piano')
+    entry['disliked_videos'] = [synthetic_video(rnd, f'dis-{i}', now) for i in range(dislikes)]
+    entry['liked_videos'] = [synthetic_video(rnd, f'fav-{i}', now) for i in range(200)]
+    # As many videos disliked under other moods, spread over them
+    for i in range(dislikes):
+        refined[f'mood {i % max(1, moods)}']['disliked_videos'].append(synthetic_video(rnd, f'other-{i}', now))
+    shard.preference_index.rebuild(refined)
+    if shard.dislike_filter_capacity is not None:
+        shard.rebuild_dislike_filter()
+
+
+def search_page(dislikes, size=50, seed=5):
+    """50 cards: mostly new videos, some disliked for the mood, some disliked elsewhere"""
+    rnd = random.Random(seed)
+    cards = []
+    for i in range(size):
+        roll = rnd.random()
+        video_id = (f'dis-{rnd.randrange(dislikes)}' if roll < 0.1 and dislikes else
+                    f'other-{rnd.randrange(dislikes)}' if roll < 0.2 and dislikes else f'new-{i}')
+        cards.append({
+            'title': ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 7))),
+            'video_id': video_id,
+            'url': f'https://www.youtube.com/watch?v={video_id}',
+            'thumbnail': '',
+            'channel': f'Channel {rnd.randint(0, 199)}'
+        })
+    return cards
+
+
+def run(moods=5000, dislike_sizes=(1000, 10000, 100000)):
+    workdir = tempfile.mkdtemp(prefix='moodmusic-bench-')
+    cwd = os.getcwd()
+    os.environ.update({'YOUTUBE_API_KEY': '', 'GEMINI_API_KEY': '', 'HUGGINGFACE_API_KEY': '',
+                       'GLOBAL_DISLIKE_FILTER': 'true', 'PREFERENCES_BACKEND': 'json'})
+    os.chdir(workdir)
+    try:
+        import app
+        music_app = app.music_app
+        results = {'moods': moods}
+
+        corpus = distinct_descriptions(5000)
+
+        def interpret_corpus():
+            mood_rules._interpret_cached.cache_clear()
+            return [music_app._interpret_with_huggingface_public(d) for d in corpus]
+
+        results['interpret_public_us'] = best_of(interpret_corpus, number=1) / len(corpus)
+
+        for dislikes in dislike_sizes:
+            shard = music_app._open_user(f'bench-{dislikes}')
+            synthetic_user(shard, moods, dislikes)
+            if dislikes == dislike_sizes[0]:
+                results['learned_query_us'] = best_of(
+                    lambda: music_app.get_search_query('mood 42', use_llm=False, user=shard), number=2000)
+                results['unlearned_query_us'] = best_of(
+                    lambda: music_app.get_search_query('something new', use_llm=False, user=shard), number=2000)
+            page = search_page(dislikes)
+            kept = music_app._filter_videos(page, 5, 'rainy night', user=shard)
+            assert not any(v['video_id'].startswith(('dis-', 'other-')) for v in kept)
+            results[f'filter_{dislikes}_us'] = best_of(
+                lambda: music_app._filter_videos(page, 5, 'rainy night', user=shard))
+            shard.close()
+        music_app.users.close()
+        music_app.video_store.close()
+        return results
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    moods = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    sizes = tuple(int(n) for n in sys.argv[2].split(',')) if len(sys.argv) > 2 else (1000, 10000, 100000)
+    results = run(moods, sizes)
+    print(f"{results['moods']} learned moods")
+    print(f"_interpret_with_huggingface_public:    {results['interpret_public_us']:10.2f} us/call")
+    print(f"get_search_query, learned mood:        {results['learned_query_us']:10.2f} us")
+    print(f"get_search_query, unknown mood:        {results['unlearned_query_us']:10.2f} us")
+    for n in sizes:
+        print(f"_filter_videos, {n:7d} dislikes:       {results[f'filter_{n}_us']:10.2f} us per 50-video page")
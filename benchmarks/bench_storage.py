@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark: preference persistence at 10k / 100k / 1M feedback events
+
+Usage:
+    python benchmarks/bench_storage.py [sizes] [backends]
+    python benchmarks/bench_storage.py 10000,100000 json,sqlite
+
+For each backend and history size, a store is filled with that many
+feedback events (plus one mood event each) spread over 200 moods, then:
+    write_s      - the initial full save (what a migration does)
+    load_s       - load() in a fresh store, i.e. app startup
+    feedback_ms  - one more feedback event through UserShard.refine_keywords,
+                   i.e. everything /api/feedback does after its lookup
+                   (median of up to 20, fewer when each takes seconds)
+    size_mb      - bytes on disk
+The journal is compacted after the initial write, so load_s is the
+snapshot plus an empty tail.
+"""
+
+import os
+import sys
+import gc
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import (JSONPreferenceStore, JournalPreferenceStore, SQLitePreferenceStore,  # noqa: E402
+                     empty_preferences)
+from preference_model import PreferenceModel  # noqa: E402
+from user_shards import UserShard  # noqa: E402
+
+MOODS = 200
+BACKENDS = ('json', 'sqlite', 'journal')
+SIZES = (10000, 100000, 1000000)
+
+
+def feedback_events(count, seed=3):
+    """Reproducible (mood_entry, feedback_entry) pairs"""
+    rnd = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        mood = f'mood {rnd.randrange(MOODS)}'
+        timestamp = (start + timedelta(seconds=i * 30)).isoformat()
+        yield {'mood': mood, 'genre': '', 'industry': '', 'timestamp': timestamp}, {
+            'mood': mood,
+            'mood_normalized': mood,
+            'feedback': 'like' if rnd.random() < 0.7 else 'dislike',
+            'query': f'{mood} query {rnd.randrange(5)}',
+            'video_id': f'vid{i:08d}',
+            'video_title': f'Video {i}',
+            'video_channel': f'Channel {rnd.randrange(500)}',
+            'timestamp': timestamp
+        }
+
+
+def refined_keywords(seed=4):
+    """The per-mood state (capped lists, like a long-running install)"""
+    rnd = random.Random(seed)
+    refined = {}
+    for m in range(MOODS):
+        videos = lambda kind, n: [{'video_id': f'{kind}-{m}-{i}', 'title': f'Video {i}', 'channel': 'c',
+                                   'timestamp': '2024-01-01T00:00:00'} for i in range(n)]
+        refined[f'mood {m}'] = {
+            'liked_keywords': [], 'disliked_keywords': [],
+            'successful_queries': [f'mood {m} query {q}' for q in range(5)],
+            'liked_videos': videos('l', rnd.randint(20, 100)),
+            'disliked_videos': videos('d', rnd.randint(5, 40))
+        }
+    return refined
+
+
+def open_store(backend, root):
+    if backend == 'json':
+        return JSONPreferenceStore(os.path.join(root, 'prefs.json'))
+    if backend == 'sqlite':
+        return SQLitePreferenceStore(os.path.join(root, 'prefs.db'))
+    return JournalPreferenceStore(os.path.join(root, 'journal'), start_compactor=False)
+
+
+def disk_bytes(root):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+
+
+def measure(backend, size):
+    root = tempfile.mkdtemp(prefix='moodmusic-storage-')
+    try:
+        store = open_store(backend, root)
+        preferences = empty_preferences()
+        preferences['refined_keywords'] = refined_keywords()
+        start = time.perf_counter()
+        for mood_entry, feedback_entry in feedback_events(size):
+            if store.retain_history:
+                preferences['mood_history'].append(mood_entry)
+                preferences['feedback_history'].append(feedback_entry)
+            store.record_mood(mood_entry)
+            store.record_feedback(feedback_entry)
+        store.save(preferences)
+        if backend == 'journal':
+            store.compact(force=True)
+        write_s = time.perf_counter() - start
+        store.close()
+        del preferences
+        gc.collect()
+
+        store = open_store(backend, root)
+        start = time.perf_counter()
+        preferences = store.load()
+        load_s = time.perf_counter() - start
+        del preferences
+        gc.collect()
+
+        # The shard loads the store again and indexes it, as the app does for a user's first request
+        shard = UserShard('bench', store, os.path.join(root, 'preference_index.json'), PreferenceModel())
+        samples = []
+        for _, event in feedback_events(20, seed=99):
+            start = time.perf_counter()
+            shard.refine_keywords(event['mood'], event['feedback'], event['query'], event['video_id'],
+                                  event['video_title'], event['video_channel'])
+            samples.append(time.perf_counter() - start)
+            if len(samples) >= 3 and sum(samples) > 10:
+                break
+        shard.close()
+        samples.sort()
+        return {
+            'write_s': write_s,
+            'load_s': load_s,
+            'feedback_ms': samples[len(samples) // 2] * 1e3,
+            'size_mb': disk_bytes(root) / 1e6
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        gc.collect()
+
+
+def run(sizes=SIZES, backends=BACKENDS):
+    results = {}
+    for backend in backends:
+        for size in sizes:
+            results[f'{backend}_{size}'] = measure(backend, size)
+    return results
+
+
+if __name__ == '__main__':
+    sizes = tuple(int(n) for n in sys.argv[1].split(',')) if len(sys.argv) > 1 else SIZES
+    backends = tuple(sys.argv[2].split(',')) if len(sys.argv) > 2 else BACKENDS
+    print(f"{'backend':8s} {'events':>8s} {'write s':>9s} {'load s':>9s} {'feedback ms':>12s} {'MB':>8s}")
+    for backend in backends:
+        for size in sizes:
+            r = measure(backend, size)
+            print(f"{backend:8s} {size:8d} {r['write_s']:9.2f} {r['load_s']:9.3f} {r['feedback_ms']:12.2f} "
+                  f"{r['size_mb']:8.1f}")
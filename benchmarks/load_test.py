@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Load test: /api/search and /api/feedback at a fixed request rate
+
+Usage:
+    python benchmarks/load_test.py --start flask [--rps 20] [--duration 30] [--feedback 0.3]
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 [--rps 20] ...
+
+With --start (flask or asgi) the stand-in APIs (standin_server.py) and the
+app are started on free local ports in a temporary directory, so nothing
+leaves the machine and no preference files are touched; otherwise --url
+names a running server.
+
+Requests are sent open-loop: request i is due at i / rps seconds whatever
+earlier responses are doing, and its latency is counted from that moment,
+so a slow server shows up as higher percentiles rather than fewer requests.
+A --feedback fraction of the requests posts a like or dislike for a video
+from an earlier search. Mood descriptions, users and feedback come from a
+generator seeded with --seed, so runs are repeatable.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FEELINGS = ['happy', 'sad', 'calm', 'pumped up', 'nostalgic', 'focused', 'romantic', 'angry', 'lonely', 'sleepy']
+CONTEXTS = ['on a rainy evening', 'before a workout', 'while studying', 'after a long day', 'on a road trip',
+            'at a party', 'in the morning', 'missing home', 'with friends', 'cooking dinner']
+GENRES = ['', 'pop', 'rock', 'jazz', 'lo-fi', 'classical']
+
+
+def descriptions(count: int, seed: int) -> List[str]:
+    """count distinct mood descriptions (fewer distinct ones mean more cache hits)"""
+    rng = random.Random(seed)
+    combos = [f"{feeling} {context}" for feeling in FEELINGS for context in CONTEXTS]
+    rng.shuffle(combos)
+    return combos[:max(1, min(count, len(combos)))]
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=2).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f} s")
+
+
+def start_stack(server: str, standin_args: List[str], gemini: bool = False) -> Dict:
+    """Start the stand-in APIs and the app; returns the app URL and the processes to stop"""
+    from standin_server import app_environment
+
+    workdir = tempfile.mkdtemp(prefix='moodmusic-load-')
+    standin_port, app_port = free_port(), free_port()
+    standin_url = f"http://127.0.0.1:{standin_port}"
+    standin = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'benchmarks', 'standin_server.py'), '--port', str(standin_port)]
+        + standin_args, stdout=subprocess.DEVNULL, cwd=workdir
+    )
+    wait_until_up(f"{standin_url}/stats")
+
+    env = dict(os.environ, PYTHONPATH=ROOT, **app_environment(standin_url, gemini))
+    env.setdefault('YOUTUBE_DAILY_QUOTA', str(10 ** 9))  # measure the app, not the quota scheduler
+    if server == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'async_app:application', '--app-dir', ROOT,
+                   '--port', str(app_port), '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-c', f"from app import app; app.run(host='127.0.0.1', port={app_port}, threaded=True)"]
+    app = subprocess.Popen(command, env=env, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{app_port}"
+    try:
+        wait_until_up(f"{url}/api/status")
+    except RuntimeError:
+        app.terminate()
+        standin.terminate()
+        raise
+    return {'url': url, 'standin_url': standin_url, 'processes': [app, standin], 'workdir': workdir}
+
+
+def stop_stack(stack: Dict):
+    for process in stack['processes']:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+class LoadTest:
+    def __init__(self, url: str, rps: float, duration: float, feedback: float = 0.3, distinct: int = 40,
+                 users: int = 20, seed: int = 1, concurrency: int = 64, timeout: float = 60.0):
+        self.url = url.rstrip('/')
+        self.rps = rps
+        self.duration = duration
+        self.feedback = feedback
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.rng = random.Random(seed)
+        self.moods = descriptions(distinct, seed)
+        self.users = [f"load-user-{i}" for i in range(users)]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shown: List[Dict] = []  # videos returned so far, for feedback posts
+        self.samples = {'search': [], 'feedback': []}
+        self.errors = {'search': 0, 'feedback': 0}
+        self.max_lag = 0.0
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _plan(self, i: int) -> Dict:
+        """What request i does; drawn up front so runs are repeatable"""
+        return {
+            'feedback': self.rng.random() < self.feedback,
+            'mood': self.rng.choice(self.moods),
+            'genre': self.rng.choice(GENRES),
+            'user': self.rng.choice(self.users),
+            'like': self.rng.random() < 0.7,
+            'pick': self.rng.random()
+        }
+
+    def _search(self, plan: Dict) -> bool:
+        response = self.session.post(f"{self.url}/api/search", timeout=self.timeout, json={
+            'mood_description': plan['mood'],
+            'genre': plan['genre'],
+            'user_id': plan['user']
+        })
+        if response.status_code != 200:
+            return False
+        data = response.json()
+        with self._lock:
+            self._shown.extend({'mood': plan['mood'], 'query': data.get('query', ''), 'user': plan['user'],
+                                'video': video} for video in data.get('videos', [])[:3])
+            del self._shown[:-500]
+        return True
+
+    def _pick_shown(self, plan: Dict) -> Optional[Dict]:
+        with self._lock:
+            return self._shown[int(plan['pick'] * len(self._shown))] if self._shown else None
+
+    def _feedback(self, plan: Dict, shown: Dict) -> bool:
+        response = self.session.post(f"{self.url}/api/feedback", timeout=self.timeout, json={
+            'mood_description': shown['mood'],
+            'feedback': 'like' if plan['like'] else 'dislike',
+            'query': shown['query'] or shown['mood'],
+            'video_id': shown['video'].get('video_id'),
+            'video_title': shown['video'].get('title'),
+            'video_channel': shown['video'].get('channel'),
+            'user_id': shown['user']
+        })
+        return response.status_code == 200
+
+    def _one(self, plan: Dict, due: float):
+        # A feedback slot before anything was shown searches instead, and is counted as a search
+        shown = self._pick_shown(plan) if plan['feedback'] else None
+        kind = 'feedback' if shown is not None else 'search'
+        with self._lock:
+            self.max_lag = max(self.max_lag, time.perf_counter() - due)
+        try:
+            ok = self._feedback(plan, shown) if kind == 'feedback' else self._search(plan)
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - due
+        with self._lock:
+            self.samples[kind].append(elapsed)
+            if not ok:
+                self.errors[kind] += 1
+
+    def run(self) -> Dict:
+        total = int(self.rps * self.duration)
+        plans = [self._plan(i) for i in range(total)]
+        pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        start = time.perf_counter()
+        for i, plan in enumerate(plans):
+            due = start + i / self.rps
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(self._one, plan, due)
+        pool.shutdown(wait=True)
+        elapsed = time.perf_counter() - start
+
+        results = {
+            'url': self.url,
+            'target_rps': self.rps,
+            'requests': total,
+            'seconds': elapsed,
+            'throughput_rps': total / elapsed if elapsed else 0.0,
+            'max_client_lag_ms': self.max_lag * 1e3,
+            'endpoints': {}
+        }
+        for kind, samples in self.samples.items():
+            results['endpoints'][kind] = {
+                'count': len(samples),
+                'errors': self.errors[kind],
+                'p50_ms': percentile(samples, 0.50) * 1e3,
+                'p95_ms': percentile(samples, 0.95) * 1e3,
+                'p99_ms': percentile(samples, 0.99) * 1e3,
+                'max_ms': max(samples, default=0.0) * 1e3
+            }
+        return results
+
+
+def run(url: Optional[str] = None, start: Optional[str] = None, standin_args: List[str] = (),
+        gemini: bool = False, **options) -> Dict:
+    """Load test a running server (url) or a local stack (start='flask' / 'asgi')"""
+    stack = start_stack(start, list(standin_args), gemini) if start else None
+    try:
+        results = LoadTest(stack['url'] if stack else url, **options).run()
+        if stack:
+            results['server'] = start
+            results['upstream'] = requests.get(f"{stack['standin_url']}/stats", timeout=5).json()['stats']
+        return results
+    finally:
+        if stack:
+            stop_stack(stack)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Open-loop load test of /api/search and /api/feedback')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='base URL of a running server')
+    target.add_argument('--start', choices=['flask', 'asgi'], help='start stand-in APIs and the app locally')
+    parser.add_argument('--rps', type=float, default=20.0)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds')
+    parser.add_argument('--feedback', type=float, default=0.3, help='fraction of requests that post feedback')
+    parser.add_argument('--distinct', type=int, default=40, help='distinct mood descriptions')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=64, help='client threads')
+    parser.add_argument('--gemini', action='store_true', help='route interpretations through the Gemini stand-in')
+    parser.add_argument('--json', help='also write the results to this file')
+    args, standin_args = parser.parse_known_args(argv)  # the rest goes to standin_server.py
+
+    results = run(args.url, args.start, standin_args, args.gemini, rps=args.rps, duration=args.duration,
+                  feedback=args.feedback, distinct=args.distinct, users=args.users, seed=args.seed,
+                  concurrency=args.concurrency)
+    print(f"{results['requests']} requests at {args.rps:g} rps target: {results['throughput_rps']:.1f} rps "
+          f"over {results['seconds']:.1f} s (client lag up to {results['max_client_lag_ms']:.0f} ms)")
+    for kind, stats in results['endpoints'].items():
+        print(f"  {kind:8s} n={stats['count']:5d} errors={stats['errors']:4d}  p50 {stats['p50_ms']:8.1f} ms  "
+              f"p95 {stats['p95_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms")
+    if 'upstream' in results:
+        print("  upstream calls: " + ', '.join(f"{name} {s['calls']}" for name, s in results['upstream'].items()))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
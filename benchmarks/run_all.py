@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Run the benchmark suite and write the results as JSON
+
+Usage:
+    python benchmarks/run_all.py [--quick] [--output FILE] [--compare BASELINE.json] [--threshold 0.25]
+
+Runs bench_mood_rules, bench_ranking, bench_llm_providers, bench_search_path
+and bench_storage with their fixed, seeded inputs and writes one JSON file
+(default benchmarks/results/<time>-<commit>.json) with the git commit,
+Python version and platform next to the numbers. --quick runs the storage
+benchmark at 10k events only and the filter benchmark up to 10k dislikes.
+
+With --compare, every timing (keys ending in _us, _ms, _s), size (_mb) and
+speedup of this run is checked against the baseline file; changes beyond
+--threshold are listed and a slowdown makes the exit status 1. Timings of a
+few microseconds move by 10-20% between runs on a busy machine, hence the
+25% default; compare runs made on the same machine.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+LOWER_IS_BETTER = ('_us', '_ms', '_s', '_mb')
+HIGHER_IS_BETTER = ('speedup',)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_suite(quick: bool = False) -> Dict:
+    import bench_llm_providers
+    import bench_mood_rules
+    import bench_ranking
+    import bench_search_path
+    import bench_storage
+
+    suite = [
+        ('mood_rules', lambda: bench_mood_rules.run(bench_mood_rules.synthetic_corpus())),
+        ('ranking', (lambda: bench_ranking.run()) if bench_ranking.ranking.np is not None else None),
+        ('llm_providers', bench_llm_providers.run),
+        ('search_path', lambda: bench_search_path.run(dislike_sizes=(1000, 10000) if quick else (1000, 10000, 100000))),
+        ('storage', lambda: bench_storage.run(sizes=(10000,) if quick else bench_storage.SIZES)),
+    ]
+    results = {}
+    for name, bench in suite:
+        if bench is None:
+            print(f"{name}: skipped (numpy is not installed)")
+            continue
+        start = time.perf_counter()
+        results[name] = bench()
+        print(f"{name}: done in {time.perf_counter() - start:.1f} s")
+    return results
+
+
+def flatten(results: Dict, prefix: str = '') -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Lines describing metrics that moved more than threshold; slowdowns start with 'REGRESSION'"""
+    now, before = flatten(current), flatten(baseline)
+    lines = []
+    for key in sorted(now.keys() & before.keys()):
+        if key.endswith(LOWER_IS_BETTER):
+            lower_is_better = True
+        elif key.endswith(HIGHER_IS_BETTER):
+            lower_is_better = False
+        else:
+            continue
+        old, new = before[key], now[key]
+        if not old:
+            continue
+        change = (new - old) / old
+        if abs(change) <= threshold:
+            continue
+        worse = change > 0 if lower_is_better else change < 0
+        lines.append(f"{'REGRESSION' if worse else 'improved  '} {key}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+    return lines
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Run the Mood Music App benchmarks')
+    parser.add_argument('--quick', action='store_true', help='smaller storage / filter sizes')
+    parser.add_argument('--output', help='JSON file to write (default: benchmarks/results/<time>-<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative change worth reporting')
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'results': run_suite(args.quick)
+    }
+    output = args.output or os.path.join(BENCH_DIR, 'results',
+                                         f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        lines = compare(report['results'], baseline['results'], args.threshold)
+        print(f"Compared with {args.compare} (commit {baseline.get('commit', '?')}):")
+        for line in lines or [f"no change beyond {args.threshold:.0%}"]:
+            print(f"  {line}")
+        sys.exit(1 if any(line.startswith('REGRESSION') for line in lines) else 0)
+
+
+if __name__ == '__main__':
+    main()
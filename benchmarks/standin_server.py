@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the YouTube Data API, Hugging Face Inference API and Gemini
+
+Usage:
+    python benchmarks/standin_server.py [--port 8765] [--youtube-latency 80] [--llm-latency 700] ...
+
+Endpoints:
+    GET  /youtube/v3/search                      search.list, a few pages per query
+    GET  /youtube/v3/videos                      videos.list (duration, statistics)
+    POST /models/<name>                          Hugging Face text generation
+    POST /v1beta/models/<name>:generateContent   Gemini REST generateContent
+    GET  /stats                                  calls and injected errors per endpoint
+
+Responses depend only on the request: the same query always returns the
+same videos, and LLM replies are mood_rules.py interpretations in the JSON
+shape the app's prompts ask for (one object, or an array for batch
+prompts). Latency is log-normal around the given median (--jitter is its
+sigma), errors are injected with the given probability, and both are drawn
+from a generator seeded with --seed, the request and how often it was seen,
+so a replayed request sequence gets the same delays and failures.
+
+Start the app with the environment printed at startup (YOUTUBE_API_BASE,
+HUGGINGFACE_MODEL_URL, GEMINI_API_BASE and stand-in keys).
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mood_rules  # noqa: E402
+
+TITLE_WORDS = ['Live', 'Acoustic', 'Official Audio', 'Lyrics', 'Remix', 'Full Album', 'Playlist', 'Mix',
+               'Session', 'Cover', 'Extended', 'Radio Edit']
+CHANNELS = [f'Standin Artist {i}' for i in range(60)]
+
+_BATCH_LINE = re.compile(r'^(\d+)\. "(.*)"$', re.MULTILINE)
+_SINGLE_DESCRIPTION = re.compile(r'described their mood as: "(.*)"')
+
+
+def _digest(*parts) -> bytes:
+    return hashlib.sha1('\x00'.join(str(p) for p in parts).encode('utf-8')).digest()
+
+
+def _number(*parts) -> int:
+    return int.from_bytes(_digest(*parts)[:8], 'big')
+
+
+def video_id(query: str, page: int, position: int) -> str:
+    """11-character ID, like YouTube's"""
+    alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+    n = _number('video', query, page, position)
+    return ''.join(alphabet[(n >> (6 * i)) & 63] for i in range(11))
+
+
+def search_item(query: str, page: int, position: int) -> Dict:
+    vid = video_id(query, page, position)
+    n = _number('title', vid)
+    words = ' '.join(w.capitalize() for w in query.split()[:4])
+    return {
+        'kind': 'youtube#searchResult',
+        'id': {'kind': 'youtube#video', 'videoId': vid},
+        'snippet': {
+            'title': f"{words} {TITLE_WORDS[n % len(TITLE_WORDS)]} #{page * 50 + position + 1}",
+            'channelTitle': CHANNELS[(n >> 8) % len(CHANNELS)],
+            'thumbnails': {'default': {'url': f"https://i.ytimg.com/vi/{vid}/default.jpg"}}
+        }
+    }
+
+
+def video_item(vid: str) -> Dict:
+    n = _number('details', vid)
+    seconds = 90 + n % 420 if n % 20 else 1800 + n % 7200  # mostly songs, some long mixes
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    duration = 'PT' + (f'{hours}H' if hours else '') + (f'{minutes}M' if minutes else '') + f'{secs}S'
+    views = 10 ** (2 + (n >> 16) % 7) + (n >> 32) % 1000
+    return {
+        'kind': 'youtube#video',
+        'id': vid,
+        'contentDetails': {'duration': duration},
+        'statistics': {'viewCount': str(views), 'likeCount': str(views // 40)}
+    }
+
+
+def interpretation_text(prompt: str) -> str:
+    """The JSON reply an LLM would give to one of the app's prompts"""
+    numbered = _BATCH_LINE.findall(prompt)
+    if numbered:
+        return json.dumps([dict(mood_rules.interpret(description), id=int(i)) for i, description in numbered])
+    match = _SINGLE_DESCRIPTION.search(prompt)
+    return json.dumps(mood_rules.interpret(match.group(1) if match else prompt[-200:]))
+
+
+class Profile:
+    """Latency and error distribution of one upstream"""
+
+    def __init__(self, median_ms: float, jitter: float, error_rate: float):
+        self.median = median_ms / 1000.0
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def draw(self, rng: random.Random) -> Tuple[float, bool]:
+        delay = self.median * math.exp(rng.gauss(0.0, self.jitter)) if self.median > 0 else 0.0
+        return delay, rng.random() < self.error_rate
+
+
+class StandinState:
+    def __init__(self, seed: int, profiles: Dict[str, Profile], pages: int, daily_quota: Optional[int]):
+        self.seed = seed
+        self.profiles = profiles
+        self.pages = pages
+        self.quota_left = daily_quota
+        self._seen: Dict[bytes, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {name: {'calls': 0, 'errors': 0} for name in ('search', 'videos', 'huggingface', 'gemini')}
+
+    def plan(self, endpoint: str, key: str, cost: int = 0) -> Tuple[float, Optional[str]]:
+        """Delay for one request and the error to fail it with ('error', 'quota' or None)"""
+        digest = _digest(endpoint, key)
+        with self._lock:
+            occurrence = self._seen.get(digest, 0)
+            self._seen[digest] = occurrence + 1
+            self.stats[endpoint]['calls'] += 1
+            quota_hit = self.quota_left is not None and self.quota_left < cost
+            if self.quota_left is not None and not quota_hit:
+                self.quota_left -= cost
+        rng = random.Random(_number(self.seed, endpoint, key, occurrence))
+        delay, failed = self.profiles[endpoint].draw(rng)
+        error = 'quota' if quota_hit else ('error' if failed else None)
+        if error:
+            with self._lock:
+                self.stats[endpoint]['errors'] += 1
+        return delay, error
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real APIs
+    state: StandinState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _youtube_error(self, error: str):
+        if error == 'quota':
+            self._send(403, {'error': {'code': 403, 'message': 'The request cannot be completed because you have '
+                                       'exceeded your quota.', 'errors': [{'reason': 'quotaExceeded'}]}})
+        else:
+            self._send(503, {'error': {'code': 503, 'message': 'The service is currently unavailable.',
+                                       'errors': [{'reason': 'backendError'}]}})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == '/stats':
+            return self._send(200, {'stats': self.state.stats, 'quota_left': self.state.quota_left})
+        if url.path not in ('/youtube/v3/search', '/youtube/v3/videos'):
+            return self._send(404, {'error': {'code': 404, 'message': 'Not found'}})
+        if not params.get('key'):
+            return self._send(403, {'error': {'code': 403, 'message': 'The request is missing a valid API key.'}})
+
+        if url.path.endswith('/search'):
+            query = params.get('q', '')
+            token = params.get('pageToken', '')
+            page = int(token[1:]) if re.fullmatch(r'p\d+', token) else 0
+            size = max(1, min(50, int(params.get('maxResults', 5))))
+            delay, error = self.state.plan('search', f"{query}|{page}|{size}", cost=100)
+            time.sleep(delay)
+            if error:
+                return self._youtube_error(error)
+            body = {
+                'kind': 'youtube#searchListResponse',
+                'pageInfo': {'totalResults': self.state.pages * size, 'resultsPerPage': size},
+                'items': [search_item(query, page, i) for i in range(size)]
+            }
+            if page + 1 < self.state.pages:
+                body['nextPageToken'] = f"p{page + 1}"
+            return self._send(200, body)
+
+        ids = [vid for vid in params.get('id', '').split(',') if vid][:50]
+        delay, error = self.state.plan('videos', ','.join(ids), cost=1)
+        time.sleep(delay)
+        if error:
+            return self._youtube_error(error)
+        self._send(200, {'kind': 'youtube#videoListResponse', 'items': [video_item(vid) for vid in ids]})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send(400, {'error': 'Invalid JSON'})
+        path = urlparse(self.path).path
+
+        if path.startswith('/models/'):
+            prompt = body.get('inputs', '')
+            delay, error = self.state.plan('huggingface', prompt)
+            time.sleep(delay)
+            if error:
+                return self._send(503, {'error': 'Model is currently loading', 'estimated_time': 20.0})
+            return self._send(200, [{'generated_text': interpretation_text(prompt)}])
+
+        if path.endswith(':generateContent'):
+            prompt = ''.join(part.get('text', '') for content in body.get('contents', [])
+                             for part in content.get('parts', []))
+            delay, error = self.state.plan('gemini', prompt)
+            time.sleep(delay)
+            if error:
+                return self._send(503, {'error': {'code': 503, 'message': 'The model is overloaded.',
+                                                  'status': 'UNAVAILABLE'}})
+            return self._send(200, {'candidates': [{
+                'content': {'parts': [{'text': interpretation_text(prompt)}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0
+            }]})
+
+        self._send(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+
+def app_environment(base_url: str, gemini: bool = False) -> Dict[str, str]:
+    """Environment that points app.py / async_app.py at a stand-in server"""
+    return {
+        'YOUTUBE_API_KEY': 'standin',
+        'YOUTUBE_API_BASE': f"{base_url}/youtube/v3",
+        'HUGGINGFACE_API_KEY': 'standin',
+        'HUGGINGFACE_MODEL_URL': f"{base_url}/models/standin",
+        'GEMINI_API_KEY': 'standin' if gemini else '',
+        'GEMINI_API_BASE': base_url
+    }
+
+
+def create_server(host: str = '127.0.0.1', port: int = 8765, seed: int = 1, jitter: float = 0.5,
+                  youtube_latency: float = 80.0, youtube_errors: float = 0.0,
+                  llm_latency: float = 700.0, llm_errors: float = 0.0,
+                  pages: int = 5, daily_quota: Optional[int] = None) -> ThreadingHTTPServer:
+    """A stand-in server (not yet serving); latencies in milliseconds, errors as probabilities"""
+    youtube = Profile(youtube_latency, jitter, youtube_errors)
+    llm = Profile(llm_latency, jitter, llm_errors)
+    state = StandinState(seed, {'search': youtube, 'videos': youtube, 'huggingface': llm, 'gemini': llm},
+                         pages, daily_quota)
+    handler = type('Handler', (StandinHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Local stand-in for YouTube, Hugging Face and Gemini')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--jitter', type=float, default=0.5, help='sigma of the log-normal latency')
+    parser.add_argument('--youtube-latency', type=float, default=80.0, help='median ms')
+    parser.add_argument('--youtube-errors', type=float, default=0.0, help='probability of a 503')
+    parser.add_argument('--llm-latency', type=float, default=700.0, help='median ms')
+    parser.add_argument('--llm-errors', type=float, default=0.0, help='probability of a 503')
+    parser.add_argument('--pages', type=int, default=5, help='search result pages per query')
+    parser.add_argument('--daily-quota', type=int, default=None, help='YouTube units before quotaExceeded')
+    args = parser.parse_args(argv)
+
+    server = create_server(args.host, args.port, args.seed, args.jitter, args.youtube_latency, args.youtube_errors,
+                           args.llm_latency, args.llm_errors, args.pages, args.daily_quota)
+    base_url = f"http://{args.host}:{server.server_address[1]}"
+    print(f"Stand-in APIs on {base_url}; start the app with:")
+    for key, value in app_environment(base_url).items():
+        print(f"  {key}={value}")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Stress test: concurrent /api/feedback posts from several server processes
+
+Usage:
+    python benchmarks/stress_feedback.py [backend] [processes] [posts_per_process] [threads]
+
+Starts `processes` copies of the Flask app (each like one gunicorn worker)
+on a shared temporary data directory, and has each fire posts_per_process
+feedback posts from `threads` threads at once, spread over a few users and
+moods. Afterwards every user's store is loaded fresh and each post must be
+found in both feedback_history and the liked/disliked videos of its mood.
+Exits 1 if any feedback was lost.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+USERS = ['default', 'alice', 'bob']
+MOODS = ['happy', 'chill evening', 'rainy day']
+
+
+def feedback_body(worker, i):
+    body = {
+        'mood_description': MOODS[i % len(MOODS)],
+        'feedback': 'dislike' if i % 3 == 0 else 'like',
+        'query': f'stress query {i % 7}',
+        'video_id': f'w{worker}-{i}',
+        'video_title': f'Stress video {worker}-{i}',
+        'video_channel': f'Channel {i % 5}'
+    }
+    user = USERS[i % len(USERS)]
+    if user != 'default':
+        body['user_id'] = user
+    return body
+
+
+def worker(data_dir, env, number, posts, threads, start, results):
+    os.chdir(data_dir)
+    os.environ.update(env)
+    import app
+
+    client = app.app.test_client()
+
+    def post(i):
+        return client.post('/api/feedback', json=feedback_body(number, i)).status_code == 200
+
+    start.wait()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        accepted = sum(pool.map(post, range(posts)))
+    app.music_app.users.close()
+    results.put(accepted)
+
+
+def stored_feedback(data_dir, user_id):
+    """(video IDs in refined_keywords, video IDs in feedback_history) of one user, read from disk"""
+    from storage import create_preference_store
+    from user_shards import user_directory
+
+    if user_id == 'default':
+        store = create_preference_store(os.path.join(data_dir, 'user_preferences.json'), use_env_paths=False)
+    else:
+        path = os.path.join(user_directory(os.path.join(data_dir, 'user_data'), user_id), 'preferences.json')
+        store = create_preference_store(path, use_env_paths=False)
+    try:
+        refined = store.load()['refined_keywords']
+        indexed = {v['video_id'] for entry in refined.values()
+                   for kind in ('liked_videos', 'disliked_videos') for v in entry.get(kind, [])}
+        history = [e.get('video_id') for e in store.iter_history('feedback')]
+    finally:
+        store.close()
+    return indexed, history
+
+
+def run(backend='json', processes=4, posts=500, threads=8):
+    data_dir = tempfile.mkdtemp(prefix='moodmusic-stress-')
+    env = {
+        'PREFERENCES_BACKEND': backend,
+        'USER_DATA_DIR': 'user_data',
+        'YOUTUBE_API_KEY': '',
+        'JOURNAL_COMPACT_INTERVAL': '1'
+    }
+    os.environ.update(env)
+    ctx = multiprocessing.get_context('spawn')
+    start, results = ctx.Barrier(processes + 1), ctx.Queue()
+    workers = [ctx.Process(target=worker, args=(data_dir, env, n, posts, threads, start, results))
+               for n in range(processes)]
+    try:
+        for p in workers:
+            p.start()
+        start.wait()
+        began = time.perf_counter()
+        accepted = sum(results.get() for _ in workers)
+        elapsed = time.perf_counter() - began
+        for p in workers:
+            p.join()
+
+        expected = {user: set() for user in USERS}
+        for n in range(processes):
+            for i in range(posts):
+                expected[USERS[i % len(USERS)]].add(f'w{n}-{i}')
+        lost = {}
+        for user, video_ids in expected.items():
+            indexed, history = stored_feedback(data_dir, user)
+            lost[user] = {
+                'refined_keywords': len(video_ids - indexed),
+                'feedback_history': len(video_ids - set(history)),
+                'duplicate_history': len(history) - len(set(history))
+            }
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return {
+        'backend': backend,
+        'posts': processes * posts,
+        'accepted': accepted,
+        'seconds': elapsed,
+        'lost': lost
+    }
+
+
+if __name__ == '__main__':
+    backend = sys.argv[1] if len(sys.argv) > 1 else 'json'
+    args = [int(a) for a in sys.argv[2:5]]
+    results = run(backend, *args)
+    print(f"{results['backend']}: {results['accepted']}/{results['posts']} posts accepted in "
+          f"{results['seconds']:.1f} s ({results['posts'] / results['seconds']:.0f} posts/s)")
+    failed = results['accepted'] != results['posts']
+    for user, lost in results['lost'].items():
+        print(f"  {user:8s} lost from refined_keywords: {lost['refined_keywords']:5d}   "
+              f"from feedback_history: {lost['feedback_history']:5d}   duplicated: {lost['duplicate_history']:5d}")
+        failed = failed or any(lost.values())
+    sys.exit(1 if failed else 0)
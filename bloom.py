@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Bloom filters for the Mood Music App
+
+Used for the global dislike filter: a compact probabilistic set of disliked
+video IDs that is checked before any exact lookup.
+"""
+
+import math
+import hashlib
+import threading
+from typing import Dict, Iterable, List
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for capacity items at error_rate false positives"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / self.capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Double hashing (Kirsch-Mitzenmacher) from one 128-bit digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key: str) -> bool:
+        """Add key; True if it was (probably) not present before"""
+        new = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+
+class ScalableBloomFilter:
+    """Chain of Bloom filters that grows as items are added (Almeida et al.)
+
+    Each new filter has growth times the capacity and tightening times the
+    error rate of the previous one, so the overall false positive rate stays
+    below error_rate. Memory follows the number of distinct keys, not the
+    number of add() calls.
+    """
+
+    def __init__(self, initial_capacity: int = 10000, error_rate: float = 0.001,
+                 growth: int = 2, tightening: float = 0.5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters: List[BloomFilter] = []
+        self._lock = threading.Lock()
+
+    def add(self, key: str) -> bool:
+        with self._lock:
+            if key in self:
+                return False
+            if not self.filters or self.filters[-1].full:
+                n = len(self.filters)
+                self.filters.append(BloomFilter(
+                    self.initial_capacity * self.growth ** n,
+                    self.error_rate * (1 - self.tightening) * self.tightening ** n
+                ))
+            return self.filters[-1].add(key)
+
+    def update(self, keys: Iterable[str]):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        return any(key in bloom for bloom in reversed(self.filters))
+
+    def __len__(self) -> int:
+        return sum(bloom.count for bloom in self.filters)
+
+    def stats(self) -> Dict:
+        return {
+            'items': len(self),
+            'filters': len(self.filters),
+            'bytes': sum(len(bloom.bits) for bloom in self.filters),
+            'error_rate': self.error_rate
+        }
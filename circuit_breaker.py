@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Circuit breaker with latency-adaptive timeouts for external providers
+(Gemini, Hugging Face, YouTube)
+"""
+
+import time
+import threading
+from typing import Dict, Optional
+
+from metrics import LatencyHistogram
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures; half-open probe after reset_timeout
+
+    The request timeout adapts to the provider: timeout_multiplier times the
+    p95 of recent successful calls, clamped to [min_timeout, max_timeout].
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 min_timeout: float = 1.0, max_timeout: float = 30.0, timeout_multiplier: float = 2.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.half_open_max_calls = half_open_max_calls
+        self.latency = LatencyHistogram(window=100)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.short_circuited = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """True if a call may go through now"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.short_circuited += 1
+                    return False
+                self.state = HALF_OPEN
+                self._half_open_calls = 0
+            if self.state == HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    self.short_circuited += 1
+                    return False
+                self._half_open_calls += 1
+            return True
+
+    def check(self):
+        """Raise CircuitOpenError if the call must be skipped"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def record_success(self, seconds: Optional[float] = None):
+        """Close the circuit; seconds (if given) feeds the adaptive timeout"""
+        if seconds is not None:
+            self.latency.observe(seconds)
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+
+    def release(self):
+        """Free a half-open probe slot for a call that ended without a verdict (e.g. cancelled)"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def timeout(self) -> float:
+        """Request timeout derived from the observed p95 latency"""
+        p95 = self.latency.percentile(95)
+        if p95 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p95 * self.timeout_multiplier))
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            state = self.state
+            if state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                state = HALF_OPEN
+            return {
+                'state': state,
+                'consecutive_failures': self.consecutive_failures,
+                'total_failures': self.total_failures,
+                'short_circuited': self.short_circuited,
+                'timeout': round(self.timeout(), 3),
+                'p95': self.latency.percentile(95)
+            }
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Video enrichment for the Mood Music App
+
+search.list only returns snippets. Duration and statistics come from
+videos.list, which accepts up to 50 IDs per call for 1 quota unit, so all
+candidate IDs of a search are looked up together and the details are
+cached per video ID (in memory, and in the video store when one is given).
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional
+
+from cache import TTLCache
+
+VIDEOS_LIST_MAX_IDS = 50
+VIDEOS_LIST_PARTS = 'contentDetails,statistics'
+
+_DURATION_PATTERN = re.compile(r'^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+
+def parse_duration(value: Optional[str]) -> Optional[int]:
+    """Seconds in an ISO 8601 duration such as 'PT4M13S' (None if unparseable)"""
+    match = _DURATION_PATTERN.match(value or '')
+    if not match or value in ('P', 'PT'):
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def format_duration(seconds: int) -> str:
+    """'4:13' / '1:02:05'"""
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def _count(statistics: Dict, key: str) -> Optional[int]:
+    try:
+        return int(statistics[key])
+    except (KeyError, TypeError, ValueError):
+        return None  # hidden like counts, live streams etc.
+
+
+def video_details(item: Dict) -> Dict:
+    """The fields we keep from one videos.list item"""
+    duration = parse_duration(item.get('contentDetails', {}).get('duration'))
+    statistics = item.get('statistics', {})
+    return {
+        'duration': duration,
+        'duration_text': format_duration(duration) if duration is not None else None,
+        'view_count': _count(statistics, 'viewCount'),
+        'like_count': _count(statistics, 'likeCount')
+    }
+
+
+def chunks(video_ids: List[str], size: int = VIDEOS_LIST_MAX_IDS) -> List[List[str]]:
+    return [video_ids[i:i + size] for i in range(0, len(video_ids), size)]
+
+
+class VideoFilters:
+    """Server-side result filters; a limit of 0 is off, and videos without details pass"""
+
+    FIELDS = ('min_duration', 'max_duration', 'min_views')
+
+    def __init__(self, min_duration: int = 0, max_duration: int = 0, min_views: int = 0):
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.min_views = min_views
+
+    def merged(self, overrides: Dict) -> 'VideoFilters':
+        """Copy with the limits given in overrides (e.g. request JSON); raises ValueError on bad values"""
+        limits = {field: getattr(self, field) for field in self.FIELDS}
+        for field in self.FIELDS:
+            value = overrides.get(field)
+            if value is None or value == '':
+                continue
+            value = int(value)
+            if value < 0:
+                raise ValueError(f"{field} must not be negative")
+            limits[field] = value
+        return VideoFilters(**limits)
+
+    @property
+    def active(self) -> bool:
+        return bool(self.min_duration or self.max_duration or self.min_views)
+
+    def allows(self, video: Dict) -> bool:
+        duration = video.get('duration')
+        if duration is not None:
+            if self.min_duration and duration < self.min_duration:
+                return False
+            if self.max_duration and duration > self.max_duration:
+                return False
+        views = video.get('view_count')
+        if views is not None and self.min_views and views < self.min_views:
+            return False
+        return True
+
+    def apply(self, videos: List[Dict]) -> List[Dict]:
+        return [video for video in videos if self.allows(video)] if self.active else videos
+
+
+class VideoEnricher:
+    """Per-video cache of videos.list details, backed by an optional VideoStore"""
+
+    def __init__(self, maxsize: int = 5000, ttl: float = 86400.0, store=None):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.store = store
+
+    def missing(self, video_ids: Iterable[str]) -> List[str]:
+        """IDs with no cached details, de-duplicated, in order"""
+        missing = [video_id for video_id in dict.fromkeys(video_ids) if self.cache.get(video_id) is None]
+        if missing and self.store is not None:
+            for video_id, details in self.store.details(missing, max_age=self.cache.ttl).items():
+                self.cache.set(video_id, details)
+            missing = [video_id for video_id in missing if self.cache.get(video_id) is None]
+        return missing
+
+    def store_response(self, requested: List[str], items: List[Dict]):
+        """Cache a videos.list response; IDs it left out (deleted, private) are cached as empty"""
+        found = {item.get('id'): video_details(item) for item in items}
+        details = {video_id: found.get(video_id, {}) for video_id in requested}
+        for video_id, video in details.items():
+            self.cache.set(video_id, video)
+        if self.store is not None:
+            self.store.put_details(details)
+
+    def apply(self, videos: List[Dict]) -> List[Dict]:
+        """Copy cached details onto the video dicts (in place)"""
+        for video in videos:
+            details = self.cache.get(video['video_id'])
+            if details:
+                video.update(details)
+        return videos
+
+    def stats(self) -> Dict:
+        return self.cache.stats()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Persistent cache of LLM mood interpretations
+
+Descriptions are normalized (lowercased, punctuation and whitespace collapsed,
+stop-words removed) before lookup. An optional similarity index of hashed
+character n-gram TF-IDF vectors lets near-duplicates such as
+"lonely and sad" or "relaxed evenings" reuse the interpretation of
+"sad and lonely" or "relaxed evening"; a near-duplicate must have the same
+words up to inflection, so "unmotivated" never reuses "motivated".
+
+New entries are written to the JSON file by a background thread at most
+every save_interval seconds (and on close()), so a burst of new
+interpretations costs one file rewrite instead of one each.
+"""
+
+import os
+import re
+import json
+import time
+import zlib
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # similarity lookup is optional
+    np = None
+
+STOP_WORDS = {
+    'i', 'im', "i'm", 'am', 'is', 'are', 'be', 'been', 'feel', 'feeling', 'feels', 'a', 'an', 'the',
+    'and', 'or', 'to', 'of', 'in', 'on', 'at', 'for', 'with', 'me', 'my', 'it', 'its', "it's",
+    'this', 'that', 'today', 'tonight', 'now', 'right', 'kind', 'kinda', 'sort', 'like', 'some',
+    'music', 'songs', 'song', 'want', 'need', 'something', 'please',
+    # intensifiers rarely change which music fits
+    'so', 'very', 'really', 'super', 'quite', 'pretty', 'totally', 'extremely', 'bit', 'little', 'too'
+}
+
+# Never stripped, and near-duplicates must agree on them ("not happy" is not "happy")
+NEGATION_WORDS = {'not', 'no', 'nor', 'neither', 'never', "don't", "doesn't", "isn't", "aren't",
+                  "won't", "can't", "cannot", "without"}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def normalize_description(text: str) -> str:
+    """Normalize a mood description into a cache key"""
+    text = text.lower().replace('’', "'")
+    tokens = [t for t in _TOKEN_RE.findall(text) if t not in STOP_WORDS]
+    return ' '.join(tokens)
+
+
+def _negations(key: str) -> frozenset:
+    return frozenset(t for t in key.split() if t in NEGATION_WORDS)
+
+
+_INFLECTIONS = (('es', 's'), ('ing', 'ed', 'ly'))
+
+
+def _stem(token: str) -> str:
+    """Strip a plural and then a verb/adverb ending; negating affixes (un-, in-, -less) are kept"""
+    for suffixes in _INFLECTIONS:
+        for suffix in suffixes:
+            if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+                token = token[:-len(suffix)]
+                break
+    return token
+
+
+def _content(key: str) -> frozenset:
+    return frozenset(_stem(t) for t in key.split())
+
+
+class NgramSimilarityIndex:
+    """Cosine similarity over hashed character n-gram TF-IDF vectors held in a NumPy matrix"""
+
+    def __init__(self, n: int = 3, dims: int = 1024):
+        self.n = n
+        self.dims = dims
+        self.keys: List[str] = []
+        self._rows: Dict[str, int] = {}  # key -> row in _tf
+        self._tf = np.zeros((0, dims), dtype=np.float32)
+        self._df = np.zeros(dims, dtype=np.float32)
+        self._matrix = None  # row-normalized TF-IDF, rebuilt lazily after changes
+
+    def _counts(self, key: str):
+        padded = f" {key} "
+        counts = np.zeros(self.dims, dtype=np.float32)
+        for i in range(max(len(padded) - self.n + 1, 1)):
+            counts[zlib.crc32(padded[i:i + self.n].encode('utf-8')) % self.dims] += 1
+        return counts
+
+    def _idf(self):
+        return np.log((1 + len(self.keys)) / (1 + self._df)) + 1
+
+    def add(self, key: str):
+        counts = self._counts(key)
+        if len(self.keys) == self._tf.shape[0]:
+            grown = np.zeros((max(16, 2 * len(self.keys)), self.dims), dtype=np.float32)
+            grown[:len(self.keys)] = self._tf[:len(self.keys)]
+            self._tf = grown
+        self._tf[len(self.keys)] = counts
+        self._df += counts > 0
+        self._rows[key] = len(self.keys)
+        self.keys.append(key)
+        self._matrix = None
+
+    def remove(self, key: str):
+        """Drop a key; the last row moves into its place"""
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        self._df -= self._tf[row] > 0
+        last = len(self.keys) - 1
+        if row != last:
+            self._tf[row] = self._tf[last]
+            self.keys[row] = self.keys[last]
+            self._rows[self.keys[row]] = row
+        self._tf[last] = 0
+        self.keys.pop()
+        self._matrix = None
+
+    def rebuild(self, keys: List[str]):
+        self.keys = []
+        self._rows = {}
+        self._tf = np.zeros((0, self.dims), dtype=np.float32)
+        self._df = np.zeros(self.dims, dtype=np.float32)
+        self._matrix = None
+        for key in keys:
+            self.add(key)
+
+    def most_similar(self, key: str) -> Tuple[Optional[str], float]:
+        """Return (best matching key, cosine similarity)"""
+        if not self.keys:
+            return None, 0.0
+        idf = self._idf()
+        if self._matrix is None:
+            weighted = self._tf[:len(self.keys)] * idf
+            norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+            self._matrix = weighted / np.maximum(norms, 1e-12)
+        query = self._counts(key) * idf
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = self._matrix @ query
+        best = int(np.argmax(scores))
+        return self.keys[best], float(scores[best])
+
+
+class InterpretationCache:
+    """Normalized-key interpretation cache with optional near-duplicate lookup, persisted as JSON"""
+
+    def __init__(self, path: Optional[str] = 'interpretation_cache.json', maxsize: int = 2000,
+                 similarity: bool = True, threshold: float = 0.75, save_interval: float = 5.0):
+        self.path = path
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.save_interval = save_interval  # 0 saves on every put
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer of the file at a time
+        self._dirty = False
+        self._index = NgramSimilarityIndex() if similarity and np is not None else None
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.recent_scores = deque(maxlen=20)
+        self._load()
+
+        self._stop = threading.Event()
+        self._writer = None
+        if path and save_interval > 0:
+            self._writer = threading.Thread(target=self._writer_loop, name='interpretation-cache-writer', daemon=True)
+            self._writer.start()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self._entries = OrderedDict(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Could not load interpretation cache: {e}")
+            return
+        if self._index is not None:
+            self._index.rebuild(list(self._entries))
+
+    def flush(self):
+        """Write the cache file if anything changed since the last write"""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                # Entries are replaced, never changed in place, so a shallow copy is a consistent snapshot
+                entries = OrderedDict(self._entries)
+                self._dirty = False
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                self._dirty = True
+                print(f"Could not save interpretation cache: {e}")
+
+    def _writer_loop(self):
+        while not self._stop.wait(self.save_interval):
+            self.flush()
+
+    def close(self):
+        """Stop the background writer and write what is pending"""
+        self._stop.set()
+        if self._writer:
+            self._writer.join()
+        self.flush()
+
+    def get(self, mood_description: str) -> Optional[Dict[str, str]]:
+        """Return a cached interpretation for this description or a close enough one"""
+        key = normalize_description(mood_description)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return dict(entry['result'])
+
+            if self._index is not None and key:
+                match, score = self._index.most_similar(key)
+                # N-grams alone would let "unmotivated" reuse "motivated": the words themselves must agree,
+                # up to inflection and order, and so must any negations
+                reused = (match is not None and score >= self.threshold and _negations(match) == _negations(key)
+                          and _content(match) == _content(key))
+                # Scores only: descriptions are users' own words and stats() is public
+                self.recent_scores.append({'score': round(score, 4), 'reused': reused})
+                if reused:
+                    self._entries.move_to_end(match)
+                    self.similar_hits += 1
+                    return dict(self._entries[match]['result'])
+
+            self.misses += 1
+            return None
+
+    def put(self, mood_description: str, result: Dict[str, str]):
+        """Store an interpretation (persisted by the background writer)"""
+        self.put_many([(mood_description, result)])
+
+    def put_many(self, items: List[Tuple[str, Dict[str, str]]]):
+        """Store several interpretations (persisted by the background writer)"""
+        with self._lock:
+            for mood_description, result in items:
+                key = normalize_description(mood_description)
+                if not key:
+                    continue
+                is_new = key not in self._entries
+                self._entries[key] = {'description': mood_description, 'result': dict(result), 'created': time.time()}
+                self._entries.move_to_end(key)
+                if self._index is not None and is_new:
+                    self._index.add(key)
+                while len(self._entries) > self.maxsize:
+                    evicted, _ = self._entries.popitem(last=False)
+                    if self._index is not None:
+                        self._index.remove(evicted)
+                self._dirty = True
+        if not self._writer:
+            self.flush()
+
+    def stats(self) -> Dict:
+        """Hit ratio, counters and recent similarity scores"""
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'exact_hits': self.exact_hits,
+            'similar_hits': self.similar_hits,
+            'misses': self.misses,
+            'hit_ratio': round((self.exact_hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+            'similarity_enabled': self._index is not None,
+            'similarity_threshold': self.threshold,
+            'recent_similarity_scores': list(self.recent_scores)
+        }
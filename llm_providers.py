@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+LLM provider clients for the Mood Music App
+
+Each provider is set up once per process (lazily, on first use) and then
+shared by every request thread, instead of being re-imported and
+reconfigured on each mood description.
+"""
+
+import asyncio
+import threading
+from typing import Dict, Optional
+
+import requests
+
+GEMINI_MODEL = 'gemini-pro'
+# Using a free model like mistralai/Mistral-7B-Instruct-v0.2 or meta-llama/Llama-2-7b-chat-hf
+HUGGINGFACE_MODEL_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.2"
+
+
+class GeminiProvider:
+    """Configured google.generativeai model, created on first use.
+    With api_base (e.g. a local stand-in server) the REST transport is used against that host"""
+
+    def __init__(self, api_key: Optional[str], model_name: str = GEMINI_MODEL, api_base: Optional[str] = None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.api_base = api_base
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The shared GenerativeModel; safe to call from any thread"""
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    if self.api_base:
+                        genai.configure(api_key=self.api_key, transport='rest',
+                                        client_options={'api_endpoint': self.api_base})
+                    else:
+                        genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+                model = self._model
+        return model
+
+    def generate(self, prompt: str) -> str:
+        """Completion text for a prompt (blocking, no timeout of its own)"""
+        return self.model.generate_content(prompt).text
+
+    async def generate_async(self, prompt: str) -> str:
+        if self.api_base:
+            # The SDK's async client is gRPC only
+            return await asyncio.to_thread(self.generate, prompt)
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+
+class HuggingFaceProvider:
+    """Hugging Face Inference API text generation over a shared keep-alive session"""
+
+    def __init__(self, api_key: Optional[str], session: Optional[requests.Session] = None,
+                 url: str = HUGGINGFACE_MODEL_URL):
+        self.api_key = api_key
+        self.url = url
+        self.session = session or requests.Session()
+        # Built once; requests only reads the headers dict, so it can be shared
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def request(self, prompt: str, max_new_tokens: int = 150) -> Dict:
+        """Headers and payload for one text generation call"""
+        return {
+            'headers': self.headers,
+            'json': {
+                "inputs": prompt,
+                "parameters": {
+                    "max_new_tokens": max_new_tokens,
+                    "temperature": 0.7,
+                    "return_full_text": False
+                }
+            }
+        }
+
+    def post(self, prompt: str, timeout: float, max_new_tokens: int = 150) -> requests.Response:
+        return self.session.post(self.url, timeout=timeout, **self.request(prompt, max_new_tokens))
+
+    def generate(self, prompt: str, timeout: float, max_new_tokens: int = 150) -> str:
+        """Generated text for a prompt; raises on HTTP errors"""
+        response = self.post(prompt, timeout, max_new_tokens)
+        response.raise_for_status()
+        return response.json()[0].get('generated_text', '')
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Lightweight latency and counter metrics for the Mood Music App
+
+StageMetrics times the stages of the search pipeline. The spans of the
+current request (thread or asyncio task) are also collected for the
+Server-Timing header, and everything can be rendered in the Prometheus text
+exposition format for /metrics.
+"""
+
+import time
+import asyncio
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class LatencyHistogram:
+    """Cumulative bucketed latency histogram plus a window of recent samples for percentiles"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, window: int = 200):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+            self.count += 1
+            self.sum += seconds
+            self._recent.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q-th percentile (0-100) of the recent samples, or None if there are none"""
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(q / 100 * (len(samples) - 1)))))
+        return samples[index]
+
+    def cumulative(self) -> Tuple[List[Tuple[str, int]], float, int]:
+        """([(le, cumulative count), ...], sum, count) as Prometheus histograms want them"""
+        with self._lock:
+            counts = list(self.counts)
+            count, total = self.count, self.sum
+        buckets, running = [], 0
+        for bound, n in zip([repr(float(b)) for b in self.buckets] + ['+Inf'], counts):
+            running += n
+            buckets.append((bound, running))
+        return buckets, total, count
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self.counts)
+            count, total = self.count, self.sum
+        return {
+            'count': count,
+            'mean': round(total / count, 4) if count else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'buckets': {str(bound): n for bound, n in zip(list(self.buckets) + ['+Inf'], counts)}
+        }
+
+
+class ProviderStats:
+    """Per-provider call latency histograms and win/failure counts"""
+
+    def __init__(self):
+        self._providers: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, provider: str) -> Dict:
+        with self._lock:
+            if provider not in self._providers:
+                self._providers[provider] = {
+                    'latency': LatencyHistogram(),
+                    'calls': 0,
+                    'failures': 0,
+                    'wins': 0
+                }
+            return self._providers[provider]
+
+    def record_call(self, provider: str, seconds: float, ok: bool):
+        entry = self._entry(provider)
+        entry['latency'].observe(seconds)
+        with self._lock:
+            entry['calls'] += 1
+            if not ok:
+                entry['failures'] += 1
+
+    def record_win(self, provider: str):
+        entry = self._entry(provider)
+        with self._lock:
+            entry['wins'] += 1
+
+    def latency(self, provider: str) -> LatencyHistogram:
+        return self._entry(provider)['latency']
+
+    def entries(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._providers.items()}
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            providers = dict(self._providers)
+        return {
+            name: {
+                'calls': entry['calls'],
+                'failures': entry['failures'],
+                'wins': entry['wins'],
+                'latency': entry['latency'].snapshot()
+            }
+            for name, entry in providers.items()
+        }
+
+
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('request_spans', default=None)
+
+
+class StageMetrics:
+    """Latency histograms and ok/error counters per pipeline stage"""
+
+    def __init__(self):
+        self._stages: Dict[str, LatencyHistogram] = {}
+        self._outcomes: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, stage: str) -> LatencyHistogram:
+        with self._lock:
+            if stage not in self._stages:
+                self._stages[stage] = LatencyHistogram()
+            return self._stages[stage]
+
+    def observe(self, stage: str, seconds: float, ok: bool = True):
+        self._histogram(stage).observe(seconds)
+        with self._lock:
+            key = (stage, 'ok' if ok else 'error')
+            self._outcomes[key] = self._outcomes.get(key, 0) + 1
+        self.record_span(stage, seconds)
+
+    def record_span(self, stage: str, seconds: float):
+        """Add a span to the current request's Server-Timing only (no histogram)"""
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, seconds))
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.observe(stage, time.perf_counter() - start, ok)
+
+    def begin_request(self):
+        """Start collecting this request's spans; returns a token for end_request"""
+        return _request_spans.set([])
+
+    def end_request(self, token) -> List[Tuple[str, float]]:
+        spans = _request_spans.get() or []
+        _request_spans.reset(token)
+        return spans
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stages = dict(self._stages)
+            outcomes = dict(self._outcomes)
+        return {
+            stage: dict(histogram.snapshot(), errors=outcomes.get((stage, 'error'), 0))
+            for stage, histogram in stages.items()
+        }
+
+    def stages(self) -> Tuple[Dict[str, LatencyHistogram], Dict[Tuple[str, str], int]]:
+        with self._lock:
+            return dict(self._stages), dict(self._outcomes)
+
+
+def timed(stage: str):
+    """Method decorator: time the call as a stage of self.metrics (sync or async)"""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(self, *args, **kwargs):
+                with self.metrics.span(stage):
+                    return await fn(self, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.span(stage):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def server_timing(spans: Iterable[Tuple[str, float]]) -> str:
+    """Server-Timing header value; repeated stages are summed, in first-seen order"""
+    totals: Dict[str, float] = {}
+    for stage, seconds in spans:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ', '.join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+def _label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name: str, label: str, histograms: Dict[str, LatencyHistogram]) -> List[str]:
+    lines = []
+    for key, histogram in sorted(histograms.items()):
+        buckets, total, count = histogram.cumulative()
+        labels = f'{label}="{_label_value(key)}"'
+        for bound, n in buckets:
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {n}')
+        lines.append(f'{name}_sum{{{labels}}} {total:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {count}')
+    return lines
+
+
+def render_prometheus(stages: StageMetrics, providers: ProviderStats, gauges: Optional[Dict[str, Tuple[str, float]]] = None,
+                      prefix: str = 'moodmusic') -> str:
+    """Prometheus text exposition (format 0.0.4) of the stage and provider metrics.
+    gauges maps a metric name to (help text, value)."""
+    stage_histograms, outcomes = stages.stages()
+    lines = [
+        f'# HELP {prefix}_stage_duration_seconds Time spent in each stage of the search pipeline',
+        f'# TYPE {prefix}_stage_duration_seconds histogram',
+        *_histogram_lines(f'{prefix}_stage_duration_seconds', 'stage', stage_histograms),
+        f'# HELP {prefix}_stage_total Completed stage calls by outcome',
+        f'# TYPE {prefix}_stage_total counter',
+        *(f'{prefix}_stage_total{{stage="{_label_value(stage)}",outcome="{outcome}"}} {n}'
+          for (stage, outcome), n in sorted(outcomes.items()))
+    ]
+
+    entries = providers.entries()
+    lines += [
+        f'# HELP {prefix}_llm_provider_duration_seconds LLM provider call latency',
+        f'# TYPE {prefix}_llm_provider_duration_seconds histogram',
+        *_histogram_lines(f'{prefix}_llm_provider_duration_seconds', 'provider',
+                          {name: entry['latency'] for name, entry in entries.items()})
+    ]
+    for counter, help_text in (('calls', 'LLM provider calls'), ('failures', 'Failed LLM provider calls'),
+                               ('wins', 'Interpretations served per provider')):
+        lines.append(f'# HELP {prefix}_llm_provider_{counter}_total {help_text}')
+        lines.append(f'# TYPE {prefix}_llm_provider_{counter}_total counter')
+        lines += [f'{prefix}_llm_provider_{counter}_total{{provider="{_label_value(name)}"}} {entry[counter]}'
+                  for name, entry in sorted(entries.items())]
+
+    for name, (help_text, value) in sorted((gauges or {}).items()):
+        lines.append(f'# HELP {prefix}_{name} {help_text}')
+        lines.append(f'# TYPE {prefix}_{name} gauge')
+        lines.append(f'{prefix}_{name} {value}')
+    return '\n'.join(lines) + '\n'
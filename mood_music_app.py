@@ -4,13 +4,16 @@ Mood Music App - Plays music based on user mood with feedback loop
 """
 
 import os
-import json
 import random
+import sqlite3
 import requests
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 from colorama import init, Fore, Style
 from datetime import datetime
+from storage import create_preference_store
+from video_store import VideoStore, video_card
 
 # Initialize colorama for Windows
 init(autoreset=True)
@@ -22,7 +25,13 @@ class MoodMusicApp:
     def __init__(self):
         self.api_key = os.getenv('YOUTUBE_API_KEY')
         self.preferences_file = 'user_preferences.json'
+        self.store = create_preference_store(self.preferences_file)  # json, sqlite or journal (PREFERENCES_BACKEND)
+        self._dirty_moods = set()
         self.preferences = self.load_preferences()
+        # Video cards shared with the web app; searched queries can be shown again offline
+        self.video_store = VideoStore(os.getenv('VIDEO_STORE_FILE', 'videos.db'))
+        # Fetches the next results page while the user is listening
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
         
         # Mood to music mapping with initial keywords
         self.mood_keywords = {
@@ -37,23 +46,13 @@ class MoodMusicApp:
         }
         
     def load_preferences(self) -> Dict:
-        """Load user preferences from file"""
-        if os.path.exists(self.preferences_file):
-            try:
-                with open(self.preferences_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {
-            'mood_history': [],
-            'feedback_history': [],
-            'refined_keywords': {}
-        }
+        """Load user preferences from the configured store"""
+        return self.store.load()
     
     def save_preferences(self):
-        """Save user preferences to file"""
-        with open(self.preferences_file, 'w') as f:
-            json.dump(self.preferences, f, indent=2)
+        """Save user preferences (only new history and changed moods for incremental stores)"""
+        dirty_moods, self._dirty_moods = self._dirty_moods, set()
+        self.store.save(self.preferences, dirty_moods=dirty_moods)
     
     def get_user_mood(self) -> str:
         """Get mood input from user"""
@@ -103,7 +102,10 @@ class MoodMusicApp:
             'query': query,
             'timestamp': datetime.now().isoformat()
         }
-        self.preferences['feedback_history'].append(feedback_entry)
+        if self.store.retain_history:
+            self.preferences['feedback_history'].append(feedback_entry)
+        self.store.record_feedback(feedback_entry)
+        self._dirty_moods.add(mood)
         
         # Learn from feedback
         if feedback == 'like':
@@ -134,13 +136,17 @@ class MoodMusicApp:
     
     def search_youtube(self, query: str, max_results: int = 5) -> List[Dict]:
         """Search YouTube for music videos"""
+        return self.search_page(query, max_results)[0]
+    
+    def search_page(self, query: str, max_results: int = 5, page_token: str = None) -> Tuple[List[Dict], Optional[str]]:
+        """One page of search results and the token of the next page"""
         if not self.api_key:
             print(f"{Fore.RED}Error: YouTube API key not found!")
             print(f"{Fore.YELLOW}Please set YOUTUBE_API_KEY in .env file")
             print(f"{Fore.YELLOW}You can still see the app structure, but YouTube search won't work without an API key.")
-            return []
+            return self.stored_results(query, page_token), None
         
-        url = "https://www.googleapis.com/youtube/v3/search"
+        url = f"{os.getenv('YOUTUBE_API_BASE', 'https://www.googleapis.com/youtube/v3').rstrip('/')}/search"
         params = {
             'part': 'snippet',
             'q': query,
@@ -149,25 +155,38 @@ class MoodMusicApp:
             'key': self.api_key,
             'videoCategoryId': '10'  # Music category
         }
+        if page_token:
+            params['pageToken'] = page_token
         
         try:
             response = requests.get(url, params=params)
             response.raise_for_status()
             data = response.json()
-            
-            videos = []
-            for item in data.get('items', []):
-                videos.append({
-                    'title': item['snippet']['title'],
-                    'video_id': item['id']['videoId'],
-                    'url': f"https://www.youtube.com/watch?v={item['id']['videoId']}",
-                    'thumbnail': item['snippet']['thumbnails']['default']['url']
-                })
-            
-            return videos
         except requests.exceptions.RequestException as e:
             print(f"{Fore.RED}Error searching YouTube: {e}")
+            return self.stored_results(query, page_token), None
+        
+        videos = [video_card(item) for item in data.get('items', []) if item.get('id', {}).get('videoId')]
+        try:
+            if page_token:
+                self.video_store.put_many(videos)
+            else:
+                self.video_store.put_results(query, videos)
+        except sqlite3.Error as e:
+            print(f"{Fore.RED}Error saving videos: {e}")
+        return videos, data.get('nextPageToken')
+    
+    def stored_results(self, query: str, page_token: str = None) -> List[Dict]:
+        """Videos this query returned last time (web app or CLI), when YouTube cannot be reached"""
+        if page_token:
+            return []
+        try:
+            videos = self.video_store.results(query)
+        except sqlite3.Error:
             return []
+        if videos:
+            print(f"{Fore.YELLOW}Showing the results saved for this search last time.")
+        return videos
     
     def display_results(self, videos: List[Dict], mood: str):
         """Display search results to user"""
@@ -181,6 +200,8 @@ class MoodMusicApp:
         
         for i, video in enumerate(videos, 1):
             print(f"{Fore.CYAN}{i}. {Fore.WHITE}{video['title']}")
+            if video.get('duration_text'):
+                print(f"   {Fore.WHITE}{video.get('channel') or ''} ({video['duration_text']})")
             print(f"   {Fore.YELLOW}URL: {video['url']}\n")
         
         return videos
@@ -212,36 +233,54 @@ class MoodMusicApp:
                 mood = self.get_user_mood()
                 
                 # Record mood in history
-                self.preferences['mood_history'].append({
+                mood_entry = {
                     'mood': mood,
                     'timestamp': datetime.now().isoformat()
-                })
+                }
+                if self.store.retain_history:
+                    self.preferences['mood_history'].append(mood_entry)
+                self.store.record_mood(mood_entry)
                 
                 # Get search query based on mood and preferences
                 query = self.get_search_query(mood)
                 print(f"\n{Fore.YELLOW}Searching for: {query}...")
                 
                 # Search YouTube
-                videos = self.search_youtube(query)
+                videos, page_token = self.search_page(query)
+                shown = set()
                 
-                # Display results
-                displayed_videos = self.display_results(videos, mood)
-                
-                if displayed_videos:
-                    # Get feedback
-                    feedback = self.get_feedback(mood)
+                while True:
+                    videos = [video for video in videos if video['video_id'] not in shown]
+                    shown.update(video['video_id'] for video in videos)
+                    # Prefetch the next page so "more like these" needs no wait
+                    next_page = self._prefetch_pool.submit(self.search_page, query, 5, page_token) if page_token else None
                     
-                    if feedback != 'skip':
-                        # Refine keywords based on feedback
-                        self.refine_keywords(mood, feedback, query)
-                        print(f"{Fore.GREEN}Thank you for your feedback! I'll remember your preference.")
+                    # Display results
+                    displayed_videos = self.display_results(videos, mood)
                     
-                    # Save preferences
-                    self.save_preferences()
-                
-                # Ask if user wants to continue
-                print(f"\n{Fore.CYAN}{'='*60}")
-                continue_choice = input(f"{Fore.CYAN}Would you like to search for more music? (y/n): ").strip().lower()
+                    if displayed_videos:
+                        # Get feedback
+                        feedback = self.get_feedback(mood)
+                        
+                        if feedback != 'skip':
+                            # Refine keywords based on feedback
+                            self.refine_keywords(mood, feedback, query)
+                            print(f"{Fore.GREEN}Thank you for your feedback! I'll remember your preference.")
+                        
+                        # Save preferences
+                        self.save_preferences()
+                    
+                    # Ask if user wants to continue
+                    print(f"\n{Fore.CYAN}{'='*60}")
+                    continue_choice = input(f"{Fore.CYAN}Would you like to search for more music? (y/n, m = more like these): ").strip().lower()
+                    
+                    if continue_choice != 'm':
+                        break
+                    if next_page is None:
+                        print(f"{Fore.YELLOW}No more results for this search, let's pick a mood again.")
+                        continue_choice = 'y'
+                        break
+                    videos, page_token = next_page.result()
                 
                 if continue_choice != 'y':
                     print(f"{Fore.YELLOW}Thanks for using Mood Music App! Goodbye!")
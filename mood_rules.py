@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Compiled rule-based mood interpreter
+
+Used when no LLM is available. The keyword tables are compiled once at import
+into hash tables over word tokens, so interpreting a description is one
+tokenizing pass plus set lookups. Keywords only match whole words ("sad" no
+longer matches inside "crusade"), and a negation word ("not", "don't", ...)
+turns keywords in the next few words of the same clause into a strong
+negative signal. Popular descriptions repeat a lot, so results are memoized.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+# Mood -> keywords. Order matters: ties go to the mood listed first.
+MOOD_KEYWORDS = {
+    'happy': ['happy', 'joyful', 'cheerful', 'upbeat', 'excited', 'celebrating', 'glad', 'pleased'],
+    'sad': ['sad', 'down', 'depressed', 'melancholic', 'lonely', 'heartbroken', 'breakup', 'upset', 'unhappy'],
+    'energetic': ['energetic', 'pumped', 'workout', 'exercise', 'active', 'motivated', 'pumped up'],
+    'relaxed': ['relaxed', 'chill', 'calm', 'peaceful', 'meditation', 'zen', 'serene', 'tranquil'],
+    'focused': ['focused', 'study', 'work', 'concentration', 'productive', 'lo-fi', 'studying', 'working'],
+    'romantic': ['romantic', 'love', 'intimate', 'dating', 'relationship', 'loving'],
+    'angry': ['angry', 'frustrated', 'aggressive', 'intense', 'heavy', 'mad', 'irritated'],
+    'nostalgic': ['nostalgic', 'retro', 'vintage', 'old', 'classic', 'memories', 'remembering'],
+    'neutral': ['neutral', 'indifferent', 'neither', 'ambivalent', 'mixed', 'confused']
+}
+
+MOOD_QUERIES = {
+    'happy': "upbeat happy energetic music",
+    'sad': "sad emotional melancholic music",
+    'energetic': "high energy motivational music",
+    'relaxed': "chill ambient peaceful music",
+    'focused': "study focus instrumental music",
+    'romantic': "romantic love songs music",
+    'angry': "intense powerful aggressive music",
+    'nostalgic': "classic retro vintage music",
+    # For neutral/ambiguous moods, use ambient or instrumental
+    'neutral': "ambient instrumental background music"
+}
+
+NEGATION_WORDS = ['not', 'nor', 'neither', 'no', 'never', "don't", "doesn't", "isn't", "aren't",
+                  "won't", "can't", 'cannot']
+
+# A negation covers this many following words, and never crosses clause punctuation or "but"
+NEGATION_SCOPE = 3
+
+NEGATED_KEYWORD_SCORE = -2
+KEYWORD_SCORE = 1
+
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9'-]+|[,.;:!?]")
+_NEEDS_TOKENIZER = re.compile(r"[^a-z0-9' -]")
+_CLAUSE_BREAKS = frozenset(',.;:!?') | {'but'}
+
+
+def _compile():
+    """Build the keyword -> moods table and the multi-word phrase table"""
+    mood_index = {mood: i for i, mood in enumerate(MOOD_KEYWORDS)}
+    keyword_moods: Dict[str, Tuple[int, ...]] = {}
+    for mood, keywords in MOOD_KEYWORDS.items():
+        for keyword in keywords:
+            keyword_moods[keyword] = keyword_moods.get(keyword, ()) + (mood_index[mood],)
+
+    # First word -> [(remaining words, phrase)] for multi-word keywords such as "pumped up"
+    phrases: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+    for keyword in keyword_moods:
+        words = keyword.split()
+        if len(words) > 1:
+            phrases.setdefault(words[0], []).append((tuple(words[1:]), keyword))
+
+    return keyword_moods, frozenset(k for k in keyword_moods if ' ' not in k), phrases
+
+
+_KEYWORD_MOODS, _SINGLE_WORD_KEYWORDS, _PHRASES = _compile()
+_PHRASE_STARTS = frozenset(_PHRASES)
+_MOODS = list(MOOD_KEYWORDS)
+_NEGATIONS = frozenset(NEGATION_WORDS)
+
+
+def tokenize(mood_description: str) -> List[str]:
+    """Lowercase word tokens, with clause punctuation kept as separate tokens"""
+    text = mood_description.lower()
+    if _NEEDS_TOKENIZER.search(text) is None:
+        # Plain words and spaces only (the common case)
+        return text.split()
+    return _TOKEN_PATTERN.findall(text.replace('’', "'"))
+
+
+def _phrases_at(tokens: List[str], i: int) -> List[str]:
+    """Multi-word keywords starting at tokens[i]"""
+    return [phrase for rest, phrase in _PHRASES.get(tokens[i], ())
+            if tuple(tokens[i + 1:i + 1 + len(rest)]) == rest]
+
+
+def score_moods(mood_description: str) -> Tuple[List[int], bool]:
+    """Return (score per mood in MOOD_KEYWORDS order, whether a negation was seen)"""
+    tokens = tokenize(mood_description)
+    scores = [0] * len(_MOODS)
+
+    if _NEGATIONS.isdisjoint(tokens):
+        # Common case: no negation, so every distinct keyword simply scores once
+        found = _SINGLE_WORD_KEYWORDS.intersection(tokens)
+        if not _PHRASE_STARTS.isdisjoint(found):
+            found = found.union(*(_phrases_at(tokens, i) for i, token in enumerate(tokens)
+                                  if token in _PHRASE_STARTS))
+        for keyword in found:
+            for mood in _KEYWORD_MOODS[keyword]:
+                scores[mood] += KEYWORD_SCORE
+        return scores, False
+
+    # Single pass with a token-scoped negation; only the first occurrence of a keyword counts
+    seen = set()
+    negation_left = 0  # words still covered by the last negation
+    for i, token in enumerate(tokens):
+        if token in _CLAUSE_BREAKS:
+            negation_left = 0
+            continue
+        if token in _SINGLE_WORD_KEYWORDS or token in _PHRASE_STARTS:
+            delta = NEGATED_KEYWORD_SCORE if negation_left else KEYWORD_SCORE
+            for keyword in [token] + _phrases_at(tokens, i):
+                if keyword in _KEYWORD_MOODS and keyword not in seen:
+                    seen.add(keyword)
+                    for mood in _KEYWORD_MOODS[keyword]:
+                        scores[mood] += delta
+        if token in _NEGATIONS:
+            negation_left = NEGATION_SCOPE
+        elif negation_left:
+            negation_left -= 1
+
+    return scores, True
+
+
+def _result(mood: str, has_negation: bool) -> Tuple[str, str, str]:
+    if has_negation and mood == 'neutral':
+        interpretation = "Ambiguous or neutral mood detected - suggesting ambient music"
+    elif has_negation:
+        interpretation = f"Detected {mood} mood (noting negations in your description)"
+    else:
+        interpretation = f"Detected {mood} mood from your description"
+    return mood, MOOD_QUERIES[mood], interpretation
+
+
+# (mood, negation seen) -> (mood_label, search_query, interpretation)
+_RESULTS = {(mood, has_negation): _result(mood, has_negation) for mood in _MOODS for has_negation in (False, True)}
+
+
+@lru_cache(maxsize=4096)
+def _interpret_cached(mood_description: str) -> Tuple[str, str, str]:
+    scores, has_negation = score_moods(mood_description)
+
+    # Find the mood with highest positive score; all negative or zero means neutral/ambiguous
+    best_score = max(scores)
+    return _RESULTS[_MOODS[scores.index(best_score)] if best_score > 0 else 'neutral', has_negation]
+
+
+def interpret(mood_description: str) -> Dict[str, str]:
+    """Interpret a mood description into a mood label, search query and explanation"""
+    mood_label, search_query, interpretation = _interpret_cached(mood_description)
+    return {
+        'mood_label': mood_label,
+        'search_query': search_query,
+        'interpretation': interpretation
+    }
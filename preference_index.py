@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+In-memory index of liked/disliked videos for the Mood Music App
+
+refined_keywords keeps liked_videos / disliked_videos as lists of dicts
+(video_id, title, timestamp). This index mirrors them as per-mood and global
+sets of video IDs so membership checks and de-duplication are O(1).
+
+A compact copy (IDs only) is kept in a sidecar JSON file and loaded at
+startup when it still matches the preferences; otherwise the index is
+rebuilt from refined_keywords. The sidecar is a full rewrite, so owners
+save it at shutdown rather than after every change.
+"""
+
+import os
+import json
+import threading
+from typing import Dict, List, Optional, Set
+
+KINDS = ('liked', 'disliked')
+
+
+def _signature(refined_keywords: Dict) -> List[int]:
+    """Cheap fingerprint of refined_keywords: mood count and list lengths"""
+    return [
+        len(refined_keywords),
+        sum(len(entry.get('liked_videos', [])) for entry in refined_keywords.values()),
+        sum(len(entry.get('disliked_videos', [])) for entry in refined_keywords.values())
+    ]
+
+
+class PreferenceIndex:
+    """Per-mood and global sets of liked/disliked video IDs"""
+
+    def __init__(self, path: Optional[str] = 'preference_index.json'):
+        self.path = path
+        self.moods: Dict[str, Dict[str, Set[str]]] = {}
+        self.totals = {kind: {} for kind in KINDS}  # video_id -> number of moods it has that feedback in
+        self._dirty = False
+        self.loaded_from_sidecar = False
+        self._lock = threading.Lock()
+
+    def load(self, refined_keywords: Dict) -> List[str]:
+        """Load the sidecar if it matches refined_keywords, else rebuild from it.
+        Returns the moods whose video lists had duplicates removed."""
+        self.loaded_from_sidecar = self._load_sidecar(refined_keywords)
+        if self.loaded_from_sidecar:
+            return []
+        return self.rebuild(refined_keywords)
+
+    def _load_sidecar(self, refined_keywords: Dict) -> bool:
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load preference index: {e}")
+            return False
+        if data.get('signature') != _signature(refined_keywords):
+            return False
+        with self._lock:
+            self.moods = {}
+            self.totals = {kind: {} for kind in KINDS}
+            for mood, entry in data.get('moods', {}).items():
+                for kind in KINDS:
+                    for video_id in entry.get(kind[0], []):
+                        self._add_locked(mood, kind, video_id)
+            self._dirty = False
+        return True
+
+    def rebuild(self, refined_keywords: Dict) -> List[str]:
+        """Index refined_keywords from scratch, dropping duplicate video entries in place"""
+        deduplicated = []
+        with self._lock:
+            self.moods = {}
+            self.totals = {kind: {} for kind in KINDS}
+            for mood, entry in refined_keywords.items():
+                changed = False
+                for kind in KINDS:
+                    videos = entry.get(f'{kind}_videos', [])
+                    kept = [v for v in videos if self._add_locked(mood, kind, v.get('video_id'))]
+                    if len(kept) != len(videos):
+                        entry[f'{kind}_videos'] = kept
+                        changed = True
+                if changed:
+                    deduplicated.append(mood)
+            self._dirty = True
+        return deduplicated
+
+    def _add_locked(self, mood: str, kind: str, video_id: Optional[str]) -> bool:
+        if not video_id:
+            return False
+        ids = self.moods.setdefault(mood, {'liked': set(), 'disliked': set()})[kind]
+        if video_id in ids:
+            return False
+        ids.add(video_id)
+        self.totals[kind][video_id] = self.totals[kind].get(video_id, 0) + 1
+        return True
+
+    def add(self, mood: str, kind: str, video_id: Optional[str]) -> bool:
+        """Record feedback; True if the video was not yet liked/disliked for this mood"""
+        with self._lock:
+            added = self._add_locked(mood, kind, video_id)
+            if added:
+                self._dirty = True
+            return added
+
+    def replace(self, mood: str, entry: Dict):
+        """Re-index one mood from its refined_keywords entry (e.g. after another process changed it)"""
+        with self._lock:
+            old = self.moods.pop(mood, None)
+            if old is not None:
+                for kind in KINDS:
+                    for video_id in old[kind]:
+                        count = self.totals[kind][video_id] - 1
+                        if count:
+                            self.totals[kind][video_id] = count
+                        else:
+                            del self.totals[kind][video_id]
+            for kind in KINDS:
+                for video in entry.get(f'{kind}_videos', []):
+                    self._add_locked(mood, kind, video.get('video_id'))
+            self._dirty = True
+
+    def contains(self, mood: str, kind: str, video_id: str) -> bool:
+        entry = self.moods.get(mood)
+        return entry is not None and video_id in entry[kind]
+
+    def ids(self, mood: str, kind: str) -> Set[str]:
+        """Video IDs with this feedback for a mood (do not modify)"""
+        entry = self.moods.get(mood)
+        return entry[kind] if entry is not None else set()
+
+    def anywhere(self, kind: str, video_id: str) -> int:
+        """Number of moods in which a video got this feedback"""
+        return self.totals[kind].get(video_id, 0)
+
+    def save(self, refined_keywords: Dict):
+        """Write the compact sidecar if anything changed since the last save"""
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            data = {
+                'signature': _signature(refined_keywords),
+                'moods': {
+                    mood: {kind[0]: sorted(entry[kind]) for kind in KINDS if entry[kind]}
+                    for mood, entry in self.moods.items()
+                }
+            }
+            self._dirty = False
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self._dirty = True
+            print(f"Could not save preference index: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            'moods': len(self.moods),
+            'liked_videos': len(self.totals['liked']),
+            'disliked_videos': len(self.totals['disliked'])
+        }
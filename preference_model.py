@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Incremental per-mood preference model for the Mood Music App
+
+Each refined_keywords entry carries a 'model' dict with exponentially
+decayed like/dislike counts per query, per channel and per title token:
+
+    {'q': {query: [likes, dislikes, updated]}, 'c': {...}, 't': {...}, 'n': updates}
+
+Counts are decayed lazily when touched, so an update is O(1) and nothing
+ever re-scans feedback_history. The model is only written by update(),
+under the user's transaction; searches read it without the lock. Queries are picked by Thompson sampling;
+the channel and title-token counts are what ranking.py scores candidates
+against.
+"""
+
+import re
+import time
+import random
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+KINDS = ('q', 'c', 't')
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def _title_tokens(title: str) -> List[str]:
+    return list({t for t in _TOKEN_PATTERN.findall(title.lower()) if len(t) > 2})
+
+
+def _timestamp(iso: Optional[str], default: float) -> float:
+    try:
+        return datetime.fromisoformat(iso).timestamp()
+    except (TypeError, ValueError):
+        return default
+
+
+class PreferenceModel:
+    """Decayed counts and a Thompson-sampling query selector over refined_keywords entries"""
+
+    def __init__(self, half_life_days: float = 30.0, max_tokens: int = 300, rng: Optional[random.Random] = None):
+        self.half_life = half_life_days * 86400
+        self.max_tokens = max_tokens
+        self.rng = rng or random.Random()
+
+    def _decayed(self, counts: List[float], now: float) -> Tuple[float, float]:
+        factor = 0.5 ** (max(0.0, now - counts[2]) / self.half_life)
+        return counts[0] * factor, counts[1] * factor
+
+    def model(self, entry: Dict) -> Dict:
+        """The entry's model, or for entries that predate it one seeded from
+        successful_queries and liked/disliked_videos (not stored; see ensure_model)"""
+        model = entry.get('model')
+        return model if model is not None else self._seed(entry)
+
+    def ensure_model(self, entry: Dict) -> Dict:
+        """The entry's model, created and stored on first use. Writes the entry, so only
+        call it where the entry may change (UserShard.transaction)"""
+        model = entry.get('model')
+        if model is None:
+            model = entry['model'] = self._seed(entry)
+        return model
+
+    def _seed(self, entry: Dict) -> Dict:
+        now = time.time()
+        model = {kind: {} for kind in KINDS}
+        model['n'] = 0
+        for query in entry.get('successful_queries', []):
+            model['q'][query] = [1.0, 0.0, now]
+        # Replayed oldest first, so each count decays from its own feedback time
+        history = sorted(((_timestamp(video.get('timestamp'), now), liked, video)
+                          for liked, key in ((True, 'liked_videos'), (False, 'disliked_videos'))
+                          for video in entry.get(key, [])), key=lambda item: item[0])
+        for timestamp, liked, video in history:
+            self._learn_video(model, liked, video.get('channel'), video.get('title'), timestamp)
+        return model
+
+    def _bump(self, table: Dict, key: str, liked: bool, now: float):
+        likes, dislikes = self._decayed(table[key], now) if key in table else (0.0, 0.0)
+        if liked:
+            likes += 1.0
+        else:
+            dislikes += 1.0
+        table[key] = [round(likes, 4), round(dislikes, 4), round(now, 1)]
+
+    def update(self, entry: Dict, feedback: str, query: str, video_channel: Optional[str] = None,
+               video_title: Optional[str] = None, now: Optional[float] = None):
+        """Apply one like/dislike (neutral feedback is ignored)"""
+        if feedback not in ('like', 'dislike'):
+            return
+        liked = feedback == 'like'
+        now = now or time.time()
+        model = self.ensure_model(entry)
+        if query:
+            self._bump(model['q'], query, liked, now)
+        self._learn_video(model, liked, video_channel, video_title, now)
+
+    def _learn_video(self, model: Dict, liked: bool, video_channel: Optional[str], video_title: Optional[str],
+                     now: float):
+        if video_channel:
+            self._bump(model['c'], video_channel, liked, now)
+        if video_title:
+            for token in _title_tokens(video_title):
+                self._bump(model['t'], token, liked, now)
+            if len(model['t']) > self.max_tokens:
+                self._prune(model['t'], now)
+        model['n'] = model.get('n', 0) + 1
+
+    def _prune(self, table: Dict, now: float):
+        """Drop the least supported tokens, down to 80% of max_tokens"""
+        keep = sorted(table, key=lambda key: sum(self._decayed(table[key], now)), reverse=True)
+        for key in keep[int(self.max_tokens * 0.8):]:
+            del table[key]
+
+    def affinities(self, entry: Dict, kind: str, now: Optional[float] = None) -> Dict[str, float]:
+        """Decayed likes minus dislikes per query ('q'), channel ('c') or title token ('t')"""
+        now = now or time.time()
+        affinities = {}
+        # Searches read without the shard lock while feedback may add and prune keys; counts
+        # lists are replaced rather than changed, so a copy of the items is a consistent view
+        for key, counts in list(self.model(entry)[kind].items()):
+            likes, dislikes = self._decayed(counts, now)
+            affinities[key] = likes - dislikes
+        return affinities
+
+    def choose_query(self, entry: Dict) -> Optional[str]:
+        """Thompson sampling over successful_queries
+
+        Each query draws from Beta(1 + likes, 1 + dislikes). A fresh query
+        (None, i.e. ask the interpreter) competes with a Beta(1, 1) draw, so
+        moods whose known queries keep getting disliked go back to exploring.
+        """
+        queries = entry.get('successful_queries', [])
+        if not queries:
+            return None
+        # Without a stored model every query counts as one like, as a seeded model would have it
+        table = entry.get('model', {}).get('q', {})
+        now = time.time()
+        best, best_draw = None, self.rng.betavariate(1.0, 1.0)
+        for query in list(queries):
+            counts = table.get(query)
+            likes, dislikes = self._decayed(counts, now) if counts is not None else (1.0, 0.0)
+            draw = self.rng.betavariate(1.0 + likes, 1.0 + dislikes)
+            if draw > best_draw:
+                best, best_draw = query, draw
+        return best
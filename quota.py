@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+YouTube Data API quota scheduler for the Mood Music App
+
+The API grants a daily budget of units (10,000 by default); search.list
+costs 100 units per call. Every YouTube request takes its cost from a token
+bucket that holds one day's budget and refills continuously over 24 hours.
+Once YouTube itself answers quotaExceeded, the bucket stays empty until its
+daily reset at midnight Pacific time, and then starts full again.
+
+Lanes:
+    interactive - a user is waiting; may use the bucket down to empty
+    background  - prefetching and batch work; must leave background_reserve
+                  of the budget for interactive requests
+
+Below degrade_below of the budget the app is "degraded": cached pages are
+served even when expired, and only true misses spend units.
+
+The quota belongs to the API key, not to a process, so with a path the
+bucket is one row in an SQLite file that every worker process (and restart)
+shares; each change is a single IMMEDIATE transaction. Without a path the
+bucket lives in memory, and N worker processes would spend N times the
+daily budget between them.
+"""
+
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo
+    PACIFIC = ZoneInfo('America/Los_Angeles')
+except (ImportError, KeyError):  # no tz database (e.g. Windows without tzdata): standard time all year
+    PACIFIC = timezone(timedelta(hours=-8))
+
+SEARCH_COST = 100
+VIDEOS_LIST_COST = 1
+
+LANES = ('interactive', 'background')
+
+
+class QuotaExceededError(Exception):
+    """Raised when a request's lane has no quota left"""
+
+
+def next_quota_reset(now: float) -> float:
+    """Epoch seconds of the next midnight Pacific time, when YouTube resets daily quotas"""
+    today = datetime.fromtimestamp(now, PACIFIC)
+    tomorrow = (today + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return tomorrow.timestamp()
+
+
+class QuotaScheduler:
+    """Token bucket over the daily YouTube quota with priority lanes"""
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS quota (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL,
+            closed_until REAL NOT NULL,
+            spent INTEGER NOT NULL
+        );
+    '''
+
+    def __init__(self, daily_units: int = 10000, background_reserve: float = 0.25, degrade_below: float = 0.05,
+                 path: Optional[str] = None):
+        self.capacity = float(daily_units)
+        self.rate = self.capacity / 86400  # units per second
+        self.floors = {'interactive': 0.0, 'background': background_reserve * self.capacity}
+        self.degrade_below = degrade_below * self.capacity
+        self.path = path
+        # This process's copy of the bucket; with a path it is reloaded inside every transaction
+        self.tokens = self.capacity
+        self.closed_until = 0.0  # set by exhaust(): no refill before this time
+        self.spent = 0
+        self.rejected = {lane: 0 for lane in LANES}  # per process
+        self._updated = time.time()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            # One connection shared by all Flask worker threads; access is serialized by _lock
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('PRAGMA busy_timeout=10000')  # other processes may be writing
+            self._conn.executescript(self.SCHEMA)
+
+    def _refilled(self, tokens: float, updated: float, closed_until: float, now: float) -> Tuple[float, float]:
+        """(tokens, closed_until) at time now"""
+        if closed_until:
+            if now < closed_until:
+                return tokens, closed_until
+            return self.capacity, 0.0  # YouTube's daily reset refills the whole budget
+        return min(self.capacity, tokens + max(0.0, now - updated) * self.rate), 0.0
+
+    def _read_locked(self):
+        """Load the shared bucket into this process's copy (no-op in memory or when the file fails)"""
+        if self._conn is None:
+            return
+        try:
+            row = self._conn.execute('SELECT tokens, updated, closed_until, spent FROM quota WHERE id = 1').fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading shared YouTube quota: {e}")
+            return
+        if row is not None:
+            self.tokens, self._updated, self.closed_until, self.spent = row
+
+    @contextmanager
+    def _bucket(self):
+        """Refill, then let the caller change the bucket; shared buckets are saved in the same transaction"""
+        with self._lock:
+            shared = False
+            if self._conn is not None:
+                try:
+                    # IMMEDIATE takes the write lock up front, so other workers wait for this change
+                    self._conn.execute('BEGIN IMMEDIATE')
+                    shared = True
+                except sqlite3.Error as e:
+                    print(f"Error locking shared YouTube quota: {e}")
+            if shared:
+                self._read_locked()
+            now = time.time()
+            self.tokens, self.closed_until = self._refilled(self.tokens, self._updated, self.closed_until, now)
+            self._updated = now
+            try:
+                yield
+            finally:
+                if shared:
+                    try:
+                        self._conn.execute(
+                            'INSERT OR REPLACE INTO quota (id, tokens, updated, closed_until, spent) '
+                            'VALUES (1, ?, ?, ?, ?)',
+                            (self.tokens, self._updated, self.closed_until, self.spent)
+                        )
+                        self._conn.execute('COMMIT')
+                    except sqlite3.Error as e:
+                        print(f"Error saving shared YouTube quota: {e}")
+                        if self._conn.in_transaction:
+                            self._conn.execute('ROLLBACK')
+
+    def acquire(self, cost: int, lane: str = 'interactive'):
+        """Take cost units for a request in this lane or raise QuotaExceededError"""
+        with self._bucket():
+            allowed = self.tokens - cost >= self.floors[lane]
+            if allowed:
+                self.tokens -= cost
+                self.spent += cost
+            else:
+                self.rejected[lane] += 1
+                tokens = self.tokens
+        if not allowed:
+            raise QuotaExceededError(f"YouTube quota too low for {lane} requests ({int(tokens)} units left)")
+
+    def refund(self, cost: int):
+        """Give back units taken for a request that was never sent"""
+        with self._bucket():
+            self.tokens = min(self.capacity, self.tokens + cost)
+            self.spent -= cost
+
+    def exhaust(self):
+        """YouTube said quotaExceeded: trust it over our own accounting until its next daily reset"""
+        with self._bucket():
+            self.tokens = 0.0
+            self.closed_until = next_quota_reset(self._updated)
+
+    def _current(self) -> Tuple[float, float]:
+        """(tokens, closed_until) now, without writing the shared bucket"""
+        with self._lock:
+            self._read_locked()
+            return self._refilled(self.tokens, self._updated, self.closed_until, time.time())
+
+    def remaining(self) -> float:
+        return self._current()[0]
+
+    @property
+    def degraded(self) -> bool:
+        return self.remaining() < self.degrade_below
+
+    def snapshot(self) -> Dict:
+        remaining, closed_until = self._current()
+        return {
+            'remaining_units': int(remaining),
+            'daily_units': int(self.capacity),
+            'refill_units_per_hour': round(self.rate * 3600, 1),
+            'searches_left': int(remaining // SEARCH_COST),
+            'degraded': remaining < self.degrade_below,
+            'closed_until': datetime.fromtimestamp(closed_until, timezone.utc).isoformat() if closed_until else None,
+            'shared': self._conn is not None,
+            'spent_units': self.spent,
+            'rejected': dict(self.rejected)
+        }
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
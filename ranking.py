@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Local re-ranking of YouTube candidates for the Mood Music App
+
+Each mood gets a profile built from its preference model (see
+preference_model.py): decayed like-minus-dislike weights per channel and
+per (hashed) title token, where older feedback counts less. Candidates are
+scored in one vectorized pass:
+
+    score = prior * YouTube position
+          + channel * tanh(channel affinity)
+          + title * tanh(title-token overlap with liked/disliked titles)
+          - dislike * (disliked under other moods)
+
+and the top k are returned. Without numpy, YouTube's order is kept.
+"""
+
+import re
+import time
+import zlib
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from cache import TTLCache
+from preference_model import PreferenceModel
+
+try:
+    import numpy as np
+except ImportError:  # ranking is optional
+    np = None
+
+DEFAULT_WEIGHTS = {'prior': 1.0, 'channel': 1.0, 'title': 0.75, 'dislike': 2.0}
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+TITLE_STOP_WORDS = {
+    'the', 'a', 'an', 'and', 'of', 'to', 'in', 'on', 'for', 'with', 'by', 'from', 'is', 'my', 'your',
+    'official', 'video', 'music', 'song', 'songs', 'lyrics', 'lyric', 'audio', 'hd', '4k', 'ft', 'feat',
+    'full', 'version', 'new', 'mv'
+}
+
+
+@lru_cache(maxsize=8192)
+def title_buckets(title: str, dims: int) -> Tuple[int, ...]:
+    """Hashed token ids of a video title (titles repeat across searches, so this is memoized)"""
+    tokens = {t for t in _TOKEN_PATTERN.findall(title.lower()) if len(t) > 1 and t not in TITLE_STOP_WORDS}
+    return tuple(sorted({zlib.crc32(t.encode('utf-8')) % dims for t in tokens}))
+
+
+class MoodProfile:
+    """Decayed feedback weights for one mood, read from its preference model"""
+
+    def __init__(self, entry: Dict, model: PreferenceModel, dims: int, now: Optional[float] = None):
+        now = now or time.time()
+        self.channels = model.affinities(entry, 'c', now)
+        self.tokens = np.zeros(dims)
+        for token, weight in model.affinities(entry, 't', now).items():
+            if token not in TITLE_STOP_WORDS:
+                self.tokens[zlib.crc32(token.encode('utf-8')) % dims] += weight
+
+    @property
+    def empty(self) -> bool:
+        return not self.channels and not self.tokens.any()
+
+
+class Ranker:
+    """Scores candidate videos against a mood profile and keeps the top k"""
+
+    def __init__(self, model: PreferenceModel, dims: int = 1024, weights: Optional[Dict[str, float]] = None,
+                 max_profiles: int = 4096):
+        self.model = model
+        self.dims = dims
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        # (version, profile) per key; bounded since keys are per user and mood
+        self._profiles = TTLCache(maxsize=max_profiles, ttl=3600)
+
+    @property
+    def enabled(self) -> bool:
+        return np is not None
+
+    def profile(self, key: Hashable, entry: Optional[Dict]) -> Optional[MoodProfile]:
+        """Cached profile for a key such as (user, mood), rebuilt when the mood gets new feedback
+        or at least hourly (for the decay)"""
+        if not entry:
+            return None
+        # An entry without a stored model is seeded afresh for each build, so it stays at -1
+        model = entry.get('model')
+        version = (model.get('n', 0) if model is not None else -1, int(time.time() // 3600))
+        cached = self._profiles.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        profile = MoodProfile(entry, self.model, self.dims)
+        self._profiles.set(key, (version, profile))
+        return profile
+
+    def score(self, candidates: List[Dict], profile: Optional[MoodProfile],
+              dislike_counts: Optional[Callable[[str], int]] = None):
+        """Vector of scores, one per candidate"""
+        n = len(candidates)
+        w = self.weights
+        scores = w['prior'] * (1.0 - np.arange(n) / n)
+
+        if profile is not None and not profile.empty:
+            channel = np.fromiter((profile.channels.get(c.get('channel'), 0.0) for c in candidates), float, n)
+            buckets = [title_buckets(c.get('title') or '', self.dims) for c in candidates]
+            lengths = np.fromiter((len(b) for b in buckets), int, n)
+            columns = np.fromiter((t for b in buckets for t in b), int, int(lengths.sum()))
+            rows = np.repeat(np.arange(n), lengths)
+            overlap = np.bincount(rows, weights=profile.tokens[columns], minlength=n) / np.sqrt(np.maximum(lengths, 1))
+            scores += w['channel'] * np.tanh(channel) + w['title'] * np.tanh(overlap)
+
+        if dislike_counts is not None:
+            disliked = np.fromiter((dislike_counts(c['video_id']) for c in candidates), float, n)
+            scores -= w['dislike'] * np.minimum(disliked, 3.0) / 3.0
+        return scores
+
+    def rank(self, candidates: List[Dict], k: int, mood: Optional[Hashable] = None, entry: Optional[Dict] = None,
+             dislike_counts: Optional[Callable[[str], int]] = None) -> List[Dict]:
+        """Top k candidates by score (ties keep YouTube's order); mood is the profile cache key"""
+        if not self.enabled or len(candidates) <= 1:
+            return candidates[:k]
+        profile = self.profile(mood, entry) if mood else None
+        scores = self.score(candidates, profile, dislike_counts)
+        order = np.argsort(-scores, kind='stable')[:k]
+        return [candidates[i] for i in order]
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Per-session candidate buffers for "more music" follow-ups
+
+After a search, the ranked candidates that were not shown are kept for the
+session and the next YouTube page is prefetched in the background, so a
+follow-up request is answered from memory.
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional
+
+from user_shards import DEFAULT_USER
+
+
+class SearchSession:
+    """Candidate buffer for the latest search of one browser tab / CLI run"""
+
+    def __init__(self, query: str, page_size: int, mood_normalized: Optional[str],
+                 shown: Iterable[str], candidates: List[Dict], next_page_token: Optional[str], filters=None,
+                 user_id: str = DEFAULT_USER):
+        self.query = query  # composed query (genre and industry included)
+        self.page_size = page_size
+        self.mood_normalized = mood_normalized
+        self.shown = set(shown)
+        self.buffer = deque(candidates)
+        self.next_page_token = next_page_token
+        self.filters = filters  # VideoFilters of the search, reapplied to prefetched pages
+        # Whose feedback filters and ranks the candidates; the shard is checked out on each use,
+        # since it may be evicted and reloaded while the session lives
+        self.user_id = user_id
+        self.prefetch: Optional[Future] = None
+        self.lock = threading.Lock()
+
+    def extend(self, candidates: List[Dict], next_page_token: Optional[str]):
+        with self.lock:
+            self.buffer.extend(c for c in candidates if c['video_id'] not in self.shown)
+            self.next_page_token = next_page_token
+
+    def take(self, count: int, skip) -> List[Dict]:
+        """Pop up to count unseen candidates, dropping those skip(video_id) rejects"""
+        videos = []
+        with self.lock:
+            while self.buffer and len(videos) < count:
+                video = self.buffer.popleft()
+                if video['video_id'] in self.shown or skip(video['video_id']):
+                    continue
+                self.shown.add(video['video_id'])
+                videos.append(video)
+        return videos
+
+    @property
+    def prefetching(self) -> bool:
+        return self.prefetch is not None and not self.prefetch.done()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Request coalescing ("single-flight") for the Mood Music App
+
+Concurrent calls with the same key share one execution: the first caller
+runs the function, the others wait for it and get the same result (or the
+same exception). Nothing is cached once the call has finished.
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Counters:
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+
+    def stats(self) -> Dict:
+        requests = self.calls + self.coalesced
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'coalesced_ratio': round(self.coalesced / requests, 4) if requests else 0.0
+        }
+
+
+class SingleFlight(_Counters):
+    """Thread-based single-flight group"""
+
+    def __init__(self):
+        super().__init__()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class AsyncSingleFlight(_Counters):
+    """asyncio single-flight group (one event loop)"""
+
+    def __init__(self):
+        super().__init__()
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield: a waiter being cancelled must not cancel the shared call
+            return await asyncio.shield(future)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        # Mark exceptions as retrieved even when nobody else was waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.calls += 1
+        try:
+            result = await fn(*args)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._calls[key]
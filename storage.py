@@ -0,0 +1,752 @@
+#!/usr/bin/env python3
+"""
+Preference storage backends for the Mood Music App
+
+The app keeps its learned state in a single preferences dict:
+    {'mood_history': [...], 'feedback_history': [...], 'refined_keywords': {...}}
+
+Backends:
+    json   - the original user_preferences.json file, rewritten on every save
+    sqlite - embedded SQLite database (WAL mode) with append-only history
+             tables and one upserted row per mood in refined_keywords
+    journal - JSON-lines event journal with batched fsync; a background
+              compactor folds closed segments into a refined_keywords snapshot
+
+Several server processes (e.g. gunicorn workers) may share one store. Each
+store has a lock file for read-modify-write cycles across processes, and
+refresh() pulls refined_keywords entries other processes saved since the
+last load or refresh into the in-memory dict.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Exclusive lock across processes (advisory lock on a file), re-entrant within a process"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+        self._pid = None
+
+    def _lock_file(self):
+        # Kept open between acquires; a forked child opens its own, since locks
+        # belong to the open file and would otherwise be shared with the parent
+        if self._file is None or self._pid != os.getpid():
+            self._file = open(self.path, 'a+')
+            self._pid = os.getpid()
+        return self._file
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                f = self._lock_file()
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                else:
+                    f.seek(0)
+                    while True:
+                        try:
+                            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            continue  # LK_LOCK gives up after 10 seconds
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        try:
+            if self._depth == 0:
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._lock.release()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _merge_refined(preferences: Dict, stored: Dict, skip: Iterable[str]) -> List[str]:
+    """Copy stored refined_keywords entries into preferences, except moods in skip.
+    Returns the moods whose entry changed"""
+    skip = set(skip)
+    refined = preferences['refined_keywords']
+    changed = []
+    for mood, data in stored.items():
+        if mood not in skip and refined.get(mood) != data:
+            refined[mood] = data
+            changed.append(mood)
+    return changed
+
+
+def empty_preferences() -> Dict:
+    """Return a fresh, empty preferences dict"""
+    return {
+        'mood_history': [],
+        'feedback_history': [],
+        'refined_keywords': {}
+    }
+
+
+class PreferenceStore:
+    """Base class for preference storage backends"""
+
+    # False for stores that only load a recent tail of the history lists, in
+    # which case the app should not grow those lists in memory either
+    retain_history = True
+    # Shared by every process using the store (set by backends that live on disk)
+    file_lock: Optional[FileLock] = None
+
+    def load(self) -> Dict:
+        """Load the full preferences dict"""
+        raise NotImplementedError
+
+    def record_mood(self, entry: Dict):
+        """Queue a mood_history entry for the next save"""
+
+    def record_feedback(self, entry: Dict):
+        """Queue a feedback_history entry for the next save"""
+
+    def save(self, preferences: Dict, dirty_moods: Optional[Iterable[str]] = None):
+        """Persist preferences. dirty_moods limits which refined_keywords entries are written"""
+        raise NotImplementedError
+
+    def iter_history(self, kind: str = 'feedback') -> Iterator[Dict]:
+        """Yield every saved 'feedback' or 'mood' history entry, oldest first"""
+        yield from self.load().get(f'{kind}_history', [])
+
+    @contextmanager
+    def locked(self):
+        """Hold the store's cross-process lock (for refresh, modify, save cycles)"""
+        if self.file_lock is None:
+            yield
+        else:
+            with self.file_lock:
+                yield
+
+    def refresh(self, preferences: Dict, skip: Iterable[str] = ()) -> List[str]:
+        """Pull refined_keywords entries saved by other processes into preferences, leaving
+        moods in skip (unsaved local changes) alone. Returns the moods that changed"""
+        return []
+
+    def close(self):
+        """Release any resources held by the store"""
+        if self.file_lock is not None:
+            self.file_lock.close()
+
+
+class JSONPreferenceStore(PreferenceStore):
+    """Original single-file JSON storage
+
+    The file is rewritten on every save, so a save first merges in whatever
+    other processes wrote since this one last read the file: their history
+    entries are kept and only the moods changed here are overwritten.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file_lock = FileLock(f"{path}.lock")
+        self._lock = threading.Lock()
+        self._pending_moods: List[Dict] = []
+        self._pending_feedback: List[Dict] = []
+        self._seen: Optional[Tuple] = None  # stat of the file as last read or written
+
+    def _stat(self) -> Optional[Tuple]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def load(self) -> Dict:
+        """Load user preferences from file"""
+        self._seen = self._stat()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    preferences = json.load(f)
+            except (OSError, ValueError):
+                return empty_preferences()
+            for key, value in empty_preferences().items():
+                preferences.setdefault(key, value)
+            return preferences
+        return empty_preferences()
+
+    def record_mood(self, entry: Dict):
+        """Remember a mood_history entry until the next save (to merge it into a newer file)"""
+        with self._lock:
+            self._pending_moods.append(entry)
+
+    def record_feedback(self, entry: Dict):
+        """Remember a feedback_history entry until the next save"""
+        with self._lock:
+            self._pending_feedback.append(entry)
+
+    def refresh(self, preferences: Dict, skip: Iterable[str] = ()) -> List[str]:
+        """Reload the file if another process rewrote it; unsaved history entries are kept"""
+        if self._stat() == self._seen:
+            return []
+        with self.file_lock:
+            if self._stat() == self._seen:
+                return []
+            stored = self.load()
+            with self._lock:
+                preferences['mood_history'] = stored['mood_history'] + self._pending_moods
+                preferences['feedback_history'] = stored['feedback_history'] + self._pending_feedback
+            return _merge_refined(preferences, stored['refined_keywords'], skip)
+
+    def save(self, preferences: Dict, dirty_moods: Optional[Iterable[str]] = None):
+        """Rewrite the whole file (atomically, so readers never see a partial file)"""
+        tmp_path = f"{self.path}.tmp"
+        with self.file_lock:
+            dirty_moods = preferences['refined_keywords'].keys() if dirty_moods is None else dirty_moods
+            self.refresh(preferences, skip=list(dirty_moods))
+            with self._lock:
+                with open(tmp_path, 'w') as f:
+                    json.dump(preferences, f, indent=2)
+                os.replace(tmp_path, self.path)
+                self._seen = self._stat()
+                self._pending_moods, self._pending_feedback = [], []
+
+
+class SQLitePreferenceStore(PreferenceStore):
+    """SQLite storage: append-only history tables and an upserted row per mood
+
+    Every save stamps the moods it writes with the next sequence number, so
+    other processes find the moods changed since their last look by seq.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS mood_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entry TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS feedback_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            mood_normalized TEXT,
+            entry TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_feedback_mood ON feedback_history (mood_normalized);
+        CREATE TABLE IF NOT EXISTS refined_keywords (
+            mood TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            seq INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file_lock = FileLock(f"{path}.lock")
+        self._lock = threading.Lock()
+        self._pending_moods: List[Dict] = []
+        self._pending_feedback: List[Dict] = []
+        self._seq = 0  # highest refined_keywords seq seen by load() / refresh()
+        self._data_version = None
+        # One connection shared by all Flask worker threads; access is serialized by _lock
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA busy_timeout=10000')  # other processes may be writing
+        self._conn.executescript(self.SCHEMA)
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(refined_keywords)')]
+        if 'seq' not in columns:
+            self._conn.execute('ALTER TABLE refined_keywords ADD COLUMN seq INTEGER NOT NULL DEFAULT 0')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_refined_seq ON refined_keywords (seq)')
+
+    def load(self) -> Dict:
+        """Load the full preferences dict from the database"""
+        preferences = empty_preferences()
+        with self._lock:
+            self._data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            for (entry,) in self._conn.execute('SELECT entry FROM mood_history ORDER BY id'):
+                preferences['mood_history'].append(json.loads(entry))
+            for (entry,) in self._conn.execute('SELECT entry FROM feedback_history ORDER BY id'):
+                preferences['feedback_history'].append(json.loads(entry))
+            for mood, data, seq in self._conn.execute('SELECT mood, data, seq FROM refined_keywords'):
+                preferences['refined_keywords'][mood] = json.loads(data)
+                self._seq = max(self._seq, seq)
+        return preferences
+
+    def refresh(self, preferences: Dict, skip: Iterable[str] = ()) -> List[str]:
+        """Read the moods saved with a newer seq; a no-op unless another connection committed"""
+        with self._lock:
+            # data_version only changes when a different connection commits
+            data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return []
+            self._data_version = data_version
+            rows = self._conn.execute(
+                'SELECT mood, data, seq FROM refined_keywords WHERE seq > ?', (self._seq,)
+            ).fetchall()
+        stored = {}
+        for mood, data, seq in rows:
+            stored[mood] = json.loads(data)
+            self._seq = max(self._seq, seq)
+        return _merge_refined(preferences, stored, skip)
+
+    def record_mood(self, entry: Dict):
+        """Queue a mood_history entry for the next save"""
+        with self._lock:
+            self._pending_moods.append(entry)
+
+    def record_feedback(self, entry: Dict):
+        """Queue a feedback_history entry for the next save"""
+        with self._lock:
+            self._pending_feedback.append(entry)
+
+    def save(self, preferences: Dict, dirty_moods: Optional[Iterable[str]] = None):
+        """Insert queued history entries and upsert changed moods in one transaction"""
+        refined = preferences.get('refined_keywords', {})
+        moods = refined.keys() if dirty_moods is None else dirty_moods
+        rows = [(mood, json.dumps(refined[mood])) for mood in list(moods) if mood in refined]
+
+        with self._lock:
+            pending_moods, self._pending_moods = self._pending_moods, []
+            pending_feedback, self._pending_feedback = self._pending_feedback, []
+            try:
+                # IMMEDIATE takes the write lock up front, so concurrent writers wait in busy_timeout
+                # instead of failing when they upgrade from a read
+                self._conn.execute('BEGIN IMMEDIATE')
+                seq = self._conn.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM refined_keywords').fetchone()[0]
+                self._conn.executemany(
+                    'INSERT INTO mood_history (entry) VALUES (?)',
+                    [(json.dumps(e),) for e in pending_moods]
+                )
+                self._conn.executemany(
+                    'INSERT INTO feedback_history (mood_normalized, entry) VALUES (?, ?)',
+                    [(e.get('mood_normalized'), json.dumps(e)) for e in pending_feedback]
+                )
+                self._conn.executemany(
+                    'INSERT INTO refined_keywords (mood, data, seq) VALUES (?, ?, ?) '
+                    'ON CONFLICT(mood) DO UPDATE SET data = excluded.data, seq = excluded.seq',
+                    [(mood, data, seq) for mood, data in rows]
+                )
+                self._conn.execute('COMMIT')
+            except sqlite3.Error:
+                self._conn.execute('ROLLBACK')
+                # Keep the queued entries so the next save retries them
+                self._pending_moods = pending_moods + self._pending_moods
+                self._pending_feedback = pending_feedback + self._pending_feedback
+                raise
+
+    def iter_history(self, kind: str = 'feedback', batch_size: int = 1000) -> Iterator[Dict]:
+        """Stream history rows in id order without loading the whole table"""
+        table = 'feedback_history' if kind == 'feedback' else 'mood_history'
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f'SELECT id, entry FROM {table} WHERE id > ? ORDER BY id LIMIT ?', (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for last_id, entry in rows:
+                yield json.loads(entry)
+
+    def is_empty(self) -> bool:
+        """True if nothing has been stored yet"""
+        with self._lock:
+            for table in ('mood_history', 'feedback_history', 'refined_keywords'):
+                if self._conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone():
+                    return False
+        return True
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO meta (key, value) VALUES (?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                (key, value)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        self.file_lock.close()
+
+
+class JournalPreferenceStore(PreferenceStore):
+    """Append-only JSON-lines journal with periodic compaction
+
+    Every mood, feedback and refined_keywords change is one line in the
+    current segment (journal-NNNNNN.jsonl). Writes are fsync'd in batches.
+    Segments are rotated once they grow past segment_bytes; the compactor
+    folds closed segments into snapshot.json and moves them to archive/.
+    Startup loads the snapshot plus the live segments only.
+
+    Processes sharing the directory append whole lines under the lock file
+    and follow each other's rotations; refresh() reads the journal from
+    where this process last stopped.
+    """
+
+    retain_history = False
+    SEGMENT_PATTERN = re.compile(r'^journal-(\d{6})\.jsonl$')
+
+    def __init__(self, directory: str, segment_bytes: int = 1024 * 1024, fsync_every: int = 32,
+                 fsync_interval: float = 1.0, compact_interval: float = 60.0, start_compactor: bool = True):
+        self.directory = directory
+        self.archive_dir = os.path.join(directory, 'archive')
+        self.snapshot_path = os.path.join(directory, 'snapshot.json')
+        self.segment_bytes = segment_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_interval = compact_interval
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+        self.file_lock = FileLock(os.path.join(directory, 'journal.lock'))
+        self._lock = threading.Lock()  # guards the current segment file
+        self._compact_lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._read_position = (0, 0)  # (segment, byte offset) up to which events have been read
+
+        segments = self._segment_numbers(self.directory)
+        self._segment = segments[-1] if segments else self._read_snapshot()['segment'] + 1
+        self._file = open(self._segment_path(self._segment), 'a', encoding='utf-8')
+
+        self._stop = threading.Event()
+        self._compactor = None
+        if start_compactor:
+            self._compactor = threading.Thread(target=self._compactor_loop, name='journal-compactor', daemon=True)
+            self._compactor.start()
+
+    def _segment_path(self, number: int, directory: Optional[str] = None) -> str:
+        return os.path.join(directory or self.directory, f'journal-{number:06d}.jsonl')
+
+    def _segment_numbers(self, directory: str) -> List[int]:
+        numbers = []
+        for name in os.listdir(directory):
+            match = self.SEGMENT_PATTERN.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _read_snapshot(self) -> Dict:
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'segment': 0, 'refined_keywords': {}}
+
+    @staticmethod
+    def _read_events(path: str) -> Iterator[Dict]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # Torn write after a crash; another process may have appended after it
+                        continue
+        except OSError:
+            return
+
+    def _locate_segment(self, number: int) -> Optional[str]:
+        """Path of a live or archived segment, None if it does not exist (yet)"""
+        for directory in (self.directory, self.archive_dir):
+            path = self._segment_path(number, directory)
+            if os.path.exists(path):
+                return path
+        return None
+
+    @staticmethod
+    def _read_events_from(path: str, offset: int) -> Tuple[List[Dict], int]:
+        """Complete lines after offset and the offset after the last of them"""
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except OSError:
+            return [], offset
+        end = data.rfind(b'\n') + 1
+        events = []
+        for line in data[:end].splitlines():
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue  # torn write left by a crashed process
+        return events, offset + end
+
+    @staticmethod
+    def _apply(preferences: Dict, event: Dict, with_history: bool = True):
+        kind = event.get('t')
+        if kind == 'kw':
+            preferences['refined_keywords'][event['m']] = event['d']
+        elif with_history and kind == 'mood':
+            preferences['mood_history'].append(event['e'])
+        elif with_history and kind == 'feedback':
+            preferences['feedback_history'].append(event['e'])
+
+    def load(self) -> Dict:
+        """Load the snapshot and replay the journal tail on top of it"""
+        with self.file_lock:
+            snapshot = self._read_snapshot()
+            preferences = empty_preferences()
+            preferences['refined_keywords'] = snapshot['refined_keywords']
+            self._read_position = (snapshot['segment'] + 1, 0)
+            for number in self._segment_numbers(self.directory):
+                if number > snapshot['segment']:
+                    events, offset = self._read_events_from(self._segment_path(number), 0)
+                    for event in events:
+                        self._apply(preferences, event)
+                    self._read_position = (number, offset)
+        return preferences
+
+    def refresh(self, preferences: Dict, skip: Iterable[str] = ()) -> List[str]:
+        """Apply the refined_keywords events appended since the last load or refresh"""
+        number, offset = self._read_position
+        path = self._locate_segment(number)
+        if (path is None or os.path.getsize(path) == offset) and self._locate_segment(number + 1) is None:
+            return []
+        stored = {}
+        with self.file_lock:
+            number, offset = self._read_position
+            while True:
+                path = self._locate_segment(number)
+                if path is not None:
+                    events, offset = self._read_events_from(path, offset)
+                    for event in events:
+                        if event.get('t') == 'kw':
+                            stored[event['m']] = event['d']
+                if self._locate_segment(number + 1) is None:
+                    break
+                number, offset = number + 1, 0
+            self._read_position = (number, offset)
+        return _merge_refined(preferences, stored, skip)
+
+    def iter_history(self, kind: str = 'feedback') -> Iterator[Dict]:
+        """Yield every recorded 'feedback' or 'mood' entry, archived segments included"""
+        locations = [(n, self.archive_dir) for n in self._segment_numbers(self.archive_dir)]
+        locations += [(n, self.directory) for n in self._segment_numbers(self.directory)]
+        for number, directory in sorted(locations):
+            for event in self._read_events(self._segment_path(number, directory)):
+                if event.get('t') == kind:
+                    yield event['e']
+
+    def _append_locked(self, event: Dict):
+        self._file.write(json.dumps(event) + '\n')
+        self._unsynced += 1
+
+    def _follow_locked(self):
+        """Move on to the newest segment if another process rotated past ours (file lock held)"""
+        newest = self._segment
+        while os.path.exists(self._segment_path(newest + 1)):
+            newest += 1
+        if newest != self._segment:
+            self._sync_locked(force=True)
+            self._file.close()
+            self._segment = newest
+            self._file = open(self._segment_path(self._segment), 'a', encoding='utf-8')
+
+    def _sync_locked(self, force: bool = False):
+        self._file.flush()
+        if not self._unsynced:
+            return
+        if force or self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def _rotate_locked(self):
+        self._sync_locked(force=True)
+        self._file.close()
+        self._segment += 1
+        self._file = open(self._segment_path(self._segment), 'a', encoding='utf-8')
+
+    def _append_events(self, events: List[Dict]):
+        """Append whole lines (written out before the lock is released) and sync per the fsync policy"""
+        with self.file_lock, self._lock:
+            self._follow_locked()
+            for event in events:
+                self._append_locked(event)
+            self._sync_locked()
+            if self._file.tell() >= self.segment_bytes:
+                self._rotate_locked()
+
+    def record_mood(self, entry: Dict):
+        """Append a mood_history event"""
+        self._append_events([{'t': 'mood', 'e': entry}])
+
+    def record_feedback(self, entry: Dict):
+        """Append a feedback_history event"""
+        self._append_events([{'t': 'feedback', 'e': entry}])
+
+    def save(self, preferences: Dict, dirty_moods: Optional[Iterable[str]] = None):
+        """Append the changed refined_keywords entries and flush the journal"""
+        refined = preferences.get('refined_keywords', {})
+        moods = refined.keys() if dirty_moods is None else dirty_moods
+        events = [{'t': 'kw', 'm': mood, 'd': refined[mood]} for mood in list(moods) if mood in refined]
+        self._append_events(events)
+
+    def compact(self, force: bool = False) -> int:
+        """Fold closed segments into the snapshot and archive them. Returns segments folded"""
+        with self._compact_lock, self.file_lock:
+            with self._lock:
+                self._follow_locked()
+                if force:
+                    self._rotate_locked()
+                current = self._segment
+            snapshot = self._read_snapshot()
+            closed = [n for n in self._segment_numbers(self.directory) if snapshot['segment'] < n < current]
+            if not closed:
+                return 0
+
+            folded = {'mood_history': [], 'feedback_history': [], 'refined_keywords': snapshot['refined_keywords']}
+            for number in closed:
+                for event in self._read_events(self._segment_path(number)):
+                    self._apply(folded, event, with_history=False)
+
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'segment': closed[-1], 'refined_keywords': folded['refined_keywords']}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+
+            for number in closed:
+                os.replace(self._segment_path(number), self._segment_path(number, self.archive_dir))
+            return len(closed)
+
+    def _compactor_loop(self):
+        last_compaction = time.monotonic()
+        while not self._stop.wait(self.fsync_interval):
+            with self._lock:
+                self._sync_locked(force=True)
+            if time.monotonic() - last_compaction >= self.compact_interval:
+                last_compaction = time.monotonic()
+                try:
+                    self.compact()
+                except OSError as e:
+                    print(f"Journal compaction failed: {e}")
+
+    def is_empty(self) -> bool:
+        """True if nothing has been journaled yet"""
+        if os.path.exists(self.snapshot_path) or self._segment_numbers(self.archive_dir):
+            return False
+        return all(os.path.getsize(self._segment_path(n)) == 0 for n in self._segment_numbers(self.directory))
+
+    def close(self):
+        self._stop.set()
+        if self._compactor:
+            self._compactor.join()
+        with self._lock:
+            self._sync_locked(force=True)
+            self._file.close()
+        self.file_lock.close()
+
+
+def migrate_json_to_journal(json_path: str, store: JournalPreferenceStore) -> bool:
+    """One-time import of an existing preferences JSON file into a journal directory"""
+    if not os.path.exists(json_path) or not store.is_empty():
+        return False
+
+    preferences = JSONPreferenceStore(json_path).load()
+    for entry in preferences['mood_history']:
+        store.record_mood(entry)
+    for entry in preferences['feedback_history']:
+        store.record_feedback(entry)
+    store.save(preferences)
+    store.compact(force=True)
+    return True
+
+
+def migrate_json_to_sqlite(json_path: str, store: SQLitePreferenceStore) -> bool:
+    """One-time import of an existing preferences JSON file into a SQLite store.
+
+    Returns True if data was migrated. The JSON file is left untouched.
+    """
+    if store.get_meta('migrated_from') or not os.path.exists(json_path) or not store.is_empty():
+        return False
+
+    preferences = JSONPreferenceStore(json_path).load()
+    for entry in preferences['mood_history']:
+        store.record_mood(entry)
+    for entry in preferences['feedback_history']:
+        store.record_feedback(entry)
+    store.save(preferences)
+    store.set_meta('migrated_from', os.path.abspath(json_path))
+    return True
+
+
+def create_preference_store(json_path: str = 'user_preferences.json', use_env_paths: bool = True) -> PreferenceStore:
+    """Create the store selected by PREFERENCES_BACKEND (json, sqlite or journal).
+    With use_env_paths=False the database / journal location is always derived from json_path
+    (per-user stores must not share PREFERENCES_DB or PREFERENCES_JOURNAL_DIR)."""
+    backend = os.getenv('PREFERENCES_BACKEND', 'json').lower()
+    base_path = os.path.splitext(json_path)[0]
+
+    if backend == 'sqlite':
+        db_path = os.getenv('PREFERENCES_DB', base_path + '.db') if use_env_paths else base_path + '.db'
+        store = SQLitePreferenceStore(db_path)
+        if migrate_json_to_sqlite(json_path, store):
+            print(f"Migrated {json_path} into {db_path}")
+        return store
+
+    if backend == 'journal':
+        directory = os.getenv('PREFERENCES_JOURNAL_DIR', base_path + '_journal') if use_env_paths else base_path + '_journal'
+        store = JournalPreferenceStore(
+            directory,
+            fsync_every=int(os.getenv('JOURNAL_FSYNC_EVERY', '32')),
+            compact_interval=float(os.getenv('JOURNAL_COMPACT_INTERVAL', '60'))
+        )
+        if migrate_json_to_journal(json_path, store):
+            print(f"Migrated {json_path} into {directory}")
+        return store
+
+    return JSONPreferenceStore(json_path)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print("Usage: python storage.py migrate [preferences.json] [preferences.db]")
+        sys.exit(1)
+
+    source = sys.argv[2] if len(sys.argv) > 2 else 'user_preferences.json'
+    target = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(source)[0] + '.db'
+    if migrate_json_to_sqlite(source, SQLitePreferenceStore(target)):
+        print(f"Migrated {source} into {target}")
+    else:
+        print(f"Nothing to migrate ({target} already populated or {source} missing)")
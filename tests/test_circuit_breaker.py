@@ -0,0 +1,34 @@
+"""Half-open probes in circuit_breaker.py"""
+
+from circuit_breaker import CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_only_one_probe_at_a_time():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_released_probe_lets_the_next_call_probe():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_release_after_a_verdict_is_a_no_op():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    breaker.record_success()
+    breaker.release()
+    assert breaker.state == CLOSED and breaker.allow()
@@ -0,0 +1,34 @@
+"""Near-duplicate lookups in interpretation_cache.py"""
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from interpretation_cache import InterpretationCache  # noqa: E402
+
+MOTIVATED = {'mood_label': 'energetic', 'search_query': 'high energy motivational music'}
+
+
+@pytest.fixture
+def cache():
+    # A low threshold, so only the word checks stand between near spellings
+    cache = InterpretationCache(path=None, threshold=0.5)
+    cache.put('motivated', MOTIVATED)
+    cache.put('sad and lonely', {'mood_label': 'sad', 'search_query': 'sad emotional melancholic music'})
+    return cache
+
+
+@pytest.mark.parametrize('description', ['unmotivated', 'not motivated', 'motivation'])
+def test_negated_or_different_words_are_misses(cache, description):
+    assert cache.get(description) is None
+    assert cache.stats()['recent_similarity_scores'][-1]['score'] >= 0.5
+
+
+@pytest.mark.parametrize('description', ['lonely and sad', 'feeling so motivated', 'Motivated!'])
+def test_same_words_are_hits(cache, description):
+    assert cache.get(description) is not None
+
+
+def test_stats_hold_no_descriptions(cache):
+    cache.get('unmotivated')
+    assert 'unmotivated' not in repr(cache.stats())
@@ -0,0 +1,66 @@
+"""Golden labels for the rule-based interpreter (mood_rules.py)"""
+
+import pytest
+
+import mood_rules
+
+# Descriptions the old substring interpreter labelled correctly must keep their label
+GOLDEN = {
+    "feeling happy": 'happy',
+    "I am so sad and lonely": 'sad',
+    "not happy, not sad, nor neutral": 'neutral',
+    "pumped up for my workout": 'energetic',
+    "need to study and focus": 'focused',
+    "romantic dinner with my love": 'romantic',
+    "angry and frustrated": 'angry',
+    "nostalgic for old classic songs": 'nostalgic',
+    "feeling chill and relaxed": 'relaxed',
+    "I'm not sad": 'neutral',
+    "don't feel happy": 'neutral',
+    "heartbroken after a breakup": 'sad',
+    "calm and peaceful meditation": 'relaxed',
+    "excited and celebrating": 'happy',
+    "I feel neither happy nor sad": 'neutral',
+    "working late, need lo-fi": 'focused',
+    "mixed feelings": 'neutral',
+    "upset but motivated": 'sad',
+    "feeling down": 'sad',
+    "I can't relax, so angry": 'angry',
+    "Feeling HAPPY!!!": 'happy',
+    "just vibing": 'neutral',
+}
+
+# Where the engine deliberately disagrees with the old interpreter
+CHANGED = {
+    # Keywords match whole words only
+    "I'm on a crusade": 'neutral',
+    "bold and brave": 'neutral',
+    # ...so "unhappy" is not "happy", and "working" / "studying" no longer also count as "work" / "study",
+    # which used to win ties for focused (most of the labels bench_mood_rules.py --changes lists)
+    "unhappy": 'sad',
+    "working through a breakup": 'sad',
+    "studying, feeling lonely": 'sad',
+    # "no", "never" and "cannot" negate too
+    "never happy": 'neutral',
+    "no love today": 'neutral',
+    "I cannot relax, just sad": 'sad',
+    # A negation covers the next few words of its clause only
+    "not sad but happy": 'happy',
+    "no, I am happy": 'happy',
+    "I’m not sad": 'neutral',
+}
+
+
+@pytest.mark.parametrize('description, label', list(GOLDEN.items()) + list(CHANGED.items()))
+def test_label(description, label):
+    assert mood_rules.interpret(description)['mood_label'] == label
+
+
+def test_query_and_interpretation_follow_the_label():
+    result = mood_rules.interpret("not happy")
+    assert result == {
+        'mood_label': 'neutral',
+        'search_query': mood_rules.MOOD_QUERIES['neutral'],
+        'interpretation': "Ambiguous or neutral mood detected - suggesting ambient music"
+    }
+    assert mood_rules.interpret("so happy")['interpretation'] == "Detected happy mood from your description"
@@ -0,0 +1,56 @@
+"""Shared YouTube quota bucket (quota.py)"""
+
+import pytest
+
+import quota
+from quota import QuotaExceededError, QuotaScheduler, next_quota_reset
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1700000000.0]
+    monkeypatch.setattr(quota.time, 'time', lambda: now[0])
+    return now
+
+
+def test_workers_share_one_bucket(tmp_path, clock):
+    path = str(tmp_path / 'quota.db')
+    first = QuotaScheduler(daily_units=300, path=path)
+    second = QuotaScheduler(daily_units=300, path=path)
+    first.acquire(100)
+    second.acquire(100)
+    first.acquire(100)
+    with pytest.raises(QuotaExceededError):
+        second.acquire(100)
+    assert int(first.remaining()) == 0
+    assert first.snapshot()['spent_units'] == 300
+
+
+def test_bucket_survives_restart(tmp_path, clock):
+    path = str(tmp_path / 'quota.db')
+    QuotaScheduler(daily_units=1000, path=path).acquire(100)
+    assert int(QuotaScheduler(daily_units=1000, path=path).remaining()) == 900
+
+
+def test_quota_exceeded_stays_closed_until_pacific_midnight(tmp_path, clock):
+    path = str(tmp_path / 'quota.db')
+    scheduler = QuotaScheduler(daily_units=10000, path=path)
+    scheduler.exhaust()
+    reset = next_quota_reset(clock[0])
+
+    clock[0] = reset - 60
+    assert scheduler.remaining() == 0
+    with pytest.raises(QuotaExceededError):
+        QuotaScheduler(daily_units=10000, path=path).acquire(100)
+
+    clock[0] = reset + 1
+    assert scheduler.remaining() == 10000
+    scheduler.acquire(100)
+    assert scheduler.snapshot()['closed_until'] is None
+
+
+def test_in_memory_bucket_refills_continuously(clock):
+    scheduler = QuotaScheduler(daily_units=8640)
+    scheduler.acquire(100)
+    clock[0] += 1000  # 0.1 units per second
+    assert scheduler.remaining() == pytest.approx(8640)
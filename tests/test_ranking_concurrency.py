@@ -0,0 +1,84 @@
+"""Searches ranking against a mood while feedback for it is being learned"""
+
+import sys
+import random
+import threading
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from preference_model import PreferenceModel  # noqa: E402
+from ranking import Ranker  # noqa: E402
+from storage import SQLitePreferenceStore  # noqa: E402
+from user_shards import UserShard  # noqa: E402
+
+WORDS = ['lofi', 'chill', 'beats', 'study', 'piano', 'rain', 'night', 'jazz', 'acoustic', 'cover', 'live', 'remix']
+
+
+def open_shard(tmp_path):
+    # Feedback keeps adding and pruning title tokens while searches read the table
+    model = PreferenceModel(max_tokens=500)
+    store = SQLitePreferenceStore(str(tmp_path / 'prefs.db'))
+    return UserShard('test', store, str(tmp_path / 'preference_index.json'), model)
+
+
+def card(rnd, i):
+    return {'video_id': f'v{i}', 'title': ' '.join(rnd.sample(WORDS, 4)) + f' {i}', 'channel': f'c{i % 7}'}
+
+
+def test_search_and_feedback_run_together(tmp_path):
+    shard = open_shard(tmp_path)
+    ranker = Ranker(shard.preference_model)
+    shard.refine_keywords('rainy night', 'like', 'rainy night piano', 'v0', 'rain piano', 'c0')
+    errors = []
+    done = threading.Event()
+
+    def feedback():
+        rnd = random.Random(1)
+        try:
+            for i in range(300):
+                title = ' '.join(f'{rnd.choice(WORDS)}{rnd.randrange(100)}' for _ in range(30))
+                shard.refine_keywords('rainy night', rnd.choice(['like', 'dislike']), f'query {i % 5}',
+                                      f'v{i}', title, f'c{i}')
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def search():
+        rnd = random.Random(2)
+        candidates = [card(rnd, i) for i in range(50)]
+        try:
+            while not done.is_set():
+                ranker.rank(candidates, 5, ('test', 'rainy night'), shard.entry('rainy night'),
+                            lambda video_id: shard.preference_index.anywhere('disliked', video_id))
+                shard.learned_query('rainy night')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=feedback)] + [threading.Thread(target=search) for _ in range(3)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)  # switch threads often enough to interleave with the model updates
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    shard.close()
+    assert errors == []
+
+
+def test_search_does_not_write_the_entry(tmp_path):
+    shard = open_shard(tmp_path)
+    entry = shard.refined_entry('late drive')
+    entry['successful_queries'].append('night drive synthwave')
+    entry['liked_videos'].append({'video_id': 'v1', 'title': 'synthwave night drive', 'channel': 'c1'})
+    ranked = Ranker(shard.preference_model).rank([card(random.Random(3), i) for i in range(10)], 5,
+                                                 ('test', 'late drive'), entry)
+    assert len(ranked) == 5
+    shard.learned_query('late drive')
+    assert 'model' not in entry
+    shard.close()
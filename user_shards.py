@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Per-user preference shards for the Mood Music App
+
+Every user (an opaque ID chosen by the client) gets their own preferences
+dict, liked/disliked index, dislike filter and preference store, loaded on
+first use. A bounded LRU keeps the most recently used shards in memory;
+evicted shards are saved and closed, and reloaded from disk when needed.
+
+Requests without a user ID use the "default" shard, which is stored in the
+original single-user files (user_preferences.json, preference_index.json)
+and never evicted, so the CLI and existing installs keep their history.
+
+Feedback is applied in a transaction: under the shard's lock and the
+store's cross-process lock, changes saved by other server processes are
+pulled in first and the result is saved before the locks are released.
+Shards also poll their store for such changes when checked out.
+
+The liked/disliked index sidecar is only written when a shard is flushed or
+closed (shutdown, eviction): it can always be rebuilt from refined_keywords,
+so a click only pays for saving the moods it changed.
+"""
+
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from bloom import ScalableBloomFilter
+from metrics import StageMetrics, timed
+from preference_index import PreferenceIndex
+from preference_model import PreferenceModel
+from singleflight import SingleFlight
+from storage import PreferenceStore
+
+DEFAULT_USER = 'default'
+
+_USER_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def valid_user_id(user_id) -> bool:
+    return isinstance(user_id, str) and bool(_USER_ID_PATTERN.match(user_id))
+
+
+def user_directory(root: str, user_id: str) -> str:
+    """Directory holding one user's files (hashed, so IDs never reach the file system)"""
+    return os.path.join(root, hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:24])
+
+
+class UserShard:
+    """One user's learned state and its persistence"""
+
+    def __init__(self, user_id: str, store: PreferenceStore, index_path: Optional[str],
+                 preference_model: PreferenceModel, dislike_filter_capacity: Optional[int] = None,
+                 refresh_interval: float = 1.0, metrics: Optional[StageMetrics] = None):
+        self.user_id = user_id
+        self.store = store
+        self.metrics = metrics or StageMetrics()  # saves are timed as the 'save_preferences' stage
+        self.preference_model = preference_model
+        self.refresh_interval = refresh_interval
+        self._refreshed_at = time.monotonic()
+        self._dirty_moods = set()  # refined_keywords entries changed since the last save
+        self.preferences = store.load()
+        # O(1) liked/disliked video lookups, mirrored from refined_keywords
+        self.preference_index = PreferenceIndex(index_path)
+        self._dirty_moods.update(self.preference_index.load(self.preferences['refined_keywords']))
+        # Feedback and saves of one user are serialized; different users never wait for each other
+        self.lock = threading.RLock()
+        # Optional cross-mood dislike filter: a video disliked under any mood is hidden everywhere
+        self.dislike_filter_capacity = dislike_filter_capacity
+        self.dislike_filter = None
+        if dislike_filter_capacity is not None:
+            if self.preference_index.loaded_from_sidecar:
+                self.dislike_filter = ScalableBloomFilter(dislike_filter_capacity)
+                self.dislike_filter.update(self.preference_index.totals['disliked'])
+            else:
+                self.rebuild_dislike_filter()
+
+    @timed('save_preferences')
+    def save(self):
+        """Save preferences (only new history and changed moods for incremental stores)"""
+        with self.lock, self.store.locked():
+            dirty_moods, self._dirty_moods = self._dirty_moods, set()
+            self.store.save(self.preferences, dirty_moods=dirty_moods)
+
+    def save_index(self):
+        """Write the preference index sidecar (a full rewrite, so not done on every save)"""
+        with self.lock:
+            self.preference_index.save(self.preferences['refined_keywords'])
+
+    def refresh(self) -> List[str]:
+        """Pull in moods other processes saved and re-index them. Returns the changed moods"""
+        with self.lock:
+            changed = self.store.refresh(self.preferences, skip=self._dirty_moods)
+            for mood in changed:
+                entry = self.preferences['refined_keywords'][mood]
+                self.preference_index.replace(mood, entry)
+                if self.dislike_filter is not None:
+                    self.dislike_filter.update(v['video_id'] for v in entry.get('disliked_videos', [])
+                                               if v.get('video_id'))
+            self._refreshed_at = time.monotonic()
+            return changed
+
+    def poll(self):
+        """refresh() if the last one is more than refresh_interval seconds old"""
+        if time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Error refreshing preferences: {e}")
+
+    @contextmanager
+    def transaction(self):
+        """Read-modify-write of this user's state, exclusive across threads and processes:
+        other processes' changes are pulled in first and the result is saved on exit"""
+        with self.lock, self.store.locked():
+            self.refresh()
+            yield
+            self.save()
+
+    def record_mood(self, mood_entry: Dict):
+        """Append an entry to the mood history"""
+        with self.lock:
+            if self.store.retain_history:
+                self.preferences['mood_history'].append(mood_entry)
+            self.store.record_mood(mood_entry)
+
+    def refine_keywords(self, mood_description: str, feedback: str, query: str, video_id: str = None,
+                        video_title: str = None, video_channel: str = None):
+        """Refine keywords based on user feedback (saved before returning)"""
+        mood_normalized = mood_description.lower().strip()
+        with self.transaction():
+            entry = self.refined_entry(mood_normalized)
+
+            # Store detailed feedback for learning
+            feedback_entry = {
+                'mood': mood_description,
+                'mood_normalized': mood_normalized,
+                'feedback': feedback,
+                'query': query,
+                'video_id': video_id,
+                'video_title': video_title,
+                'video_channel': video_channel,
+                'timestamp': datetime.now().isoformat()
+            }
+            if self.store.retain_history:
+                self.preferences['feedback_history'].append(feedback_entry)
+            self.store.record_feedback(feedback_entry)
+            self._dirty_moods.add(mood_normalized)
+
+            # Learn from feedback
+            self.preference_model.update(entry, feedback, query, video_channel, video_title)
+            if feedback == 'like':
+                if query not in entry['successful_queries']:
+                    entry['successful_queries'].append(query)
+                if self.preference_index.add(mood_normalized, 'liked', video_id):
+                    entry['liked_videos'].append({
+                        'video_id': video_id,
+                        'title': video_title,
+                        'channel': video_channel,
+                        'timestamp': datetime.now().isoformat()
+                    })
+            elif feedback == 'dislike':
+                if self.dislike_filter is not None and video_id:
+                    self.dislike_filter.add(video_id)
+                if self.preference_index.add(mood_normalized, 'disliked', video_id):
+                    entry['disliked_videos'].append({
+                        'video_id': video_id,
+                        'title': video_title,
+                        'channel': video_channel,
+                        'timestamp': datetime.now().isoformat()
+                    })
+
+    def refined_entry(self, mood_normalized: str) -> Dict:
+        """The refined_keywords entry for a mood, created on first use"""
+        if mood_normalized not in self.preferences['refined_keywords']:
+            self.preferences['refined_keywords'][mood_normalized] = {
+                'liked_keywords': [],
+                'disliked_keywords': [],
+                'successful_queries': [],
+                'liked_videos': [],
+                'disliked_videos': []
+            }
+        return self.preferences['refined_keywords'][mood_normalized]
+
+    def entry(self, mood_normalized: Optional[str]) -> Optional[Dict]:
+        """The refined_keywords entry for a mood, or None"""
+        return self.preferences['refined_keywords'].get(mood_normalized) if mood_normalized else None
+
+    def rebuild_dislike_filter(self) -> int:
+        """Rebuild the dislike filter by streaming feedback_history
+
+        Dislikes found in the history but missing from refined_keywords are
+        restored there too, so the exact confirm check agrees with the filter.
+        Returns the number of restored dislikes.
+        """
+        bloom = ScalableBloomFilter(self.dislike_filter_capacity or 10000)
+        bloom.update(self.preference_index.totals['disliked'])
+        restored = 0
+        for entry in self.store.iter_history('feedback'):
+            video_id = entry.get('video_id')
+            mood_normalized = entry.get('mood_normalized') or entry.get('mood', '').lower().strip()
+            if entry.get('feedback') != 'dislike' or not video_id or not mood_normalized:
+                continue
+            bloom.add(video_id)
+            if self.preference_index.add(mood_normalized, 'disliked', video_id):
+                self.refined_entry(mood_normalized)['disliked_videos'].append({
+                    'video_id': video_id,
+                    'title': entry.get('video_title'),
+                    'channel': entry.get('video_channel'),
+                    'timestamp': entry.get('timestamp')
+                })
+                self._dirty_moods.add(mood_normalized)
+                restored += 1
+        self.dislike_filter = bloom
+        return restored
+
+    def globally_disliked(self, video_id: str) -> bool:
+        """Disliked under any of this user's moods (bloom check, confirmed by the exact index)"""
+        return (self.dislike_filter is not None and video_id in self.dislike_filter
+                and self.preference_index.anywhere('disliked', video_id) > 0)
+
+    def learned_query(self, mood_description: str) -> Optional[Dict[str, str]]:
+        """Reuse a query that earned a like for this exact mood, picked by Thompson
+        sampling on its decayed likes/dislikes; None means look for a fresh query"""
+        mood_normalized = mood_description.lower().strip()
+        entry = self.entry(mood_normalized)
+        if entry is not None:
+            query = self.preference_model.choose_query(entry)
+            if query:
+                return {
+                    'mood_label': mood_normalized,
+                    'search_query': query,
+                    'interpretation': mood_description
+                }
+        return None
+
+    def close(self):
+        self.save_index()
+        self.store.close()
+
+
+class ShardManager:
+    """Lazily loaded UserShards with LRU eviction of idle ones"""
+
+    def __init__(self, open_shard: Callable[[str], UserShard], max_hot: int = 128,
+                 pinned: Iterable[str] = (DEFAULT_USER,)):
+        self.open_shard = open_shard
+        self.max_hot = max_hot
+        self.pinned = set(pinned)
+        self._shards: "OrderedDict[str, UserShard]" = OrderedDict()
+        self._in_use: Dict[str, int] = {}
+        self._retiring: Dict[str, threading.Event] = {}  # evicted shards still being saved
+        self._lock = threading.Lock()
+        self._loading = SingleFlight()  # concurrent first requests of one user load it once
+        self.loads = 0
+        self.evictions = 0
+
+    def _cached(self, user_id: str) -> Optional[UserShard]:
+        with self._lock:
+            shard = self._shards.get(user_id)
+            if shard is not None:
+                self._shards.move_to_end(user_id)
+            return shard
+
+    def _load(self, user_id: str) -> UserShard:
+        shard = self._cached(user_id)
+        if shard is not None:
+            return shard
+        with self._lock:
+            retiring = self._retiring.get(user_id)
+        if retiring is not None:
+            # Reload only after the evicted copy has been written out
+            retiring.wait()
+        shard = self.open_shard(user_id)
+        with self._lock:
+            self._shards[user_id] = shard
+            self.loads += 1
+            evicted = self._evict_locked()
+        for old in evicted:
+            self._retire(old)
+        return shard
+
+    def _evict_locked(self) -> List[UserShard]:
+        """Drop least recently used shards that are neither pinned nor in use, down to max_hot"""
+        evicted = []
+        for user_id in list(self._shards):
+            if len(self._shards) <= self.max_hot:
+                break
+            if user_id in self.pinned or self._in_use.get(user_id):
+                continue
+            evicted.append(self._shards.pop(user_id))
+            self._retiring[user_id] = threading.Event()
+            self.evictions += 1
+        return evicted
+
+    def _retire(self, shard: UserShard):
+        try:
+            shard.save()
+            shard.close()
+        except Exception as e:
+            print(f"Error saving preferences of evicted user: {e}")
+        finally:
+            with self._lock:
+                event = self._retiring.pop(shard.user_id, None)
+            if event is not None:
+                event.set()
+
+    def get(self, user_id: str = DEFAULT_USER) -> UserShard:
+        """The user's shard, loading it if needed. Prefer checkout() for anything that writes"""
+        shard = self._cached(user_id)
+        if shard is not None:
+            return shard
+        return self._loading.do(user_id, self._load, user_id)
+
+    def acquire(self, user_id: str = DEFAULT_USER) -> UserShard:
+        """get() and mark the shard in use so it is not evicted until release().
+        The shard picks up changes other processes saved (at most every refresh_interval)"""
+        with self._lock:
+            self._in_use[user_id] = self._in_use.get(user_id, 0) + 1
+        try:
+            shard = self.get(user_id)
+        except BaseException:
+            self.release(user_id)
+            raise
+        shard.poll()
+        return shard
+
+    def release(self, user_id: str):
+        with self._lock:
+            count = self._in_use.get(user_id, 0) - 1
+            if count > 0:
+                self._in_use[user_id] = count
+            else:
+                self._in_use.pop(user_id, None)
+            evicted = self._evict_locked()
+        for old in evicted:
+            self._retire(old)
+
+    @contextmanager
+    def checkout(self, user_id: str = DEFAULT_USER):
+        shard = self.acquire(user_id)
+        try:
+            yield shard
+        finally:
+            self.release(user_id)
+
+    def hot(self) -> List[UserShard]:
+        with self._lock:
+            return list(self._shards.values())
+
+    def flush(self):
+        """Save every loaded shard and its index sidecar"""
+        for shard in self.hot():
+            shard.save()
+            shard.save_index()
+
+    def close(self):
+        with self._lock:
+            shards, self._shards = list(self._shards.values()), OrderedDict()
+        for shard in shards:
+            self._retire(shard)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'hot': len(self._shards),
+                'max_hot': self.max_hot,
+                'in_use': len(self._in_use),
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
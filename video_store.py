@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Persistent video metadata store for the Mood Music App
+
+Video cards (title, url, thumbnail, channel) are built once from search.list
+items and kept in an SQLite database keyed by video ID, together with the
+videos.list details (duration, statistics) and, per composed query, the IDs
+of its first results page. The web app and the CLI share the file, so a
+video seen by either is stored once, and a query searched before can be
+shown from the store when YouTube cannot be reached.
+"""
+
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+
+def video_card(item: Dict) -> Dict:
+    """The video dict shown to users, from one search.list item"""
+    video_id = item['id']['videoId']
+    snippet = item['snippet']
+    return {
+        'title': snippet['title'],
+        'video_id': video_id,
+        'url': f"https://www.youtube.com/watch?v={video_id}",
+        'thumbnail': snippet['thumbnails']['default']['url'],
+        'channel': snippet.get('channelTitle')
+    }
+
+
+class VideoStore:
+    """SQLite (WAL) table of video cards and details, plus the last results per query"""
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id TEXT PRIMARY KEY,
+            title TEXT,
+            thumbnail TEXT,
+            channel TEXT,
+            details TEXT,
+            details_at REAL,
+            seen_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS query_results (
+            query TEXT PRIMARY KEY,
+            video_ids TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        );
+    '''
+
+    def __init__(self, path: str = 'videos.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+
+    def _write(self, statements: List):
+        with self._lock:
+            try:
+                self._conn.execute('BEGIN')
+                for sql, rows in statements:
+                    self._conn.executemany(sql, rows)
+                self._conn.execute('COMMIT')
+            except sqlite3.Error:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    @staticmethod
+    def _card_rows(videos: Iterable[Dict], now: float) -> List:
+        return [(v['video_id'], v.get('title'), v.get('thumbnail'), v.get('channel'), now) for v in videos]
+
+    _UPSERT_CARD = (
+        'INSERT INTO videos (video_id, title, thumbnail, channel, seen_at) VALUES (?, ?, ?, ?, ?) '
+        'ON CONFLICT(video_id) DO UPDATE SET title = excluded.title, thumbnail = excluded.thumbnail, '
+        'channel = COALESCE(excluded.channel, videos.channel), seen_at = excluded.seen_at'
+    )
+
+    def put_many(self, videos: List[Dict]):
+        """Insert or refresh video cards"""
+        self._write([(self._UPSERT_CARD, self._card_rows(videos, time.time()))])
+
+    def put_results(self, query: str, videos: List[Dict]):
+        """Store the cards of a query's first results page and remember their order"""
+        now = time.time()
+        self._write([
+            (self._UPSERT_CARD, self._card_rows(videos, now)),
+            ('INSERT INTO query_results (query, video_ids, fetched_at) VALUES (?, ?, ?) '
+             'ON CONFLICT(query) DO UPDATE SET video_ids = excluded.video_ids, fetched_at = excluded.fetched_at',
+             [(query, json.dumps([v['video_id'] for v in videos]), now)])
+        ])
+
+    def put_details(self, details: Dict[str, Dict]):
+        """Store videos.list details ({} for videos YouTube did not return)"""
+        now = time.time()
+        self._write([(
+            'INSERT INTO videos (video_id, details, details_at, seen_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(video_id) DO UPDATE SET details = excluded.details, details_at = excluded.details_at',
+            [(video_id, json.dumps(d), now, now) for video_id, d in details.items()]
+        )])
+
+    def details(self, video_ids: List[str], max_age: Optional[float] = None) -> Dict[str, Dict]:
+        """Stored details newer than max_age seconds, by video ID"""
+        if not video_ids:
+            return {}
+        oldest = time.time() - max_age if max_age is not None else 0.0
+        marks = ','.join('?' * len(video_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT video_id, details FROM videos WHERE video_id IN ({marks}) '
+                f'AND details IS NOT NULL AND details_at >= ?', (*video_ids, oldest)
+            ).fetchall()
+        return {video_id: json.loads(details) for video_id, details in rows}
+
+    def get_many(self, video_ids: List[str]) -> Dict[str, Dict]:
+        """Full cards (details included) of the stored videos among video_ids"""
+        if not video_ids:
+            return {}
+        marks = ','.join('?' * len(video_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT video_id, title, thumbnail, channel, details FROM videos '
+                f'WHERE video_id IN ({marks}) AND title IS NOT NULL', tuple(video_ids)
+            ).fetchall()
+        cards = {}
+        for video_id, title, thumbnail, channel, details in rows:
+            card = {
+                'title': title,
+                'video_id': video_id,
+                'url': f"https://www.youtube.com/watch?v={video_id}",
+                'thumbnail': thumbnail,
+                'channel': channel
+            }
+            if details:
+                card.update(json.loads(details))
+            cards[video_id] = card
+        return cards
+
+    def get(self, video_id: str) -> Optional[Dict]:
+        return self.get_many([video_id]).get(video_id)
+
+    def results(self, query: str) -> List[Dict]:
+        """Cards last stored for a query, in YouTube's order"""
+        with self._lock:
+            row = self._conn.execute('SELECT video_ids FROM query_results WHERE query = ?', (query,)).fetchone()
+        if row is None:
+            return []
+        video_ids = json.loads(row[0])
+        cards = self.get_many(video_ids)
+        return [cards[video_id] for video_id in video_ids if video_id in cards]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            videos, detailed = self._conn.execute('SELECT COUNT(*), COUNT(details) FROM videos').fetchone()
+            queries = self._conn.execute('SELECT COUNT(*) FROM query_results').fetchone()[0]
+        return {'videos': videos, 'with_details': detailed, 'queries': queries}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()